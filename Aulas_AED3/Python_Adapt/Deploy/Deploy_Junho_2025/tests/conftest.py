@@ -0,0 +1,30 @@
+"""
+Shared fixtures. tpaeds3_2025_p derives its data folders from the home directory and opens
+its log file in the working directory when it is imported, so the tests import it once,
+with both pointing at a temporary folder.
+"""
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+MODULE_NAME = 'tpaeds3_2025_p'
+MODULE_PATH = Path(__file__).resolve().parent.parent / f'{MODULE_NAME}.py'
+
+
+@pytest.fixture(scope='session')
+def tp(tmp_path_factory):
+    if MODULE_NAME in sys.modules:
+        return sys.modules[MODULE_NAME]
+    home = tmp_path_factory.mktemp('home')
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('HOME', str(home))
+        mp.setenv('USERPROFILE', str(home))
+        mp.chdir(home)
+        spec = importlib.util.spec_from_file_location(MODULE_NAME, MODULE_PATH)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[MODULE_NAME] = module # Worker processes look the pool functions up by module name
+        spec.loader.exec_module(module)
+    return module
+
@@ -0,0 +1,361 @@
+"""Round trips of the registered codecs (Huffman, LZW, LZW+Huffman and the zlib/bz2/lzma baselines), and decoding of the older layouts."""
+import bz2
+import heapq
+import itertools
+import lzma
+import random
+import struct
+import zlib
+from collections import Counter
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def sample_bytes():
+    """Repetitive text with some noise, like the CSV files the codecs are used on."""
+    lines = [f"{i % 97};TRAFFIC SIGNAL;CLEAR;{i * 7919 % 1000};NO INJURY / DRIVE AWAY;{i % 24}\n" for i in range(3000)]
+    return ''.join(lines).encode() + bytes(range(256))
+
+
+def round_trip(tmp_path, compress, decompress, data, **options):
+    source, packed, restored = tmp_path / 'source.bin', tmp_path / 'packed.bin', tmp_path / 'restored.bin'
+    source.write_bytes(data)
+    compress(str(source), str(packed), **options)
+    decompress(str(packed), str(restored))
+    return packed.read_bytes(), restored.read_bytes()
+
+
+def tree_codes(data):
+    """Unrestricted Huffman codes {byte: (code, length)}, as written by the original .huff format."""
+    counter = itertools.count()
+    heap = [(count, next(counter), {byte: (0, 0)}) for byte, count in sorted(Counter(data).items())]
+    heapq.heapify(heap)
+    while len(heap) > 1:
+        count_a, _, codes_a = heapq.heappop(heap)
+        count_b, _, codes_b = heapq.heappop(heap)
+        merged = {byte: (code, length + 1) for byte, (code, length) in codes_a.items()}
+        merged.update({byte: (code | 1 << length, length + 1) for byte, (code, length) in codes_b.items()})
+        heapq.heappush(heap, (count_a + count_b, next(counter), merged))
+    return heap[0][2] # Each merge adds the bit above the existing ones, so the root bit is the most significant
+
+
+def original_huff(data):
+    codes = tree_codes(data)
+    bits = ''.join(format(codes[byte][0], f'0{codes[byte][1]}b') for byte in data)
+    padding = -len(bits) % 8
+    bits += '0' * padding
+    content = struct.pack('I', len(codes))
+    for byte, (code, length) in codes.items():
+        content += struct.pack('=BBI', byte, length, code)
+    content += struct.pack('I', len(data))
+    content += int(bits, 2).to_bytes(len(bits) // 8, 'big') + bytes((padding,))
+    return content, max(length for _, length in codes.values())
+
+
+def lzw_codes(data):
+    """Fixed-width LZW without CLEAR, as written before LZW3 (first free code 256)."""
+    dictionary = {bytes((i,)): i for i in range(256)}
+    codes, current = [], b''
+    for byte in data:
+        candidate = current + bytes((byte,))
+        if candidate in dictionary:
+            current = candidate
+        else:
+            codes.append(dictionary[current])
+            dictionary[candidate] = len(dictionary)
+            current = bytes((byte,))
+    codes.append(dictionary[current])
+    return codes
+
+
+def pack_fixed(codes, width):
+    bits = ''.join(format(code, f'0{width}b') for code in codes)
+    bits += '0' * (-len(bits) % 8)
+    return int(bits, 2).to_bytes(len(bits) // 8, 'big')
+
+
+@pytest.mark.parametrize('skewed', [False, True])
+def test_huffman_original_format_is_decoded(tp, tmp_path, sample_bytes, skewed):
+    if skewed: # Fibonacci frequencies give codes longer than HUFFMAN_MAX_CODE_LENGTH
+        fibonacci = [1, 1]
+        while len(fibonacci) < 22:
+            fibonacci.append(fibonacci[-1] + fibonacci[-2])
+        data = b''.join(bytes((65 + i,)) * count for i, count in enumerate(fibonacci))
+    else:
+        data = sample_bytes[:-256] # Without the single occurrences of every byte value
+    content, longest = original_huff(data)
+    assert (longest > tp.HUFFMAN_MAX_CODE_LENGTH) == skewed
+    packed, restored = tmp_path / 'original.huff', tmp_path / 'restored.bin'
+    packed.write_bytes(content)
+    tp.HuffmanProcessor.decompress_file(str(packed), str(restored))
+    assert restored.read_bytes() == data
+
+
+def bit_stream(codes, data):
+    bits = ''.join(format(codes[byte][0], f'0{codes[byte][1]}b') for byte in data)
+    total_bits = len(bits)
+    bits += '0' * (-total_bits % 8)
+    return int(bits, 2).to_bytes(len(bits) // 8, 'big'), total_bits
+
+
+@pytest.mark.parametrize('equal_lengths', [False, True])
+def test_lane_decoder_matches_the_sequential_decoder(tp, sample_bytes, monkeypatch, equal_lengths):
+    monkeypatch.setattr(tp, 'HUFFMAN_LANE_BLOCK_SIZE', 4096) # Several blocks
+    if equal_lengths: # Every code is 2 bits long, so the lanes never resynchronize
+        codes = {byte: (index, 2) for index, byte in enumerate(b'ACGT')}
+        data = bytes(random.Random(7).choice(b'ACGT') for _ in range(40000))
+    else:
+        data = sample_bytes[:-256]
+        codes = tree_codes(data)
+    stream, total_bits = bit_stream(codes, data)
+    processor = tp.HuffmanProcessor
+    assert processor.decode_lanes(stream, total_bits, len(data), processor.build_lane_tables(codes)) == data
+    assert processor.decode_bits(stream, total_bits, len(data), processor.build_decode_tables(codes)) == data
+
+
+def test_huffman_v2_round_trip(tp, tmp_path, sample_bytes):
+    packed, restored = round_trip(tmp_path, tp.HuffmanProcessor.compress_file, tp.HuffmanProcessor.decompress_file,
+                                  sample_bytes, streaming=False)
+    assert packed[:4] == tp.HuffmanProcessor.V2_MAGIC
+    assert len(packed) < len(sample_bytes)
+    assert restored == sample_bytes
+
+
+@pytest.mark.parametrize('data', [b'a', b'short file', bytes(5000)])
+def test_huffman_v2_small_and_single_symbol_inputs(tp, tmp_path, data):
+    _, restored = round_trip(tmp_path, tp.HuffmanProcessor.compress_file, tp.HuffmanProcessor.decompress_file,
+                             data, streaming=False)
+    assert restored == data
+
+
+def test_code_lengths_are_limited_and_canonical(tp):
+    fibonacci = [1, 1]
+    while len(fibonacci) < 30:
+        fibonacci.append(fibonacci[-1] + fibonacci[-2])
+    lengths = tp.HuffmanProcessor.build_code_lengths(dict(enumerate(fibonacci)))
+    assert max(lengths.values()) == tp.HUFFMAN_MAX_CODE_LENGTH
+    assert sum(2 ** -length for length in lengths.values()) == 1 # A complete prefix code
+    codes = tp.HuffmanProcessor.canonical_codes(lengths)
+    words = sorted(format(code, f'0{length}b') for code, length in codes.values())
+    assert not any(longer.startswith(shorter) for shorter, longer in zip(words, words[1:]))
+    with pytest.raises(ValueError):
+        tp.HuffmanProcessor.canonical_codes({0: 1, 1: 1, 2: 1})
+
+
+def test_pack_codes_matches_bit_by_bit_packing(tp):
+    generator = random.Random(13)
+    lengths = [generator.randint(1, 40) for _ in range(3000)]
+    codes = [generator.getrandbits(length) for length in lengths]
+    bits = '101' + ''.join(format(code, f'0{length}b') for code, length in zip(codes, lengths))
+    packed, carry, carry_bits = tp.HuffmanProcessor.pack_codes(np.array(codes, dtype=np.int64),
+                                                               np.array(lengths, dtype=np.int64), 0b101, 3)
+    full_bits = len(bits) - len(bits) % 8
+    assert packed == int(bits[:full_bits], 2).to_bytes(full_bits // 8, 'big')
+    assert (carry, carry_bits) == (int(bits[full_bits:] or '0', 2), len(bits) % 8)
+
+
+def test_huffman_v2_round_trip_across_encode_blocks(tp, tmp_path, sample_bytes, monkeypatch):
+    monkeypatch.setattr(tp, 'HUFFMAN_ENCODE_BLOCK_SIZE', 1000) # Codes straddle the block boundaries
+    _, restored = round_trip(tmp_path, tp.HuffmanProcessor.compress_file, tp.HuffmanProcessor.decompress_file,
+                             sample_bytes, streaming=False)
+    assert restored == sample_bytes
+
+
+def test_huffman_v3_round_trip(tp, tmp_path, sample_bytes, monkeypatch):
+    monkeypatch.setattr(tp, 'HUFFMAN_ENCODE_BLOCK_SIZE', 4096) # Several frames
+    packed, restored = round_trip(tmp_path, tp.HuffmanProcessor.compress_file, tp.HuffmanProcessor.decompress_file,
+                                  sample_bytes, streaming=True)
+    assert packed[:4] == tp.HuffmanProcessor.STREAM_MAGIC
+    assert restored == sample_bytes
+
+
+def test_huffman_v3_truncated_file_is_rejected(tp, tmp_path, sample_bytes, monkeypatch):
+    monkeypatch.setattr(tp, 'HUFFMAN_ENCODE_BLOCK_SIZE', 4096)
+    packed, _ = round_trip(tmp_path, tp.HuffmanProcessor.compress_file, tp.HuffmanProcessor.decompress_file,
+                           sample_bytes, streaming=True)
+    truncated = tmp_path / 'truncated.huff'
+    truncated.write_bytes(packed[:len(packed) // 2])
+    with pytest.raises(ValueError):
+        tp.HuffmanProcessor.decompress_file(str(truncated), str(tmp_path / 'out.bin'))
+
+
+def test_huffman_v3_read_range(tp, tmp_path, sample_bytes, monkeypatch):
+    monkeypatch.setattr(tp, 'HUFFMAN_ENCODE_BLOCK_SIZE', 4096)
+    round_trip(tmp_path, tp.HuffmanProcessor.compress_file, tp.HuffmanProcessor.decompress_file, sample_bytes, streaming=True)
+    packed_path = str(tmp_path / 'packed.bin')
+    for offset, length in ((0, 10), (4090, 20), (50000, 100000), (len(sample_bytes) + 5, 3)):
+        assert tp.HuffmanProcessor.read_range(packed_path, offset, length) == sample_bytes[offset:offset + length]
+
+
+def test_huffman_v3_frames_encoded_in_worker_processes(tp, tmp_path, sample_bytes, monkeypatch):
+    monkeypatch.setattr(tp, 'HUFFMAN_ENCODE_BLOCK_SIZE', 16384)
+    _, restored = round_trip(tmp_path, tp.HuffmanProcessor.compress_stream, tp.HuffmanProcessor.decompress_file,
+                             sample_bytes, workers=2)
+    assert restored == sample_bytes
+
+
+def test_run_ordered_keeps_the_input_order(tp):
+    arguments = [(value, 7) for value in range(40)]
+    expected = [divmod(*args) for args in arguments]
+    assert list(tp.run_ordered(divmod, arguments, 2)) == expected
+    assert list(tp.run_ordered(divmod, iter(arguments), 1)) == expected
+    # A function the pool cannot send to its workers is run in this process instead
+    assert list(tp.run_ordered(lambda a, b: divmod(a, b), arguments, 2)) == expected
+
+
+def test_lzw3_round_trip(tp, tmp_path, sample_bytes):
+    packed, restored = round_trip(tmp_path, tp.LZWProcessor.compress, tp.LZWProcessor.decompress, sample_bytes)
+    assert packed[:4] == tp.LZWProcessor.STREAM_MAGIC
+    assert len(packed) < len(sample_bytes)
+    assert restored == sample_bytes
+
+
+@pytest.mark.parametrize('data', [b'x', b'abababababababab', bytes(100000)])
+def test_lzw3_edge_cases(tp, tmp_path, data):
+    _, restored = round_trip(tmp_path, tp.LZWProcessor.compress, tp.LZWProcessor.decompress, data)
+    assert restored == data
+
+
+def test_lzw_original_format_is_decoded(tp, tmp_path, sample_bytes):
+    data = sample_bytes[:3000]
+    codes = lzw_codes(data)
+    packed, restored = tmp_path / 'original.lzw', tmp_path / 'restored.bin'
+    packed.write_bytes(len(codes).to_bytes(4, 'big') + bytes((12,)) + pack_fixed(codes, 12))
+    tp.LZWProcessor.decompress(str(packed), str(restored))
+    assert restored.read_bytes() == data
+
+
+def test_lzw3_frames(tp, tmp_path, sample_bytes):
+    packed, restored = round_trip(tmp_path, tp.LZWProcessor.compress_stream, tp.LZWProcessor.decompress, sample_bytes,
+                                  frame_size=10000)
+    assert packed[:4] == tp.LZWProcessor.STREAM_MAGIC
+    assert restored == sample_bytes
+
+
+def test_lzw3_truncated_file_leaves_no_output(tp, tmp_path, sample_bytes):
+    round_trip(tmp_path, tp.LZWProcessor.compress_stream, tp.LZWProcessor.decompress, sample_bytes, frame_size=10000)
+    truncated, output = tmp_path / 'truncated.lzw', tmp_path / 'out.bin'
+    truncated.write_bytes((tmp_path / 'packed.bin').read_bytes()[:-10]) # The first frames still decode
+    with pytest.raises(ValueError):
+        tp.LZWProcessor.decompress(str(truncated), str(output))
+    assert not output.exists()
+
+
+def test_lzw3_dictionary_resets(tp, tmp_path, sample_bytes):
+    # 9-bit codes fill the dictionary quickly, so the adaptive CLEAR path is exercised
+    _, restored = round_trip(tmp_path, tp.LZWProcessor.compress_stream, tp.LZWProcessor.decompress, sample_bytes,
+                             max_bits=9, frame_size=10000)
+    assert restored == sample_bytes
+
+
+class BoundedDecompressor:
+    """Wraps a stdlib decompressor and records the largest output of a single decompress call."""
+    def __init__(self, decompressor):
+        self.decompressor = decompressor
+        self.largest = 0
+
+    def decompress(self, data, max_length):
+        output = self.decompressor.decompress(data, max_length)
+        self.largest = max(self.largest, len(output))
+        return output
+
+    def __getattr__(self, name):
+        return getattr(self.decompressor, name)
+
+
+def test_codec_registry_lookup_and_detection(tp, tmp_path, sample_bytes):
+    assert set(tp.CODECS) >= {'Huffman', 'LZW', 'LZW+Huffman', 'zlib', 'bz2', 'lzma'}
+    assert tp.get_codec('LZW').extension == tp.LZW_COMPRESSED_EXTENSION
+    with pytest.raises(ValueError):
+        tp.get_codec('rar')
+
+    source = tmp_path / 'source.csv'
+    source.write_bytes(sample_bytes)
+    for name in tp.CODECS:
+        packed = tmp_path / f'packed{name}.bin' # The extension does not give the codec away
+        tp.get_codec(name).compress_stream(str(source), str(packed))
+        assert tp.detect_codec(str(packed)).name == name
+    renamed = tmp_path / f'plain{tp.BZ2_COMPRESSED_EXTENSION}'
+    renamed.write_bytes(sample_bytes)
+    assert tp.detect_codec(str(renamed)).name == 'bz2' # No magic bytes: falls back to the extension
+    assert tp.detect_codec(str(source)) is None
+
+
+@pytest.mark.parametrize('name', ['zlib', 'bz2', 'lzma'])
+def test_stdlib_codec_round_trip(tp, tmp_path, sample_bytes, monkeypatch, name):
+    monkeypatch.setattr(tp, 'CODEC_CHUNK_SIZE', 4096) # Several reads and writes
+    codec = tp.get_codec(name)
+    packed, restored = round_trip(tmp_path, codec.compress_stream, codec.decompress_stream, sample_bytes)
+    assert packed.startswith(codec.magic)
+    assert len(packed) < len(sample_bytes)
+    assert restored == sample_bytes
+
+
+STDLIB_DECOMPRESSORS = {'zlib': lambda: zlib.decompressobj(31), 'bz2': bz2.BZ2Decompressor, 'lzma': lzma.LZMADecompressor}
+
+
+@pytest.mark.parametrize('name', sorted(STDLIB_DECOMPRESSORS))
+def test_stdlib_decompression_output_is_bounded(tp, tmp_path, monkeypatch, name):
+    monkeypatch.setattr(tp, 'CODEC_CHUNK_SIZE', 1024)
+    decompressors = []
+
+    def bounded():
+        decompressors.append(BoundedDecompressor(STDLIB_DECOMPRESSORS[name]()))
+        return decompressors[-1]
+
+    data = bytes(2_000_000) # A few kilobytes once compressed
+    source, packed, restored = tmp_path / 'zeros.bin', tmp_path / 'zeros.packed', tmp_path / 'zeros.out'
+    source.write_bytes(data)
+    tp.get_codec(name).compress_stream(str(source), str(packed))
+    tp._stdlib_decompress(bounded, str(packed), str(restored))
+    assert restored.read_bytes() == data
+    assert 0 < decompressors[0].largest <= 1024
+
+
+@pytest.mark.parametrize('name', sorted(STDLIB_DECOMPRESSORS))
+@pytest.mark.parametrize('damage', [lambda packed: packed[:-20], lambda packed: packed + b'trailing data'],
+                         ids=['truncated', 'trailing'])
+def test_damaged_stdlib_stream_leaves_no_output(tp, tmp_path, sample_bytes, monkeypatch, name, damage):
+    monkeypatch.setattr(tp, 'CODEC_CHUNK_SIZE', 4096) # Some output is written before the damage is found
+    codec = tp.get_codec(name)
+    packed, _ = round_trip(tmp_path, codec.compress_stream, codec.decompress_stream, sample_bytes)
+    damaged, output = tmp_path / 'damaged.bin', tmp_path / 'out.bin'
+    damaged.write_bytes(damage(packed))
+    with pytest.raises(ValueError):
+        codec.decompress_stream(str(damaged), str(output))
+    assert not output.exists()
+
+
+def test_lzh1_round_trip(tp, tmp_path, sample_bytes):
+    packed, restored = round_trip(tmp_path, tp.LZWHuffmanProcessor.compress, tp.LZWHuffmanProcessor.decompress,
+                                  sample_bytes)
+    assert packed[:4] == tp.LZWHuffmanProcessor.STREAM_MAGIC
+    assert restored == sample_bytes
+    lzw_size = tp.LZWProcessor.compress(str(tmp_path / 'source.bin'), str(tmp_path / 'plain.lzw'))[1]
+    assert len(packed) < lzw_size
+
+
+@pytest.mark.parametrize('data', [b'x', bytes(range(256)) * 3, bytes(50000)])
+def test_lzh1_edge_cases(tp, tmp_path, data):
+    _, restored = round_trip(tmp_path, tp.LZWHuffmanProcessor.compress, tp.LZWHuffmanProcessor.decompress,
+                             data, max_bits=9)
+    assert restored == data
+
+
+def test_lzh1_rejects_other_formats(tp, tmp_path, sample_bytes):
+    round_trip(tmp_path, tp.LZWProcessor.compress, tp.LZWProcessor.decompress, sample_bytes)
+    with pytest.raises(ValueError):
+        tp.LZWHuffmanProcessor.decompress(str(tmp_path / 'packed.bin'), str(tmp_path / 'out.bin'))
+    assert not (tmp_path / 'out.bin').exists()
+
+
+def test_lzh1_truncated_file_leaves_no_output(tp, tmp_path, sample_bytes, monkeypatch):
+    monkeypatch.setattr(tp, 'LZW_STREAM_BLOCK_SIZE', 10000)
+    round_trip(tmp_path, tp.LZWHuffmanProcessor.compress, tp.LZWHuffmanProcessor.decompress, sample_bytes, streaming=True)
+    truncated, output = tmp_path / 'truncated.lzwh', tmp_path / 'out.bin'
+    truncated.write_bytes((tmp_path / 'packed.bin').read_bytes()[:-10]) # The first frames still decode
+    with pytest.raises(ValueError):
+        tp.LZWHuffmanProcessor.decompress(str(truncated), str(output))
+    assert not output.exists()
@@ -0,0 +1,264 @@
+"""Blowfish (BFS1) and hybrid AES-GCM + RSA (AGS1/AGB1) files: round trips and rejection of altered files."""
+import os
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+PASSWORD = 'correct horse battery staple'
+CHUNK_SIZE = 4096
+
+
+@pytest.fixture(scope='session')
+def rsa_keys(tmp_path_factory):
+    """(public, private) PEM paths of a fresh 2048-bit key pair."""
+    folder = tmp_path_factory.mktemp('keys')
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_path, private_path = folder / 'test_public.pem', folder / 'test_private.pem'
+    private_path.write_bytes(private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                                       serialization.NoEncryption()))
+    public_path.write_bytes(private_key.public_key().public_bytes(serialization.Encoding.PEM,
+                                                                  serialization.PublicFormat.SubjectPublicKeyInfo))
+    return str(public_path), str(private_path)
+
+
+@pytest.fixture
+def plaintext(tmp_path):
+    path = tmp_path / 'plain.bin'
+    path.write_bytes(os.urandom(3 * CHUNK_SIZE + 100)) # Four chunks, the last one short
+    return path
+
+
+@pytest.fixture
+def small_chunks(tp, monkeypatch):
+    monkeypatch.setattr(tp, 'BLOWFISH_CHUNK_SIZE', CHUNK_SIZE)
+
+
+def altered(path, content):
+    path.write_bytes(content)
+    return str(path)
+
+
+def assert_rejected(decrypt, input_path, output_path):
+    with pytest.raises(ValueError):
+        decrypt(input_path, str(output_path))
+    assert not output_path.exists()
+
+
+def bfs1_layout(tp, content):
+    """(header size, frame size) of a CTR+HMAC file encrypted with CHUNK_SIZE chunks."""
+    header_size = tp.Blowfish.STREAM_HEADER.size + tp.Blowfish.CHUNKED_HEADER.size
+    if content[4] & tp.Blowfish.SUBKEY_FLAG:
+        header_size += 16
+    return header_size, CHUNK_SIZE + tp.Blowfish.MAC_SIZE
+
+
+def ags1_layout(tp, content):
+    """(header size, frame size) of a hybrid file encrypted with CHUNK_SIZE chunks and a 2048-bit key."""
+    header_size = tp.CryptographyHandler.STREAM_HEADER.size + 256 + tp.CryptographyHandler.GCM_NONCE_SIZE
+    if content[:4] == tp.CryptographyHandler.BATCH_MAGIC:
+        header_size += tp.CryptographyHandler.FILE_SALT_SIZE
+    return header_size, CHUNK_SIZE + tp.CryptographyHandler.GCM_TAG_SIZE
+
+
+def variants(content, header_size, frame_size):
+    """Damaged copies of an encrypted file: every one must fail authentication."""
+    frames = [content[position:position + frame_size] for position in range(header_size, len(content), frame_size)]
+    header = content[:header_size]
+    flipped = bytearray(content)
+    flipped[header_size + frame_size + 10] ^= 0x01
+    flipped_header = bytearray(content)
+    flipped_header[header_size - 1] ^= 0x01
+    return {
+        'flipped ciphertext bit': bytes(flipped),
+        'flipped header bit': bytes(flipped_header),
+        'flipped tag bit': content[:-1] + bytes((content[-1] ^ 0x01,)),
+        'last chunk dropped': header + b''.join(frames[:-1]),
+        'cut inside a chunk': content[:-5],
+        'chunks swapped': header + frames[1] + frames[0] + b''.join(frames[2:]),
+        'chunk repeated': header + frames[0] + b''.join(frames[:-1]),
+        'only the header': header,
+    }
+
+
+@pytest.mark.parametrize('key, block, expected', [
+    ('0000000000000000', '0000000000000000', '4ef997456198dd78'),
+    ('ffffffffffffffff', 'ffffffffffffffff', '51866fd5b85ecb8a'),
+    ('3000000000000000', '1000000000000001', '7d856f9a613063f2'),
+]) # Eric Young's Blowfish test vectors
+def test_blowfish_block_engine_matches_reference_vectors(tp, key, block, expected):
+    cipher = tp.Blowfish(bytes.fromhex(key))
+    many = bytes.fromhex(block) * 5 # The vectorized path encrypts all blocks at once
+    assert cipher.encrypt_blocks(many) == bytes.fromhex(expected) * 5
+    assert cipher.decrypt_blocks(bytes.fromhex(expected) * 5) == many
+
+
+def test_blowfish_ctr_resumes_at_a_block_offset(tp):
+    cipher, counter, data = tp.Blowfish(b'0123456789abcdef'), os.urandom(8), os.urandom(8 * 20 + 3)
+    stream = cipher.crypt_ctr(data, counter)
+    assert stream[8 * 7:] == cipher.crypt_ctr(data[8 * 7:], counter, 7)
+    assert cipher.crypt_ctr(stream, counter) == data
+
+
+@pytest.mark.parametrize('mode', ['CTR+HMAC', 'CTR', 'CBC'])
+def test_blowfish_round_trip(tp, tmp_path, plaintext, small_chunks, mode):
+    encrypted, restored = tmp_path / 'plain.enc.bf', tmp_path / 'restored.bin'
+    tp.blowfish_encrypt_file(str(plaintext), str(encrypted), PASSWORD, mode)
+    assert encrypted.read_bytes()[:4] == tp.Blowfish.STREAM_MAGIC
+    tp.blowfish_decrypt_file(str(encrypted), str(restored), PASSWORD)
+    assert restored.read_bytes() == plaintext.read_bytes()
+
+
+def test_blowfish_batch_round_trip(tp, tmp_path, plaintext, small_chunks):
+    (tmp_path / 'empty.bin').write_bytes(b'')
+    pairs = [(str(plaintext), str(tmp_path / 'a.enc.bf')), (str(tmp_path / 'empty.bin'), str(tmp_path / 'b.enc.bf'))]
+    assert tp.blowfish_encrypt_files(pairs, PASSWORD) == 2
+    for source, encrypted in pairs:
+        tp.blowfish_decrypt_file(encrypted, str(tmp_path / 'restored.bin'), PASSWORD)
+        assert (tmp_path / 'restored.bin').read_bytes() == open(source, 'rb').read()
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_blowfish_altered_files_are_rejected(tp, tmp_path, plaintext, small_chunks, batch):
+    encrypted = tmp_path / 'plain.enc.bf'
+    if batch:
+        tp.blowfish_encrypt_files([(str(plaintext), str(encrypted))], PASSWORD)
+    else:
+        tp.blowfish_encrypt_file(str(plaintext), str(encrypted), PASSWORD)
+    content = encrypted.read_bytes()
+    decrypt = lambda source, output: tp.blowfish_decrypt_file(source, output, PASSWORD)
+    for name, damaged in variants(content, *bfs1_layout(tp, content)).items():
+        assert_rejected(decrypt, altered(tmp_path / f'{name}.enc.bf', damaged), tmp_path / 'restored.bin')
+    assert_rejected(lambda source, output: tp.blowfish_decrypt_file(source, output, 'wrong password'),
+                    str(encrypted), tmp_path / 'restored.bin')
+
+
+def test_blowfish_rejects_unknown_format(tp, tmp_path, plaintext):
+    with pytest.raises(ValueError, match='BFS1'):
+        tp.blowfish_decrypt_file(str(plaintext), str(tmp_path / 'restored.bin'), PASSWORD)
+    truncated = altered(tmp_path / 'truncated.enc.bf', tp.Blowfish.STREAM_MAGIC + bytes(10))
+    with pytest.raises(ValueError, match='BFS1'):
+        tp.blowfish_decrypt_file(truncated, str(tmp_path / 'restored.bin'), PASSWORD)
+
+
+def test_blowfish_chunks_encrypted_in_worker_processes(tp, tmp_path, plaintext, small_chunks, monkeypatch):
+    encrypted, restored = tmp_path / 'plain.enc.bf', tmp_path / 'restored.bin'
+    assert tp._blowfish_workers(2, str(plaintext)) == 1 # Below CRYPTO_PARALLEL_MIN_SIZE
+    monkeypatch.setattr(tp, 'CRYPTO_PARALLEL_MIN_SIZE', 0)
+    assert tp._blowfish_workers(2, str(plaintext)) == 2
+    tp.blowfish_encrypt_file(str(plaintext), str(encrypted), PASSWORD, workers=2)
+    tp.blowfish_decrypt_file(str(encrypted), str(restored), PASSWORD, workers=2)
+    assert restored.read_bytes() == plaintext.read_bytes()
+    tp.blowfish_decrypt_file(str(encrypted), str(restored), PASSWORD) # The same file in one process
+    assert restored.read_bytes() == plaintext.read_bytes()
+
+
+def test_key_cache_counts_hits_and_evicts_the_least_recently_used(tp):
+    cache, created = tp.KeyCache(2), []
+    make = lambda name: lambda: created.append(name) or name.upper()
+    assert cache.get_or_create('a', make('a')) == 'A'
+    assert cache.get_or_create('b', make('b')) == 'B'
+    assert cache.get_or_create('a', make('a')) == 'A' # Hit: 'a' becomes the most recently used
+    assert cache.get_or_create('c', make('c')) == 'C' # Evicts 'b'
+    assert cache.get_or_create('a', make('a')) == 'A'
+    assert cache.get_or_create('b', make('b')) == 'B'
+    assert created == ['a', 'b', 'c', 'b']
+    assert (cache.hits, cache.misses) == (2, 4)
+    assert list(cache._entries) == ['a', 'b']
+    cache.clear()
+    assert cache.get_or_create('a', make('a')) == 'A'
+    assert created[-1] == 'a' # Created again after clear
+
+
+def test_derived_keys_and_schedules_are_reused(tp, tmp_path, plaintext, small_chunks):
+    salt = os.urandom(16)
+    hits = tp.DERIVED_KEYS.hits
+    key = tp.derive_key_pbkdf2(PASSWORD.encode(), salt, dk_len=32)
+    assert tp.derive_key_pbkdf2(PASSWORD.encode(), salt, dk_len=32) == key
+    assert tp.DERIVED_KEYS.hits == hits + 1
+    assert tp.derive_key_pbkdf2(b'another password', salt, dk_len=32) != key
+    assert tp.Blowfish.for_key(key[:16]) is tp.Blowfish.for_key(key[:16])
+
+    # Files of one batch share the PBKDF2 salt, so decrypting the second one skips the KDF
+    pairs = [(str(plaintext), str(tmp_path / 'a.enc.bf')), (str(plaintext), str(tmp_path / 'b.enc.bf'))]
+    tp.blowfish_encrypt_files(pairs, PASSWORD)
+    tp.DERIVED_KEYS.clear()
+    misses = tp.DERIVED_KEYS.misses
+    for _, encrypted in pairs:
+        tp.blowfish_decrypt_file(encrypted, str(tmp_path / 'restored.bin'), PASSWORD)
+    assert tp.DERIVED_KEYS.misses == misses + 1
+
+
+def test_hybrid_round_trip(tp, tmp_path, plaintext, rsa_keys):
+    public_key, private_key = rsa_keys
+    encrypted, restored = tmp_path / 'plain.enc.aes_rsa', tmp_path / 'restored.bin'
+    tp.CryptographyHandler.hybrid_encrypt_file(str(plaintext), public_key, str(encrypted), chunk_size=CHUNK_SIZE)
+    assert encrypted.read_bytes()[:4] == tp.CryptographyHandler.STREAM_MAGIC
+    tp.CryptographyHandler.hybrid_decrypt_file(str(encrypted), private_key, str(restored))
+    assert restored.read_bytes() == plaintext.read_bytes()
+
+
+def test_hybrid_batch_round_trip(tp, tmp_path, plaintext, rsa_keys):
+    public_key, private_key = rsa_keys
+    (tmp_path / 'empty.bin').write_bytes(b'')
+    pairs = [(str(plaintext), str(tmp_path / 'a.enc.aes_rsa')), (str(tmp_path / 'empty.bin'), str(tmp_path / 'b.enc.aes_rsa'))]
+    assert tp.CryptographyHandler.hybrid_encrypt_files(pairs, public_key, chunk_size=CHUNK_SIZE) == 2
+    for source, encrypted in pairs:
+        assert open(encrypted, 'rb').read(4) == tp.CryptographyHandler.BATCH_MAGIC
+        tp.CryptographyHandler.hybrid_decrypt_file(encrypted, private_key, str(tmp_path / 'restored.bin'))
+        assert (tmp_path / 'restored.bin').read_bytes() == open(source, 'rb').read()
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_hybrid_altered_files_are_rejected(tp, tmp_path, plaintext, rsa_keys, batch):
+    public_key, private_key = rsa_keys
+    encrypted = tmp_path / 'plain.enc.aes_rsa'
+    if batch:
+        tp.CryptographyHandler.hybrid_encrypt_files([(str(plaintext), str(encrypted))], public_key, chunk_size=CHUNK_SIZE)
+    else:
+        tp.CryptographyHandler.hybrid_encrypt_file(str(plaintext), public_key, str(encrypted), chunk_size=CHUNK_SIZE)
+    content = encrypted.read_bytes()
+    decrypt = lambda source, output: tp.CryptographyHandler.hybrid_decrypt_file(source, private_key, output)
+    for name, damaged in variants(content, *ags1_layout(tp, content)).items():
+        assert_rejected(decrypt, altered(tmp_path / f'{name}.enc.aes_rsa', damaged), tmp_path / 'restored.bin')
+
+
+def test_hybrid_chunks_encrypted_in_worker_processes(tp, tmp_path, plaintext, rsa_keys):
+    public_key, private_key = rsa_keys
+    encrypted, restored = tmp_path / 'plain.enc.aes_rsa', tmp_path / 'restored.bin'
+    tp.CryptographyHandler.hybrid_encrypt_file(str(plaintext), public_key, str(encrypted), chunk_size=CHUNK_SIZE, workers=2)
+    tp.CryptographyHandler.hybrid_decrypt_file(str(encrypted), private_key, str(restored), workers=2)
+    assert restored.read_bytes() == plaintext.read_bytes()
+    tp.CryptographyHandler.hybrid_decrypt_file(str(encrypted), private_key, str(restored))
+    assert restored.read_bytes() == plaintext.read_bytes()
+
+
+def test_hybrid_batch_files_cannot_swap_salts(tp, tmp_path, plaintext, rsa_keys):
+    public_key, private_key = rsa_keys
+    pairs = [(str(plaintext), str(tmp_path / 'a.enc.aes_rsa')), (str(plaintext), str(tmp_path / 'b.enc.aes_rsa'))]
+    tp.CryptographyHandler.hybrid_encrypt_files(pairs, public_key, chunk_size=CHUNK_SIZE)
+    first, second = (open(encrypted, 'rb').read() for _, encrypted in pairs)
+    header_size, _ = ags1_layout(tp, first)
+    salt_start = header_size - tp.CryptographyHandler.FILE_SALT_SIZE
+    mixed = first[:salt_start] + second[salt_start:header_size] + first[header_size:]
+    assert_rejected(lambda source, output: tp.CryptographyHandler.hybrid_decrypt_file(source, private_key, output),
+                    altered(tmp_path / 'mixed.enc.aes_rsa', mixed), tmp_path / 'restored.bin')
+
+
+def test_rsa_keys_and_batch_master_keys_are_reused(tp, tmp_path, plaintext, rsa_keys):
+    public_key, private_key = rsa_keys
+    first = tp.CryptographyHandler.load_key(private_key, private=True)
+    assert tp.CryptographyHandler.load_key(private_key, private=True) is first
+    copy = tmp_path / 'copy_private.pem'
+    copy.write_bytes(open(private_key, 'rb').read())
+    loaded = tp.CryptographyHandler.load_key(str(copy), private=True)
+    os.utime(copy, ns=(0, 0)) # A changed file is parsed again
+    assert tp.CryptographyHandler.load_key(str(copy), private=True) is not loaded
+
+    # One RSA decryption for all the files of a batch
+    pairs = [(str(plaintext), str(tmp_path / f'{name}.enc.aes_rsa')) for name in 'abc']
+    tp.CryptographyHandler.hybrid_encrypt_files(pairs, public_key, chunk_size=CHUNK_SIZE)
+    misses, hits = tp.SESSION_KEYS.misses, tp.SESSION_KEYS.hits
+    for _, encrypted in pairs:
+        tp.CryptographyHandler.hybrid_decrypt_file(encrypted, private_key, str(tmp_path / 'restored.bin'))
+    assert (tp.SESSION_KEYS.misses, tp.SESSION_KEYS.hits) == (misses + 1, hits + 2)
@@ -0,0 +1,428 @@
+"""Storage layer of TrafficAccidentsDB: indexes, write path, journal, record codecs and scans."""
+import os
+import struct
+
+import pytest
+
+# (crash_date, crash_hour, injuries_total) of the sample records, IDs 1 to 5
+SAMPLES = [
+    ('2023-07-29', 13, 0.0),
+    ('2023-08-13', 0, 2.0),
+    ('2023-01-05', 18, 1.0),
+    ('2023-12-24', 13, 0.0),
+    ('2022-03-01', 7, 3.0),
+]
+
+
+def make_record(tp, crash_date, crash_hour, injuries_total, weather='CLEAR'):
+    row = [crash_date, 'TRAFFIC SIGNAL', weather, 'DAYLIGHT', 'TURNING', 'NOT DIVIDED',
+           'STRAIGHT AND LEVEL', 'DRY', 'NO DEFECTS', 'NO INJURY / DRIVE AWAY', 'Y',
+           '$501 - $1,500', 'UNABLE TO DETERMINE', '2', 'NO INDICATION OF INJURY',
+           str(injuries_total), '0.0', '0.0', '0.0', '0.0', '3.0', str(crash_hour), '7', '7']
+    return tp.DataObject(row_data=row)
+
+
+@pytest.fixture
+def db(tp, tmp_path):
+    database = tp.TrafficAccidentsDB(str(tmp_path / 'traffic_accidents.db'))
+    database.write_records([make_record(tp, *sample) for sample in SAMPLES])
+    return database
+
+
+def reopen(tp, db):
+    return tp.TrafficAccidentsDB(db.db_path)
+
+
+def test_read_record_by_id_uses_the_index(tp, db):
+    for record_id, (crash_date, _, _) in enumerate(SAMPLES, 1):
+        record = db.read_record_by_id(record_id)
+        assert record['id'] == record_id
+        assert db.decode_record(record['data_bytes']).crash_date == crash_date
+    assert db.id_index.read_header() == (len(SAMPLES), os.path.getsize(db.db_path))
+    assert db.read_record_by_id(len(SAMPLES) + 1) is None
+    with pytest.raises(ValueError):
+        db.read_record_by_id(0)
+
+
+def test_read_record_by_id_rebuilds_a_stale_index(tp, db):
+    offsets = [db.read_record_by_id(record_id)['start_offset'] for record_id in range(1, len(SAMPLES) + 1)]
+    # An index that claims to cover the file but points every ID at the wrong record
+    db.id_index.reset(os.path.getsize(db.db_path))
+    db.id_index.append([(record_id, offsets[record_id % len(SAMPLES)], True) for record_id in range(1, len(SAMPLES) + 1)],
+                       os.path.getsize(db.db_path))
+    assert db.read_record_by_id(3)['start_offset'] == offsets[2]
+
+    os.remove(db.index_path)
+    assert db.read_record_by_id(5)['start_offset'] == offsets[4]
+
+
+@pytest.fixture
+def large_db(tp, tmp_path):
+    """A database spanning several page checkpoints (PAGE_CHECKPOINT_INTERVAL records each)."""
+    database = tp.TrafficAccidentsDB(str(tmp_path / 'large.db'))
+    database.write_records([make_record(tp, '2023-05-01', record_id % 24, 0.0)
+                            for record_id in range(1, 2 * tp.PAGE_CHECKPOINT_INTERVAL + 45)])
+    return database
+
+
+def test_paginated_reads_seek_to_page_checkpoints(tp, large_db):
+    interval = tp.PAGE_CHECKPOINT_INTERVAL
+    total = 2 * interval + 44
+    everything = large_db.read_records_paginated()
+    assert [r['id'] for r in everything] == list(range(1, total + 1))
+
+    checkpoint_ordinal, checkpoint_offset = large_db.page_table.checkpoint_for(interval + 5)
+    assert (checkpoint_ordinal, checkpoint_offset) == (interval, everything[interval]['start_offset'])
+    for offset, limit in ((0, 20), (interval - 1, 3), (interval, 1), (2 * interval + 40, 20), (total - 1, 5)):
+        assert large_db.read_records_paginated(offset, limit) == everything[offset:offset + limit]
+    assert large_db.read_records_paginated(total, 10) == []
+
+
+def test_page_table_catches_up_and_is_rebuilt(tp, large_db):
+    interval = tp.PAGE_CHECKPOINT_INTERVAL
+    os.remove(large_db.page_table_path)
+    assert large_db.read_records_paginated(interval, 1)[0]['id'] == interval + 1
+
+    large_db.write_records([make_record(tp, '2024-01-01', 1, 0.0) for _ in range(interval)])
+    page = large_db.read_records_paginated(3 * interval + 10, 2)
+    assert [r['id'] for r in page] == [3 * interval + 11, 3 * interval + 12]
+    assert large_db.page_table.read_header()[0] == 3 * interval + 44
+
+
+def test_write_records_appends_one_batch(tp, db):
+    assert db.write_records([make_record(tp, '2024-01-0%d' % day, day, 0.0) for day in range(1, 4)]) == [6, 7, 8]
+    with db.transaction() as batch:
+        first = batch.add(make_record(tp, '2024-02-01', 1, 0.0))
+        second = batch.add(make_record(tp, '2024-02-02', 2, 0.0))
+    assert (first, second) == (9, 10)
+    assert db.get_last_id() == 10
+    assert reopen(tp, db).get_last_id() == 10
+    assert [r['id'] for r in db.read_records_paginated(5)] == [6, 7, 8, 9, 10]
+
+
+def test_rejected_record_writes_nothing(tp, db):
+    size_before = os.path.getsize(db.db_path)
+    invalid = make_record(tp, '2024-01-01', 5, 1.0)
+    invalid.crash_hour = 40
+    with pytest.raises(tp.DataValidationError):
+        db.write_records([make_record(tp, '2024-01-02', 6, 0.0), invalid])
+    assert db.get_last_id() == 5
+    assert os.path.getsize(db.db_path) == size_before
+    with pytest.raises(TypeError):
+        db.write_records([{'crash_date': '2024-01-01'}])
+
+
+def test_unfinished_append_is_undone_on_open(tp, db):
+    size_before = os.path.getsize(db.db_path)
+    # Crash after the journal entry and part of the appended record, before COMMIT
+    txid = db.wal.begin()
+    db.wal.log(txid, tp.WriteAheadLog.APPEND, size_before, struct.pack('I', 5))
+    with open(db.db_path, 'r+b') as f:
+        f.seek(0)
+        f.write(struct.pack('I', 6))
+        f.seek(0, os.SEEK_END)
+        f.write(b'\x06\x00\x00\x00\x01partial record')
+
+    recovered = reopen(tp, db)
+    assert os.path.getsize(recovered.db_path) == size_before
+    assert recovered.get_last_id() == 5
+    assert recovered.wal.size() == 0
+    assert recovered.write_record(make_record(tp, '2024-02-02', 9, 0.0)) == 6
+
+
+def test_committed_write_is_redone_on_open(tp, db):
+    record = db.read_record_by_id(2)
+    flag_offset = record['start_offset'] + 4
+    # Crash after COMMIT reached the journal but before the data file was written
+    txid = db.wal.begin()
+    db.wal.log(txid, tp.WriteAheadLog.WRITE, flag_offset, b'\x01\x00')
+    db.wal.log(txid, tp.WriteAheadLog.COMMIT)
+
+    recovered = reopen(tp, db)
+    assert recovered.read_record_by_id(2)['validation'] is False
+
+
+def test_unfinished_write_is_undone_on_open(tp, db):
+    record = db.read_record_by_id(3)
+    flag_offset = record['start_offset'] + 4
+    txid = db.wal.begin()
+    db.wal.log(txid, tp.WriteAheadLog.WRITE, flag_offset, b'\x01\x00')
+    with open(db.db_path, 'r+b') as f:
+        f.seek(flag_offset)
+        f.write(b'\x00')
+
+    recovered = reopen(tp, db)
+    assert recovered.read_record_by_id(3)['validation'] is True
+
+
+def test_torn_journal_tail_is_ignored(tp, db):
+    record = db.read_record_by_id(1)
+    txid = db.wal.begin()
+    db.wal.log(txid, tp.WriteAheadLog.WRITE, record['start_offset'] + 4, b'\x01\x00')
+    db.wal.log(txid, tp.WriteAheadLog.COMMIT)
+    intact = db.wal.read_entries()
+    with open(db.wal_path, 'ab') as f:
+        f.write(b'\xff' * 7) # Interrupted entry header
+
+    assert db.wal.read_entries() == intact
+    with open(db.wal_path, 'r+b') as f:
+        f.seek(-8, os.SEEK_END)
+        f.write(b'\xff') # Last byte of the COMMIT entry
+    assert db.wal.read_entries() == intact[:-1]
+
+
+def test_failed_transaction_is_rolled_back(tp, db):
+    size_before = os.path.getsize(db.db_path)
+    with pytest.raises(RuntimeError):
+        with db.transaction() as batch:
+            batch.add(make_record(tp, '2024-01-01', 5, 1.0))
+            raise RuntimeError("interrupted")
+
+    assert os.path.getsize(db.db_path) == size_before
+    assert db.get_last_id() == 5
+    assert db.read_record_by_id(6) is None
+    assert db.wal.read_entries()[-1][1] == tp.WriteAheadLog.ABORT
+    assert reopen(tp, db).get_last_id() == 5
+
+
+def fields_of(tp, data_object):
+    return {field: getattr(data_object, field) for field in tp.FIELDS}
+
+
+@pytest.mark.parametrize('weather', ['CLEAR', 'VOLCANIC ASH'])
+def test_binary_record_codec_round_trip(tp, weather):
+    record = make_record(tp, '2023-07-29', 13, 2.5, weather)
+    record.injuries_fatal = 1.25
+    encoded = record.to_bytes(tp.CODEC_BINARY)
+    assert encoded[0] == tp.BinaryRecordCodec.TAG_V1
+    assert len(encoded) < len(record.to_bytes(tp.CODEC_JSON))
+    assert fields_of(tp, tp.DataObject.from_bytes(encoded)) == fields_of(tp, record)
+    assert fields_of(tp, tp.DataObject.from_bytes(encoded, trusted=True)) == fields_of(tp, record)
+
+
+def test_binary_record_codec_rejects_corrupt_records(tp):
+    encoded = make_record(tp, '2023-07-29', 13, 0.0, 'VOLCANIC ASH').to_bytes(tp.CODEC_BINARY)
+    for corrupt in (encoded[:10], b'\x07' + encoded[1:], encoded[:-3]):
+        with pytest.raises(tp.DatabaseError):
+            tp.DataObject.from_bytes(corrupt)
+
+
+def test_json_records_keep_decoding(tp):
+    record = make_record(tp, '2023-07-29', 13, 0.0)
+    padded = record.to_bytes(tp.CODEC_JSON) + bytes(12) # Slot of a record updated in place
+    assert fields_of(tp, tp.DataObject.from_bytes(padded)) == fields_of(tp, record)
+
+
+def test_migrate_codec_keeps_ids_flags_and_values(tp, db):
+    db.invalidate_record(2, db.read_record_by_id(2)['start_offset'])
+    before = [(r['id'], r['validation'], fields_of(tp, db.decode_record(r['data_bytes'])))
+              for r in db.read_records_paginated()]
+    json_size = os.path.getsize(db.db_path)
+
+    assert db.migrate_codec(tp.CODEC_BINARY) == len(SAMPLES)
+    assert db.record_codec == tp.CODEC_BINARY
+    assert os.path.getsize(db.db_path) < json_size
+    assert all(r['data_bytes'][0] != ord('{') for r in db.read_records_paginated())
+    new_id = db.write_record(make_record(tp, '2024-01-01', 1, 0.0))
+    assert db.read_record_by_id(new_id)['data_bytes'][0] != ord('{')
+
+    assert db.migrate_codec(tp.CODEC_JSON) == len(SAMPLES) + 1
+    after = [(r['id'], r['validation'], fields_of(tp, db.decode_record(r['data_bytes'])))
+             for r in db.read_records_paginated()]
+    assert after[:len(SAMPLES)] == before
+    assert all(r['data_bytes'][0] == ord('{') for r in db.read_records_paginated())
+    with pytest.raises(ValueError):
+        db.migrate_codec('msgpack')
+
+
+def test_symbol_table_codes_persist(tp, tmp_path):
+    table_path = str(tmp_path / 'codes.sym')
+    symbols = tp.SymbolTable(table_path)
+    assert symbols.code_for('weather_condition', 'CLEAR') == 1
+    assert symbols.code_for('weather_condition', 'RAIN') == 2
+    assert symbols.code_for('crash_type', 'INJURY AND / OR TOW DUE TO CRASH') == 1
+    assert symbols.code_for('weather_condition', 'CLEAR') == 1
+    symbols.flush()
+    symbols.code_for('weather_condition', 'SNOW') # Pending until flush: dropped by refresh
+    symbols.refresh()
+    assert symbols.lookup_code('weather_condition', 'SNOW') is None
+
+    reloaded = tp.SymbolTable(table_path)
+    reloaded.refresh()
+    assert reloaded.value('weather_condition', 2) == 'RAIN'
+    assert reloaded.codes_matching('weather_condition', lambda value: value.startswith('C')) == {1}
+    with pytest.raises(tp.DatabaseError):
+        reloaded.value('weather_condition', 3)
+
+    with open(table_path, 'ab') as f:
+        f.write(tp.SymbolTable.ENTRY.pack(0, 40) + b'torn') # Interrupted flush
+    torn = tp.SymbolTable(table_path)
+    torn.refresh()
+    assert torn.lookup_code('weather_condition', 'RAIN') == 2
+
+
+def test_symbol_coded_records_round_trip(tp, tmp_path, monkeypatch):
+    monkeypatch.setattr(tp.SymbolTable, 'MAX_CODE', 2) # Third distinct value of a field is stored inline
+    symbols = tp.SymbolTable(str(tmp_path / 'codes.sym'))
+    records = [make_record(tp, '2023-07-29', 13, 0.0, weather) for weather in ('CLEAR', 'RAIN', 'VOLCANIC ASH')]
+    encoded = [record.to_bytes(tp.CODEC_BINARY, symbols) for record in records]
+    symbols.flush()
+    assert [tp.BinaryRecordCodec.symbol_codes(data)['weather_condition'] for data in encoded] == [1, 2, 0]
+    for record, data in zip(records, encoded):
+        assert data[0] == tp.BinaryRecordCodec.TAG_V2
+        assert fields_of(tp, tp.DataObject.from_bytes(data, symbols=symbols)) == fields_of(tp, record)
+        assert tp.DataObject.from_bytes(data, trusted=True, symbols=symbols).weather_condition == record.weather_condition
+    with pytest.raises(tp.DatabaseError):
+        tp.DataObject.from_bytes(encoded[0]) # Version 2 needs the table
+
+
+def test_symbol_table_travels_with_the_database(tp, db, tmp_path):
+    db.migrate_codec(tp.CODEC_BINARY)
+    backup_path = db.create_snapshot()
+    backup_stem = os.path.splitext(backup_path)[0]
+    assert os.path.exists(backup_stem + '.sym') and os.path.exists(backup_stem + '.meta')
+
+    data_bytes = open(backup_path, 'rb').read()
+    symbol_bytes = open(backup_stem + '.sym', 'rb').read()
+    meta_bytes = open(backup_stem + '.meta', 'rb').read()
+    target = tp.TrafficAccidentsDB(str(tmp_path / 'imported.db'))
+    with pytest.raises(tp.DatabaseError):
+        target.import_database(data_bytes) # Binary records without their symbol table
+    assert not os.path.exists(target.db_path)
+
+    target.import_database(data_bytes, symbol_bytes, meta_bytes)
+    assert target.record_codec == tp.CODEC_BINARY
+    assert [fields_of(tp, target.decode_record(r['data_bytes'])) for r in target.read_records_paginated()] == \
+           [fields_of(tp, db.decode_record(r['data_bytes'])) for r in db.read_records_paginated()]
+
+
+def test_load_columnar_matches_the_records(tp, db):
+    db.invalidate_record(3, db.read_record_by_id(3)['start_offset'])
+    frame = db.load_columnar()
+    assert list(frame['id']) == [1, 2, 3, 4, 5]
+    assert list(frame['validation']) == [True, True, False, True, True]
+    assert [str(day) for day in frame['crash_date'].values.astype('datetime64[D]')] == [s[0] for s in SAMPLES]
+    assert list(frame['crash_hour']) == [s[1] for s in SAMPLES]
+    assert list(frame['injuries_total']) == [s[2] for s in SAMPLES]
+    assert list(frame['weather_condition']) == ['CLEAR'] * 5
+    assert frame['weather_condition'].dtype == 'category'
+
+    valid = db.load_columnar(columns=['crash_hour'], only_valid=True)
+    assert list(valid.columns) == ['id', 'crash_hour', 'validation']
+    assert list(valid['id']) == [1, 2, 4, 5]
+
+
+def test_columnar_snapshot_follows_the_data_file(tp, db):
+    db.load_columnar()
+    assert db.columnar_snapshot_is_current()
+    db.write_record(make_record(tp, '2024-01-01', 1, 0.0, 'RAIN'))
+    assert not db.columnar_snapshot_is_current()
+    frame = db.load_columnar(columns=['weather_condition'])
+    assert list(frame['weather_condition'])[-1] == 'RAIN'
+
+    with open(os.path.join(db.columns_dir, 'manifest.json'), 'w') as f:
+        f.write('{"format": "something else"}')
+    with pytest.raises(tp.DatabaseError):
+        tp.load_columnar_snapshot(db.columns_dir)
+
+
+@pytest.mark.parametrize('codec', ['json', 'binary'])
+def test_iter_records_scans_the_mapped_file(tp, db, codec):
+    db.migrate_codec(codec)
+    db.invalidate_record(4, db.read_record_by_id(4)['start_offset'])
+    records = list(db.iter_records())
+    assert [r['id'] for r in records] == [1, 2, 3, 4, 5]
+    assert [r['validation'] for r in records] == [True, True, True, False, True]
+    assert [r['data'].crash_date for r in records] == [s[0] for s in SAMPLES]
+    assert [r['id'] for r in db.iter_records(only_valid=True)] == [1, 2, 3, 5]
+
+
+def test_torn_record_ends_scans_and_pages(tp, db):
+    with open(db.db_path, 'ab') as f:
+        f.write(tp.TrafficAccidentsDB.RECORD_HEADER.pack(6, True, 500) + b'{"crash_date"') # Torn append
+    assert [r['id'] for r in db.iter_records()] == [1, 2, 3, 4, 5]
+    assert [r['id'] for r in db.read_records_paginated(3, 10)] == [4, 5]
+
+
+@pytest.mark.parametrize('codec', ['json', 'binary'])
+def test_iter_records_pushes_predicates_down(tp, db, codec):
+    db.write_record(make_record(tp, '2024-01-01', 13, 1.0, 'RAIN'))
+    db.migrate_codec(codec)
+    assert [r['id'] for r in db.iter_records(where={'crash_hour': 13})] == [1, 4, 6]
+    assert [r['id'] for r in db.iter_records(where={'crash_hour': 13, 'weather_condition': 'RAIN'})] == [6]
+    assert [r['id'] for r in db.iter_records(where={'injuries_total': lambda value: value >= 2})] == [2, 5]
+    assert list(db.iter_records(where={'crash_hour': 13, 'crash_date': '2023-12-24'}, columns=['crash_hour', 'weather_condition'])) == [
+        {'id': 4, 'validation': True, 'size': db.read_record_by_id(4)['size'], 'checksum': db.read_record_by_id(4)['checksum'],
+         'data': {'crash_hour': 13, 'weather_condition': 'CLEAR'}}]
+    with pytest.raises(ValueError):
+        db.iter_records(where={'no_such_field': 1})
+
+
+def test_record_filter_decides_on_raw_bytes(tp, tmp_path):
+    symbols = tp.SymbolTable(str(tmp_path / 'codes.sym'))
+    match, other_hour, other_weather = (make_record(tp, '2023-07-29', hour, 0.0, weather)
+                                        for hour, weather in ((13, 'CLEAR'), (7, 'CLEAR'), (13, 'RAIN')))
+    coded = [record.to_bytes(tp.CODEC_BINARY, symbols) for record in (match, other_hour, other_weather)]
+    symbols.flush()
+    record_filter = tp.RecordFilter({'crash_hour': 13, 'weather_condition': 'CLEAR', 'alignment': 'STRAIGHT AND LEVEL'}, symbols)
+
+    # Version 2: hour and symbol code are decided on the bytes; alignment needs decoding
+    assert record_filter.check_raw(coded[0]) == ('alignment',)
+    assert record_filter.check_raw(coded[1]) is None
+    assert record_filter.check_raw(coded[2]) is None
+    # Version 1 has no symbol codes and JSON has no numeric block: those fields are left for after decoding
+    assert record_filter.check_raw(match.to_bytes(tp.CODEC_BINARY)) == ('weather_condition', 'alignment')
+    assert record_filter.check_raw(other_hour.to_bytes(tp.CODEC_BINARY)) is None
+    assert record_filter.check_raw(match.to_bytes(tp.CODEC_JSON)) == record_filter.all_fields
+    assert record_filter.matches(match, record_filter.all_fields)
+    assert not record_filter.matches(other_weather, record_filter.all_fields)
+
+
+def test_closed_record_iterator_releases_the_lock(tp, db):
+    from contextlib import closing
+    with closing(db.iter_records()) as records:
+        next(records)
+        assert db._lock.is_locked
+    assert not db._lock.is_locked
+
+
+def test_query_range_returns_records_in_field_order(tp, db):
+    records = db.query_range('crash_hour', 7, 13)
+    assert [(r['data'].crash_hour, r['id']) for r in records] == [(7, 5), (13, 1), (13, 4)]
+
+    by_date = db.query_range('crash_date', '2023-01-01', '2023-08-31')
+    assert [r['id'] for r in by_date] == [3, 1, 2]
+    assert [r['id'] for r in db.query_range('injuries_total', low=2.0)] == [2, 5]
+    assert [r['id'] for r in db.query_range('injuries_total', high=0.0)] == [1, 4]
+    assert len(db.query_range('crash_hour', limit=2)) == 2
+
+
+def test_query_range_follows_updates(tp, db):
+    db.invalidate_record(4, db.read_record_by_id(4)['start_offset'])
+    assert [r['id'] for r in db.query_range('crash_hour', 13, 13, only_valid=True)] == [1]
+
+    new_id = db.update_record(1, make_record(tp, '2023-07-29', 20, 0.0))
+    assert [r['id'] for r in db.query_range('crash_hour', 20, 20)] == [new_id]
+    assert [r['id'] for r in db.query_range('crash_hour', 13, 13, only_valid=True)] == []
+
+
+def test_query_range_rejects_unindexed_field(db):
+    with pytest.raises(ValueError):
+        db.query_range('weather_condition', 'CLEAR', 'CLEAR')
+
+
+def test_rebuild_index_recreates_missing_indexes(tp, db):
+    expected = [r['id'] for r in db.query_range('crash_date')]
+    for path in (db.index_path, db.page_table_path, db.secondary_index_path):
+        os.remove(path)
+
+    assert db.rebuild_index() == len(SAMPLES)
+    assert [r['id'] for r in db.query_range('crash_date')] == expected
+    assert db.read_record_by_id(4)['id'] == 4
+
+
+def test_corrupt_secondary_index_is_rebuilt(tp, db):
+    expected = [r['id'] for r in db.query_range('injuries_total')]
+    with open(db.secondary_index_path, 'r+b') as f:
+        f.write(b'\x00' * 64)
+    assert [r['id'] for r in db.query_range('injuries_total')] == expected
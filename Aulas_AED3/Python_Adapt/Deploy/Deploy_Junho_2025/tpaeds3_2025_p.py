@@ -16,16 +16,29 @@ import tempfile
 import heapq
 import io
 import pandas as pd
+import numpy as np
 import json
 import logging
 import traceback
 import hashlib
+import hmac
+import itertools
+import array
+import functools
+import bisect
+import mmap
+import zlib
+import bz2
+import lzma
 import math
 from matplotlib import pyplot as plt
-from collections import Counter, defaultdict
-from typing import Tuple, Optional, Dict, Callable,List, Union, Any, Iterator
+from collections import Counter, OrderedDict, defaultdict, deque
+from contextlib import contextmanager, closing
+from typing import Tuple, Optional, Dict, Callable,List, Union, Any, Iterator, Iterable, Set, BinaryIO
 from datetime import datetime, date
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import pickle
 import threading
 import platform
 import sys
@@ -36,6 +49,7 @@ from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.exceptions import InvalidTag as CryptoInvalidTag # Renomeado para evitar conflito
 
 LOG_FILE='traffic_accidents.log'
@@ -57,6 +71,11 @@ DB_FILE = os.path.join(DB_DIR, 'traffic_accidents.db')
 # --- Constants ---
 IDX_FILE =os.path.join(DB_DIR,'traffic_accidents.idx') #------------------> Index file
 BTR_FILE = os.path.join(DB_DIR,'traffic_accidents.btr') #------------------> B-Tree Index file
+PGX_FILE = os.path.join(DB_DIR,'traffic_accidents.pgx') #------------------> Sparse page table file
+WAL_FILE = os.path.join(DB_DIR,'traffic_accidents.wal') #------------------> Write-ahead journal file
+META_FILE = os.path.join(DB_DIR,'traffic_accidents.meta') #----------------> Database settings (record codec)
+SYM_FILE = os.path.join(DB_DIR,'traffic_accidents.sym') #------------------> Symbol table of categorical columns
+COLUMNS_DIR = os.path.join(DB_DIR,'traffic_accidents_columns') #-----------> Columnar snapshot (one .npy per field)
 
 BACKUP_DIR = os.path.join(DB_DIR, 'backups')
 LOCK_FILE = os.path.join(DB_DIR, 'traffic_accidents.lock') # Dedicated lock file
@@ -75,12 +94,42 @@ DEFAULT_EXTENSION = ".csv"
 CSV_DELIMITER = ';'
 HUFFMAN_COMPRESSED_EXTENSION = ".huff"
 LZW_COMPRESSED_EXTENSION = ".lzw"
+LZW_HUFFMAN_COMPRESSED_EXTENSION = ".lzwh"
+ZLIB_COMPRESSED_EXTENSION = ".gz"
+BZ2_COMPRESSED_EXTENSION = ".bz2"
+LZMA_COMPRESSED_EXTENSION = ".xz"
+CODEC_CHUNK_SIZE = 1024 * 1024 # Bytes read per step by the streaming stdlib codecs
+LZW_MAX_CODE_BITS = 24 # Largest LZW code width (2^24 dictionary entries)
+LZW_BLOCK_SIZE = 256 * 1024 # Input bytes / codes handled per LZW progress step (multiple of 8)
+LZW_STREAM_BLOCK_SIZE = 16 * 1024 * 1024 # Input bytes per independently coded frame of streamed .lzw files
+LZW_RESET_CHECK_INTERVAL = 16 * 1024 # Input bytes between compression-ratio checks once the LZW dictionary is full
+HUFFMAN_MAX_CODE_LENGTH = 15 # Longest code written by the canonical (v2) .huff format
+HUFFMAN_TABLE_BITS = 12 # Bits resolved by one lookup in the Huffman decoding table
+HUFFMAN_DECODE_BLOCK_SIZE = 256 * 1024 # Compressed bytes decoded per block of lookup windows
+HUFFMAN_LANE_BITS = 4096 # Bits decoded speculatively by each lane of the vectorized Huffman decoder
+HUFFMAN_LANE_BLOCK_SIZE = 2 * 1024 * 1024 # Compressed bytes decoded per step of the vectorized Huffman decoder
+HUFFMAN_SYNC_STEPS = 256 # Lookups allowed for misaligned lanes to resynchronise before a block is decoded sequentially
+HUFFMAN_ENCODE_BLOCK_SIZE = 1024 * 1024 # Input bytes packed per vectorized encoding step (and per v3 frame)
+HUFFMAN_WORKERS = os.cpu_count() or 1 # Processes used to encode/decode the frames of v3 .huff files
 MAX_RECORDS_PER_PAGE = 20
 MIN_COMPRESSION_SIZE = 100  # Tamanho mínimo do arquivo para aplicar compressão
 MAX_FILE_SIZE_MB = 100 # Maximum CSV file size for import
+MAX_RECORD_SIZE = 10 * 1024 * 1024 # Largest record payload accepted when reading (10MB)
 CHUNK_SIZE = 4096     # Read/write chunk size for file operations (4KB)
+AES_STREAM_CHUNK_SIZE = 1024 * 1024 # Plaintext bytes per authenticated chunk of hybrid (.enc.aes_rsa) files
+AES_STREAM_MAX_CHUNK_SIZE = 64 * 1024 * 1024 # Largest chunk accepted when reading a hybrid file header
+BLOWFISH_CHUNK_SIZE = 1024 * 1024 # Bytes encrypted per streaming step (and per authenticated chunk) of .enc.bf files (multiple of 8)
+CRYPTO_PARALLEL_MIN_SIZE = 32 * 1024 * 1024 # Smallest CTR+HMAC Blowfish file for which a worker pool is started (workers > 1)
+KEY_CACHE_SIZE = 64 # Password-derived keys (PBKDF2) kept by the key-derivation cache
+BLOWFISH_SCHEDULE_CACHE_SIZE = 16 # Expanded Blowfish key schedules kept per process
+RSA_KEY_CACHE_SIZE = 8 # Parsed RSA key files (by path + mtime) kept by the key-handle cache
+SESSION_KEY_CACHE_SIZE = 16 # Unwrapped batch master keys of hybrid files kept in memory
+WRITE_BUFFER_SIZE = 1024 * 1024 # Write buffer for batched record appends (1MB)
 MAX_BACKUPS = 5       # Keep only the last N backups
+SNAPSHOT_INTERVAL_HOURS = 24 # Age of the newest backup that triggers a scheduled snapshot
+WAL_CHECKPOINT_SIZE = 1024 * 1024 # Journal size that triggers a checkpoint (1MB)
 MAX_LOG_ENTRIES_DISPLAY = 10 # Max number of log entries to display in the registry
+PAGE_CHECKPOINT_INTERVAL = 128 # Records between two entries of the sparse page table (.pgx)
 
 
 
@@ -96,6 +145,55 @@ FIELDS = [
     'injuries_reported_not_evident', 'injuries_no_indication',
     'crash_hour', 'crash_day_of_week', 'crash_month'
 ]
+
+# --- Record Codecs ---
+CODEC_JSON = 'json'     # Sorted-key JSON document (original format)
+CODEC_BINARY = 'binary' # Fixed-layout binary record (BinaryRecordCodec)
+RECORD_CODECS = (CODEC_JSON, CODEC_BINARY)
+DEFAULT_RECORD_CODEC = CODEC_JSON
+
+# Static dictionaries of the binary codec (values of the traffic accidents dataset).
+# Codes are stored on disk: only append to these lists, never reorder them.
+RECORD_CATEGORY_VALUES: Dict[str, List[str]] = {
+    'traffic_control_device': ['UNKNOWN', 'TRAFFIC SIGNAL', 'STOP SIGN/FLASHER', 'NO CONTROLS', 'OTHER', 'YIELD',
+                               'PEDESTRIAN CROSSING SIGN', 'OTHER REG. SIGN', 'LANE USE MARKING', 'FLASHING CONTROL SIGNAL',
+                               'POLICE/FLAGMAN', 'OTHER WARNING SIGN', 'RAILROAD CROSSING GATE', 'SCHOOL ZONE',
+                               'OTHER RAILROAD CROSSING', 'RR CROSSING SIGN', 'DELINEATORS', 'NO PASSING', 'BICYCLE CROSSING SIGN'],
+    'weather_condition': ['UNKNOWN', 'CLEAR', 'RAIN', 'CLOUDY/OVERCAST', 'SNOW', 'OTHER', 'FREEZING RAIN/DRIZZLE',
+                          'FOG/SMOKE/HAZE', 'SLEET/HAIL', 'BLOWING SNOW', 'SEVERE CROSS WIND GATE', 'BLOWING SAND, SOIL, DIRT'],
+    'lighting_condition': ['UNKNOWN', 'DAYLIGHT', 'DARKNESS, LIGHTED ROAD', 'DARKNESS', 'DUSK', 'DAWN'],
+    'first_crash_type': ['UNKNOWN', 'TURNING', 'ANGLE', 'REAR END', 'SIDESWIPE SAME DIRECTION', 'PEDESTRIAN', 'PEDALCYCLIST',
+                         'PARKED MOTOR VEHICLE', 'FIXED OBJECT', 'SIDESWIPE OPPOSITE DIRECTION', 'HEAD ON', 'REAR TO FRONT',
+                         'REAR TO SIDE', 'OTHER OBJECT', 'OTHER NONCOLLISION', 'OVERTURNED', 'ANIMAL', 'REAR TO REAR', 'TRAIN'],
+    'trafficway_type': ['UNKNOWN', 'NOT DIVIDED', 'FOUR WAY', 'DIVIDED - W/MEDIAN (NOT RAISED)', 'ONE-WAY',
+                        'DIVIDED - W/MEDIAN BARRIER', 'T-INTERSECTION', 'OTHER', 'CENTER TURN LANE', 'UNKNOWN INTERSECTION TYPE',
+                        'FIVE POINT, OR MORE', 'Y-INTERSECTION', 'TRAFFIC ROUTE', 'ALLEY', 'NOT REPORTED', 'PARKING LOT',
+                        'RAMP', 'ROUNDABOUT', 'DRIVEWAY', 'L-INTERSECTION'],
+    'alignment': ['UNKNOWN', 'STRAIGHT AND LEVEL', 'STRAIGHT ON GRADE', 'CURVE, LEVEL', 'STRAIGHT ON HILLCREST',
+                  'CURVE ON GRADE', 'CURVE ON HILLCREST'],
+    'roadway_surface_cond': ['UNKNOWN', 'DRY', 'WET', 'SNOW OR SLUSH', 'ICE', 'OTHER', 'SAND, MUD, DIRT'],
+    'road_defect': ['NONE', 'NO DEFECTS', 'UNKNOWN', 'WORN SURFACE', 'OTHER', 'RUT, HOLES', 'SHOULDER DEFECT', 'DEBRIS ON ROADWAY'],
+    'crash_type': ['UNKNOWN', 'NO INJURY / DRIVE AWAY', 'INJURY AND / OR TOW DUE TO CRASH'],
+    'damage': ['UNKNOWN', 'OVER $1,500', '$501 - $1,500', '$500 OR LESS'],
+    'prim_contributory_cause': ['UNKNOWN', 'UNABLE TO DETERMINE', 'FAILING TO YIELD RIGHT-OF-WAY', 'FOLLOWING TOO CLOSELY',
+                                'DISREGARDING TRAFFIC SIGNALS', 'IMPROPER TURNING/NO SIGNAL', 'FAILING TO REDUCE SPEED TO AVOID CRASH',
+                                'IMPROPER OVERTAKING/PASSING', 'DISREGARDING STOP SIGN', 'IMPROPER LANE USAGE', 'NOT APPLICABLE',
+                                'DRIVING SKILLS/KNOWLEDGE/EXPERIENCE', 'WEATHER', 'IMPROPER BACKING',
+                                'OPERATING VEHICLE IN ERRATIC, RECKLESS, CARELESS, NEGLIGENT OR AGGRESSIVE MANNER',
+                                'VISION OBSCURED (SIGNS, TREE LIMBS, BUILDINGS, ETC.)', 'DISTRACTION - FROM INSIDE VEHICLE',
+                                'DRIVING ON WRONG SIDE/WRONG WAY', 'DISREGARDING OTHER TRAFFIC SIGNS', 'EQUIPMENT - VEHICLE CONDITION',
+                                'UNDER THE INFLUENCE OF ALCOHOL/DRUGS (USE WHEN ARREST IS EFFECTED)', 'PHYSICAL CONDITION OF DRIVER',
+                                'DISTRACTION - FROM OUTSIDE VEHICLE', 'EXCEEDING SAFE SPEED FOR CONDITIONS', 'TURNING RIGHT ON RED',
+                                'EXCEEDING AUTHORIZED SPEED LIMIT', 'DISREGARDING ROAD MARKINGS', 'ROAD CONSTRUCTION/MAINTENANCE',
+                                'EVASIVE ACTION DUE TO ANIMAL, OBJECT, NONMOTORIST', 'CELL PHONE USE OTHER THAN TEXTING',
+                                'ROAD ENGINEERING/SURFACE/MARKING DEFECTS', 'HAD BEEN DRINKING (USE WHEN ARREST IS NOT MADE)',
+                                'DISREGARDING YIELD SIGN',
+                                'DISTRACTION - OTHER ELECTRONIC DEVICE (NAVIGATION DEVICE, DVD PLAYER, ETC.)', 'RELATED TO BUS STOP',
+                                'TEXTING', 'ANIMAL', 'OBSTRUCTED CROSSWALKS', 'BICYCLE ADVANCING LEGALLY ON RED LIGHT',
+                                'PASSING STOPPED SCHOOL BUS', 'MOTORCYCLE ADVANCING LEGALLY ON RED LIGHT'],
+    'most_severe_injury': ['NONE', 'NO INDICATION OF INJURY', 'NONINCAPACITATING INJURY', 'REPORTED, NOT EVIDENT',
+                           'INCAPACITATING INJURY', 'FATAL', 'UNKNOWN'],
+}
 def count_file(input_file_path,extension,folder):
     prefix=Path(input_file_path).name
     print(prefix)
@@ -106,14 +204,15 @@ def count_file(input_file_path,extension,folder):
     print(contador)
     return contador
 
-def get_original(file_name: str, old_extension: str) -> str:
+def get_original(file_name: str, old_extension: Optional[str] = None) -> str:
     """
     Remove o padrão '_version' + <contador de versão> + <extensão antiga>
     de um nome de arquivo.
 
     Args:
         file_name (str): O nome do arquivo a ser processado.
-        old_extension (str): A extensão antiga do arquivo (ex: '.lzw', '.zip').
+        old_extension (str): A extensão antiga do arquivo (ex: '.lzw', '.zip');
+            se omitida, vale a extensão de qualquer codec registrado em CODECS.
 
     Returns:
         str: O nome do arquivo sem o sufixo de versão e extensão, ou
@@ -121,7 +220,10 @@ def get_original(file_name: str, old_extension: str) -> str:
     """
     # Escapa a extensão antiga para que qualquer caractere especial de regex (como '.')
     # seja tratado como um literal.
-    escaped_extension = re.escape(old_extension)
+    if old_extension is None:
+        escaped_extension = '(?:' + '|'.join(re.escape(codec.extension) for codec in CODECS.values()) + ')'
+    else:
+        escaped_extension = re.escape(old_extension)
     
     # Define o padrão de expressão regular com a extensão escapada
     regex_pattern_dynamic_version = rf'_version\d+{escaped_extension}$'
@@ -384,11 +486,18 @@ class DataObject:
             logger.warning(f"Invalid numeric value '{value}' for {field_name}. Setting to {min_val}.")
             return min_val
             
-    def to_bytes(self) -> bytes:
+    def to_bytes(self, codec: str = CODEC_JSON, symbols: Optional['SymbolTable'] = None) -> bytes:
         """
-        Serializes the DataObject into bytes using JSON format.
-        Uses sorted keys for consistent byte representation.
+        Serializes the DataObject into bytes using JSON format (sorted keys for a consistent
+        byte representation) or the compact binary layout (codec=CODEC_BINARY, coding the
+        categorical columns through the database symbol table when one is given).
+        Values the binary layout cannot hold fall back to JSON for that record.
         """
+        if codec == CODEC_BINARY:
+            try:
+                return BinaryRecordCodec.encode(self, symbols)
+            except (struct.error, ValueError, TypeError) as e:
+                logger.warning(f"Record does not fit the binary layout ({e}). Storing it as JSON.")
         try:
             data_dict = {attr: getattr(self, attr) for attr in FIELDS}
             # Ensure JSON is compact and consistent for hashing
@@ -401,16 +510,35 @@ class DataObject:
             raise DatabaseError(f"Failed to serialize record: {str(e)}")
 
     @classmethod
-    def from_bytes(cls, byte_data: bytes) -> 'DataObject':
+    def from_bytes(cls, byte_data: bytes, trusted: bool = False, symbols: Optional['SymbolTable'] = None) -> 'DataObject':
         """
-        Deserializes byte data back into a DataObject instance.
+        Deserializes byte data (JSON or binary, told apart by the first byte) back into a DataObject instance.
+        Binary records with symbol codes need the database symbol table.
+        trusted=True skips the field validators, for records read back from the database
+        that were validated when they were written; symbol-coded fields are then only
+        decoded when first accessed.
         Handles various deserialization errors.
         """
         if not byte_data:
             raise DataValidationError("Attempted to deserialize empty byte data.")
-        
+
         try:
-            data_dict = json.loads(byte_data.decode('utf-8'))
+            symbol_codes = {}
+            if byte_data[0] in (BinaryRecordCodec.TAG_V1, BinaryRecordCodec.TAG_V2):
+                data_dict, symbol_codes = BinaryRecordCodec.decode(byte_data, symbols, lazy=trusted)
+            else:
+                # Records updated in place keep their original slot size, padded with null bytes
+                data_dict = json.loads(bytes(byte_data).rstrip(b'\x00').decode('utf-8'))
+            if trusted:
+                obj = cls.__new__(cls)
+                obj._initialize_defaults()
+                obj.__dict__.update((field, data_dict[field]) for field in FIELDS if field in data_dict)
+                if symbol_codes:
+                    for field in symbol_codes:
+                        del obj.__dict__[field] # Resolved by __getattr__ on first access
+                    obj._symbol_codes = symbol_codes
+                    obj._symbol_table = symbols
+                return obj
             obj = cls(existing_data_dict=data_dict) # Initialize using the dictionary constructor
             # Validation is already done in the DataObject constructor
             return obj
@@ -420,10 +548,21 @@ class DataObject:
         except DataValidationError as e:
             logger.error(f"Data validation error after deserialization: {e}")
             raise DatabaseError(f"Corrupt data after deserialization: {str(e)}")
+        except DatabaseError:
+            raise
         except Exception as e:
             logger.error(f"Unexpected deserialization error: {traceback.format_exc()}")
             raise DatabaseError(f"Failed to deserialize record: {str(e)}")
 
+    def __getattr__(self, name: str) -> Any:
+        """Decodes a symbol-coded field of a lazily decoded record on first access."""
+        symbol_codes = self.__dict__.get('_symbol_codes')
+        if symbol_codes and name in symbol_codes:
+            value = self.__dict__['_symbol_table'].value(name, symbol_codes.pop(name))
+            setattr(self, name, value)
+            return value
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
     def validate(self) -> bool:
         """
         Performs comprehensive semantic validation on the DataObject's fields.
@@ -479,12 +618,919 @@ class DataObject:
         """Provides a string representation of the DataObject for debugging."""
         return f"DataObject(ID=N/A, Date='{self.crash_date}', Type='{self.crash_type}', TotalInjuries={self.injuries_total})"
 
+# --- SymbolTable Class ---
+class SymbolTable:
+    """
+    Per-database dictionary of categorical column values (.sym), used by the binary codec.
+    Each value gets a small integer code (1-255) per field; code 0 means the value did not
+    fit and is stored inline. The file is append-only, so codes never change once written.
+    New codes stay pending until flush(), which the database calls before fsyncing the
+    records that use them. Must be used with the database lock held.
+    """
+    HEADER = struct.Struct('<4sH') # Magic, version
+    ENTRY = struct.Struct('<BH')   # Field number, UTF-8 value length
+    MAGIC = b'TASY'
+    VERSION = 1
+    FIELDS = ['weather_condition', 'lighting_condition', 'trafficway_type',
+              'roadway_surface_cond', 'crash_type', 'prim_contributory_cause']
+    MAX_CODE = 255
+
+    def __init__(self, table_path: str):
+        self.table_path = table_path
+        self._reset()
+
+    def _reset(self):
+        self._values: Dict[str, List[str]] = {field: [] for field in self.FIELDS}
+        self._codes: Dict[str, Dict[str, int]] = {field: {} for field in self.FIELDS}
+        self._pending: List[Tuple[str, str]] = []
+        self._loaded_size = 0 # Bytes of the file already parsed
+
+    def _add(self, field: str, value: str) -> int:
+        self._values[field].append(value)
+        code = len(self._values[field])
+        self._codes[field][value] = code
+        return code
+
+    def refresh(self):
+        """
+        Loads entries appended by other processes and drops codes that were never flushed
+        (their records were rolled back). Called at the start of every write.
+        """
+        if self._pending:
+            self._reset()
+        try:
+            file_size = os.path.getsize(self.table_path)
+        except FileNotFoundError:
+            self._reset()
+            return
+        if file_size < self._loaded_size:
+            self._reset() # File was replaced
+        if file_size == self._loaded_size:
+            return
+        with open(self.table_path, 'rb') as f:
+            if self._loaded_size == 0:
+                header_bytes = f.read(self.HEADER.size)
+                if len(header_bytes) != self.HEADER.size or self.HEADER.unpack(header_bytes) != (self.MAGIC, self.VERSION):
+                    raise DatabaseError(f"Symbol table file '{self.table_path}' is corrupt or has an unknown version.")
+                self._loaded_size = self.HEADER.size
+            f.seek(self._loaded_size)
+            while True:
+                entry_bytes = f.read(self.ENTRY.size)
+                if len(entry_bytes) != self.ENTRY.size:
+                    break
+                field_number, length = self.ENTRY.unpack(entry_bytes)
+                raw_value = f.read(length)
+                if len(raw_value) != length or field_number >= len(self.FIELDS):
+                    break
+                self._add(self.FIELDS[field_number], raw_value.decode('utf-8'))
+                self._loaded_size = f.tell()
+        if self._loaded_size != file_size:
+            logger.warning(f"Ignoring torn entry at the end of symbol table '{self.table_path}'.")
+
+    def code_for(self, field: str, value: str) -> int:
+        """Returns the code of value, assigning a new (pending) one if needed; 0 if the field is full."""
+        code = self._codes[field].get(value)
+        if code is None:
+            if len(self._values[field]) >= self.MAX_CODE:
+                return 0
+            code = self._add(field, value)
+            self._pending.append((field, value))
+        return code
+
+    def lookup_code(self, field: str, value: str) -> Optional[int]:
+        """Returns the code of an existing value without assigning one."""
+        if value not in self._codes[field] and not self._pending:
+            self.refresh()
+        return self._codes[field].get(value)
+
+    def codes_matching(self, field: str, predicate: Callable[[str], bool]) -> Set[int]:
+        """Codes whose value satisfies predicate, for filtering records with integer compares."""
+        if not self._pending:
+            self.refresh()
+        return {code for code, value in enumerate(self._values[field], 1) if predicate(value)}
+
+    def value(self, field: str, code: int) -> str:
+        """Returns the value of a code, reloading the file once for codes added by another process."""
+        values = self._values[field]
+        if code > len(values) and not self._pending:
+            self.refresh()
+        if not 0 < code <= len(values):
+            raise DatabaseError(f"Unknown symbol code {code} for field '{field}' in '{self.table_path}'.")
+        return values[code - 1]
+
+    def flush(self):
+        """Appends the pending codes to the file and fsyncs it."""
+        if not self._pending:
+            return
+        entries = bytearray()
+        for field, value in self._pending:
+            raw_value = value.encode('utf-8')
+            entries += self.ENTRY.pack(self.FIELDS.index(field), len(raw_value))
+            entries += raw_value
+        with open(self.table_path, 'r+b' if os.path.exists(self.table_path) else 'w+b') as f:
+            if self._loaded_size == 0:
+                f.write(self.HEADER.pack(self.MAGIC, self.VERSION))
+                self._loaded_size = self.HEADER.size
+            f.seek(self._loaded_size)
+            f.write(entries)
+            f.truncate() # Drop a torn tail left by an interrupted flush
+            f.flush()
+            os.fsync(f.fileno())
+            self._loaded_size = f.tell()
+        self._pending.clear()
+
+# --- BinaryRecordCodec Class ---
+class BinaryRecordCodec:
+    """
+    Versioned fixed-layout binary record format (CODEC_BINARY).
+    A tag byte, the crash date as days since 1970-01-01, num_units, the six injury counts
+    in hundredths, hour, day of week, month and the intersection flag, followed by one code
+    per string field: index + 1 into RECORD_CATEGORY_VALUES, or 0 and an inline
+    length-prefixed UTF-8 value. JSON payloads start with '{', so the tag tells both
+    formats apart. The layout is self-delimiting, so slot padding is ignored.
+    Version 2 stores the SymbolTable.FIELDS as per-database symbol codes at a fixed
+    offset right after the numeric block, followed by the other string fields as in
+    version 1 and the inline values of symbol fields with code 0.
+    """
+    TAG_V1 = 0x01
+    TAG_V2 = 0x02 # With per-database SymbolTable codes
+    FIXED = struct.Struct('<BiI6IBBB?') # Tag, epoch day, num_units, injuries x100, hour, weekday, month, intersection
+    SYMBOLS = struct.Struct('<' + 'B' * len(SymbolTable.FIELDS)) # Symbol codes (version 2)
+    INLINE_LENGTH = struct.Struct('<H')
+    INJURY_FIELDS = ['injuries_total', 'injuries_fatal', 'injuries_incapacitating', 'injuries_non_incapacitating',
+                     'injuries_reported_not_evident', 'injuries_no_indication']
+    FIXED_FIELDS = ['crash_date', 'num_units', *INJURY_FIELDS, 'crash_hour', 'crash_day_of_week',
+                    'crash_month', 'intersection_related_i'] # Fields stored in the numeric block
+    STRING_FIELDS = [field for field in FIELDS if field in RECORD_CATEGORY_VALUES]
+    STATIC_FIELDS_V2 = [field for field in STRING_FIELDS if field not in SymbolTable.FIELDS]
+    NO_DATE = -2**31
+    EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+    _CODES = {field: {value: code for code, value in enumerate(values, 1)} for field, values in RECORD_CATEGORY_VALUES.items()}
+
+    @classmethod
+    def encode(cls, data_object: 'DataObject', symbols: Optional[SymbolTable] = None) -> bytes:
+        """
+        Packs a DataObject (version 2 with a symbol table, version 1 without).
+        Raises struct.error/ValueError for values outside the layout.
+        """
+        crash_date = data_object.crash_date
+        epoch_day = date.fromisoformat(crash_date).toordinal() - cls.EPOCH_ORDINAL if crash_date else cls.NO_DATE
+        encoded = bytearray(cls.FIXED.pack(
+            cls.TAG_V1 if symbols is None else cls.TAG_V2, epoch_day, data_object.num_units,
+            *(round(getattr(data_object, field) * 100) for field in cls.INJURY_FIELDS),
+            data_object.crash_hour, data_object.crash_day_of_week, data_object.crash_month,
+            data_object.intersection_related_i == "YES"))
+        if symbols is None:
+            cls._encode_static(encoded, data_object, cls.STRING_FIELDS)
+            return bytes(encoded)
+
+        inline_values = []
+        for field in SymbolTable.FIELDS:
+            value = getattr(data_object, field)
+            code = symbols.code_for(field, value)
+            encoded.append(code)
+            if not code: # Symbol table full for this field
+                inline_values.append(value)
+        cls._encode_static(encoded, data_object, cls.STATIC_FIELDS_V2)
+        for value in inline_values:
+            cls._encode_inline(encoded, value)
+        return bytes(encoded)
+
+    @classmethod
+    def _encode_static(cls, encoded: bytearray, data_object: 'DataObject', fields: List[str]):
+        """Appends one static dictionary code per field, with an inline value for code 0."""
+        for field in fields:
+            value = getattr(data_object, field)
+            code = cls._CODES[field].get(value, 0)
+            encoded.append(code)
+            if not code: # Not in the dictionary: store inline
+                cls._encode_inline(encoded, value)
+
+    @classmethod
+    def _encode_inline(cls, encoded: bytearray, value: str):
+        raw_value = value.encode('utf-8')
+        encoded += cls.INLINE_LENGTH.pack(len(raw_value))
+        encoded += raw_value
+
+    @classmethod
+    def _decode_inline(cls, byte_data: bytes, position: int, field: str) -> Tuple[str, int]:
+        """Reads a length-prefixed value; returns (value, next position)."""
+        (length,) = cls.INLINE_LENGTH.unpack_from(byte_data, position)
+        position += cls.INLINE_LENGTH.size
+        if position + length > len(byte_data):
+            raise ValueError(f"inline value of '{field}' runs past the record end")
+        return bytes(byte_data[position:position + length]).decode('utf-8'), position + length
+
+    @classmethod
+    def _decode_fixed(cls, byte_data: bytes) -> Tuple[int, Dict[str, Any]]:
+        """Unpacks the numeric block; returns (tag, values of FIXED_FIELDS). Raises struct.error/ValueError."""
+        (tag, epoch_day, num_units, *injuries, crash_hour, crash_day_of_week, crash_month,
+         intersection_related) = cls.FIXED.unpack_from(byte_data, 0)
+        if tag not in (cls.TAG_V1, cls.TAG_V2):
+            raise ValueError(f"unknown record tag {tag}")
+        data_dict = {
+            'crash_date': date.fromordinal(epoch_day + cls.EPOCH_ORDINAL).isoformat() if epoch_day != cls.NO_DATE else "",
+            'num_units': num_units,
+            'crash_hour': crash_hour,
+            'crash_day_of_week': crash_day_of_week,
+            'crash_month': crash_month,
+            'intersection_related_i': "YES" if intersection_related else "NO",
+        }
+        data_dict.update(zip(cls.INJURY_FIELDS, (round(value / 100, 2) for value in injuries)))
+        return tag, data_dict
+
+    @classmethod
+    def fixed_values(cls, byte_data: bytes) -> Optional[Dict[str, Any]]:
+        """
+        Returns the FIXED_FIELDS of a binary record without decoding its strings,
+        or None for JSON records and blocks that do not unpack.
+        """
+        if not byte_data or byte_data[0] not in (cls.TAG_V1, cls.TAG_V2):
+            return None
+        try:
+            return cls._decode_fixed(byte_data)[1]
+        except (struct.error, ValueError, OverflowError):
+            return None
+
+    @classmethod
+    def symbol_codes(cls, byte_data: bytes) -> Optional[Dict[str, int]]:
+        """
+        Returns the SymbolTable.FIELDS codes of a version 2 record without decoding it
+        (code 0 = inline value), or None for other formats.
+        """
+        if not byte_data or byte_data[0] != cls.TAG_V2 or len(byte_data) < cls.FIXED.size + cls.SYMBOLS.size:
+            return None
+        return dict(zip(SymbolTable.FIELDS, cls.SYMBOLS.unpack_from(byte_data, cls.FIXED.size)))
+
+    @classmethod
+    def decode(cls, byte_data: bytes, symbols: Optional[SymbolTable] = None,
+               lazy: bool = False) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        """
+        Unpacks a binary record into a field dictionary. Raises DatabaseError on corrupt data.
+        Returns (values, unresolved symbol codes); with lazy=True the symbol fields of a
+        version 2 record are left as codes for the caller to resolve on access.
+        """
+        try:
+            tag, data_dict = cls._decode_fixed(byte_data)
+            position = cls.FIXED.size
+            symbol_codes = {}
+            if tag == cls.TAG_V2:
+                if symbols is None:
+                    raise ValueError("version 2 records need the database symbol table")
+                symbol_codes = dict(zip(SymbolTable.FIELDS, cls.SYMBOLS.unpack_from(byte_data, position)))
+                position += cls.SYMBOLS.size
+            for field in (cls.STRING_FIELDS if tag == cls.TAG_V1 else cls.STATIC_FIELDS_V2):
+                code = byte_data[position]
+                position += 1
+                if code:
+                    data_dict[field] = RECORD_CATEGORY_VALUES[field][code - 1]
+                else:
+                    data_dict[field], position = cls._decode_inline(byte_data, position, field)
+            for field, code in list(symbol_codes.items()):
+                if not code:
+                    data_dict[field], position = cls._decode_inline(byte_data, position, field)
+                    del symbol_codes[field]
+                elif not lazy:
+                    data_dict[field] = symbols.value(field, code)
+                    del symbol_codes[field]
+            return data_dict, symbol_codes
+        except (struct.error, IndexError, ValueError, UnicodeDecodeError, OverflowError) as e:
+            logger.error(f"Binary record decode error: {e} | Data: {bytes(byte_data[:100])}...")
+            raise DatabaseError(f"Invalid binary record format: {str(e)}")
+
+# --- RecordIndex Class ---
+class RecordIndex:
+    """
+    Persistent ID -> offset index for the database file (.idx).
+    Entries have a fixed size and are kept in ID order, so a lookup is a direct seek
+    (IDs are assigned sequentially) with a binary search as fallback.
+    The header stores the data file size the index is consistent with, which lets
+    the database detect a stale index and catch up or rebuild it.
+    """
+    HEADER = struct.Struct('<4sHIQ') # Magic, version, entry count, indexed data file size
+    ENTRY = struct.Struct('<IQ?')    # Record ID, record start offset, validation flag
+    MAGIC = b'TAIX'
+    VERSION = 1
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+
+    def read_header(self) -> Optional[Tuple[int, int]]:
+        """Returns (entry_count, indexed_data_size), or None if the index is missing or corrupt."""
+        try:
+            with open(self.index_path, 'rb') as f:
+                header_bytes = f.read(self.HEADER.size)
+            if len(header_bytes) != self.HEADER.size:
+                return None
+            magic, version, entry_count, data_size = self.HEADER.unpack(header_bytes)
+            if magic != self.MAGIC or version != self.VERSION:
+                return None
+            if os.path.getsize(self.index_path) < self.HEADER.size + entry_count * self.ENTRY.size:
+                return None # Truncated entry area
+            return entry_count, data_size
+        except FileNotFoundError:
+            return None
+        except (OSError, struct.error) as e:
+            logger.warning(f"Could not read index header '{self.index_path}': {e}")
+            return None
+
+    def reset(self, data_size: int = 0):
+        """Creates (or truncates) the index file with no entries."""
+        with open(self.index_path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, 0, data_size))
+
+    def append(self, entries: List[Tuple[int, int, bool]], data_size: int):
+        """
+        Appends (record_id, offset, validation) entries and records the data file size
+        they cover. Entries beyond the stored count (left by an interrupted append) are overwritten.
+        """
+        header = self.read_header()
+        if header is None:
+            raise DatabaseError(f"Index file '{self.index_path}' is missing or corrupt.")
+        entry_count = header[0]
+        with open(self.index_path, 'r+b') as f:
+            f.seek(self.HEADER.size + entry_count * self.ENTRY.size)
+            f.write(b''.join(self.ENTRY.pack(record_id, offset, valid) for record_id, offset, valid in entries))
+            f.truncate()
+            f.seek(0)
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, entry_count + len(entries), data_size))
+
+    def _find_position(self, f, entry_count: int, record_id: int) -> Optional[int]:
+        """Returns the entry position holding record_id, or None."""
+        def id_at(position: int) -> int:
+            f.seek(self.HEADER.size + position * self.ENTRY.size)
+            return self.ENTRY.unpack(f.read(self.ENTRY.size))[0]
+
+        # Fast path: IDs are sequential, so record N is normally entry N-1
+        guess = record_id - 1
+        if 0 <= guess < entry_count and id_at(guess) == record_id:
+            return guess
+
+        low, high = 0, entry_count - 1
+        while low <= high:
+            middle = (low + high) // 2
+            middle_id = id_at(middle)
+            if middle_id == record_id:
+                return middle
+            if middle_id < record_id:
+                low = middle + 1
+            else:
+                high = middle - 1
+        return None
+
+    def lookup(self, record_id: int) -> Optional[Tuple[int, bool]]:
+        """Returns (offset, validation) for record_id, or None if it is not indexed."""
+        header = self.read_header()
+        if header is None:
+            return None
+        with open(self.index_path, 'rb') as f:
+            position = self._find_position(f, header[0], record_id)
+            if position is None:
+                return None
+            f.seek(self.HEADER.size + position * self.ENTRY.size)
+            _, offset, valid = self.ENTRY.unpack(f.read(self.ENTRY.size))
+            return offset, valid
+
+    def set_validation(self, record_id: int, validation_flag: bool) -> bool:
+        """Updates the validation flag stored for record_id. Returns False if it is not indexed."""
+        header = self.read_header()
+        if header is None:
+            return False
+        with open(self.index_path, 'r+b') as f:
+            position = self._find_position(f, header[0], record_id)
+            if position is None:
+                return False
+            # Flag is the last field of the entry: 4 bytes (ID) + 8 bytes (offset)
+            f.seek(self.HEADER.size + position * self.ENTRY.size + 12)
+            f.write(struct.pack('?', validation_flag))
+            return True
+
+# --- PageCheckpointTable Class ---
+class PageCheckpointTable:
+    """
+    Sparse record ordinal -> offset table for the database file (.pgx).
+    Stores the byte offset of every PAGE_CHECKPOINT_INTERVAL-th record, so a page
+    can be served by seeking to the nearest checkpoint and skipping fewer than
+    PAGE_CHECKPOINT_INTERVAL record headers. Shares the RecordIndex sync protocol.
+    """
+    HEADER = struct.Struct('<4sHIIQ') # Magic, version, interval, record count, indexed data file size
+    CHECKPOINT = struct.Struct('<Q')   # Record start offset
+    MAGIC = b'TAPG'
+    VERSION = 1
+
+    def __init__(self, table_path: str, interval: int = PAGE_CHECKPOINT_INTERVAL):
+        self.table_path = table_path
+        self.interval = interval
+
+    def read_header(self) -> Optional[Tuple[int, int]]:
+        """Returns (record_count, indexed_data_size), or None if the table is missing, corrupt or uses another interval."""
+        try:
+            with open(self.table_path, 'rb') as f:
+                header_bytes = f.read(self.HEADER.size)
+            if len(header_bytes) != self.HEADER.size:
+                return None
+            magic, version, interval, record_count, data_size = self.HEADER.unpack(header_bytes)
+            if magic != self.MAGIC or version != self.VERSION or interval != self.interval:
+                return None
+            if os.path.getsize(self.table_path) < self.HEADER.size + self._checkpoint_count(record_count) * self.CHECKPOINT.size:
+                return None # Truncated checkpoint area
+            return record_count, data_size
+        except FileNotFoundError:
+            return None
+        except (OSError, struct.error) as e:
+            logger.warning(f"Could not read page table header '{self.table_path}': {e}")
+            return None
+
+    def _checkpoint_count(self, record_count: int) -> int:
+        """Number of checkpoints stored for record_count records (ordinals 0, K, 2K, ...)."""
+        return (record_count + self.interval - 1) // self.interval
+
+    def reset(self, data_size: int = 0):
+        """Creates (or truncates) the table file with no records."""
+        with open(self.table_path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.interval, 0, data_size))
+
+    def append(self, entries: List[Tuple[int, int, bool]], data_size: int):
+        """
+        Accounts for appended (record_id, offset, validation) entries, storing a checkpoint
+        for every record whose ordinal is a multiple of the interval.
+        """
+        header = self.read_header()
+        if header is None:
+            raise DatabaseError(f"Page table file '{self.table_path}' is missing or corrupt.")
+        record_count = header[0]
+        checkpoints = [
+            self.CHECKPOINT.pack(offset)
+            for ordinal, (_, offset, _) in enumerate(entries, record_count)
+            if ordinal % self.interval == 0
+        ]
+        with open(self.table_path, 'r+b') as f:
+            f.seek(self.HEADER.size + self._checkpoint_count(record_count) * self.CHECKPOINT.size)
+            f.write(b''.join(checkpoints))
+            f.truncate()
+            f.seek(0)
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.interval, record_count + len(entries), data_size))
+
+    def checkpoint_for(self, ordinal: int) -> Optional[Tuple[int, int]]:
+        """
+        Returns (checkpoint_ordinal, offset) of the nearest checkpoint at or before the
+        0-based record ordinal, or None if the ordinal is past the last record.
+        """
+        header = self.read_header()
+        if header is None or ordinal >= header[0]:
+            return None
+        checkpoint_number = ordinal // self.interval
+        with open(self.table_path, 'rb') as f:
+            f.seek(self.HEADER.size + checkpoint_number * self.CHECKPOINT.size)
+            offset = self.CHECKPOINT.unpack(f.read(self.CHECKPOINT.size))[0]
+        return checkpoint_number * self.interval, offset
+
+# --- SecondaryIndex Class ---
+class BPlusTreeNode:
+    """
+    One page of a SecondaryIndex tree. Leaves hold sorted (key, record_id, offset) entries and
+    the page of the next leaf (0 = last); internal nodes hold (key, record_id) separators and
+    the child pages between them.
+    """
+
+    def __init__(self, is_leaf: bool, keys: Optional[List[tuple]] = None,
+                 children: Optional[List[int]] = None, next_leaf: int = 0):
+        self.is_leaf = is_leaf
+        self.keys = keys if keys is not None else []
+        self.children = children if children is not None else []
+        self.next_leaf = next_leaf
+
+class SecondaryIndex:
+    """
+    Disk-backed B+tree secondary indexes (.btr) over crash_date, crash_hour and injuries_total,
+    one tree per field in a single file of fixed-size pages (page 0 is the header).
+    Keys are integers (epoch days, hours, injuries in hundredths) made unique by the record ID;
+    leaf entries carry the record offset and leaves are chained for range scans.
+    Every record is indexed, valid or not: validity is read from the record header.
+    Removals do not rebalance, so leaves may underflow until the next bulk rebuild.
+    The header records the data file size the trees cover and is marked unclean while
+    pages are rewritten, so an interrupted update is detected and rebuilt.
+    Must be used with the database lock held.
+    """
+    PAGE_SIZE = 4096
+    HEADER = struct.Struct('<4sH?xIQ') # Magic, version, clean flag, page count, indexed data size
+    TREE = struct.Struct('<IQ')         # Root page, entry count (one per field, after the header)
+    NODE = struct.Struct('<?HI')        # Leaf flag, key count, next leaf page
+    LEAF_ENTRY = struct.Struct('<qIQ')  # Key, record ID, record offset
+    SEPARATOR = struct.Struct('<qI')    # Key, record ID
+    CHILD = struct.Struct('<I')
+    LEAF_CAPACITY = (PAGE_SIZE - NODE.size) // LEAF_ENTRY.size
+    INTERNAL_CAPACITY = (PAGE_SIZE - NODE.size - CHILD.size) // (SEPARATOR.size + CHILD.size)
+    MAGIC = b'TABT'
+    VERSION = 1
+    FIELDS = ['crash_date', 'crash_hour', 'injuries_total']
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self._file = None # Open file of the update in progress
+        self._cache: Dict[int, BPlusTreeNode] = {}
+        self._dirty: Set[int] = set()
+        self._page_count = 0
+        self._data_size = 0
+        self._roots: Dict[str, int] = {}
+        self._counts: Dict[str, int] = {}
+
+    @staticmethod
+    def key_for(field: str, value: Any) -> int:
+        """Integer key of a field value: dates ('YYYY-MM-DD' or date) as epoch days, injuries in hundredths."""
+        if field == 'crash_date':
+            if isinstance(value, date):
+                return value.toordinal() - BinaryRecordCodec.EPOCH_ORDINAL
+            return date.fromisoformat(value).toordinal() - BinaryRecordCodec.EPOCH_ORDINAL if value else BinaryRecordCodec.NO_DATE
+        if field == 'injuries_total':
+            return round(float(value) * 100)
+        return int(value)
+
+    def _read_state(self, f) -> bool:
+        """Loads the header; False if it is missing, corrupt or marked unclean."""
+        f.seek(0)
+        header_bytes = f.read(self.HEADER.size + self.TREE.size * len(self.FIELDS))
+        if len(header_bytes) != self.HEADER.size + self.TREE.size * len(self.FIELDS):
+            return False
+        magic, version, clean, page_count, data_size = self.HEADER.unpack_from(header_bytes)
+        if (magic, version) != (self.MAGIC, self.VERSION) or not clean:
+            return False
+        self._page_count, self._data_size = page_count, data_size
+        for number, field in enumerate(self.FIELDS):
+            self._roots[field], self._counts[field] = self.TREE.unpack_from(header_bytes, self.HEADER.size + number * self.TREE.size)
+        return True
+
+    def _write_state(self, f, clean: bool):
+        f.seek(0)
+        f.write(self.HEADER.pack(self.MAGIC, self.VERSION, clean, self._page_count, self._data_size)
+                + b''.join(self.TREE.pack(self._roots[field], self._counts[field]) for field in self.FIELDS))
+
+    def read_header(self) -> Optional[Tuple[int, int]]:
+        """Returns (indexed record count, indexed data size), or None if the file is missing or unusable."""
+        try:
+            with open(self.index_path, 'rb') as f:
+                if not self._read_state(f):
+                    return None
+        except FileNotFoundError:
+            return None
+        return self._counts[self.FIELDS[0]], self._data_size
+
+    def _encode_node(self, node: BPlusTreeNode) -> bytes:
+        page = bytearray(self.PAGE_SIZE)
+        self.NODE.pack_into(page, 0, node.is_leaf, len(node.keys), node.next_leaf)
+        position = self.NODE.size
+        if node.is_leaf:
+            for entry in node.keys:
+                self.LEAF_ENTRY.pack_into(page, position, *entry)
+                position += self.LEAF_ENTRY.size
+        else:
+            for child in node.children:
+                self.CHILD.pack_into(page, position, child)
+                position += self.CHILD.size
+            for separator in node.keys:
+                self.SEPARATOR.pack_into(page, position, *separator)
+                position += self.SEPARATOR.size
+        return bytes(page)
+
+    def _load_node(self, f, page_id: int) -> BPlusTreeNode:
+        """Reads and decodes a page. Raises DatabaseError for pages outside the file or corrupt ones."""
+        if not 0 < page_id < self._page_count:
+            raise DatabaseError(f"Invalid page {page_id} in secondary index '{self.index_path}'.")
+        f.seek(page_id * self.PAGE_SIZE)
+        page = f.read(self.PAGE_SIZE)
+        if len(page) != self.PAGE_SIZE:
+            raise DatabaseError(f"Truncated page {page_id} in secondary index '{self.index_path}'.")
+        is_leaf, count, next_leaf = self.NODE.unpack_from(page)
+        position = self.NODE.size
+        if is_leaf:
+            if count > self.LEAF_CAPACITY:
+                raise DatabaseError(f"Corrupt leaf page {page_id} in secondary index '{self.index_path}'.")
+            return BPlusTreeNode(True, list(self.LEAF_ENTRY.iter_unpack(page[position:position + count * self.LEAF_ENTRY.size])),
+                                 next_leaf=next_leaf)
+        if count > self.INTERNAL_CAPACITY:
+            raise DatabaseError(f"Corrupt internal page {page_id} in secondary index '{self.index_path}'.")
+        children = [child for (child,) in self.CHILD.iter_unpack(page[position:position + (count + 1) * self.CHILD.size])]
+        position += (count + 1) * self.CHILD.size
+        return BPlusTreeNode(False, list(self.SEPARATOR.iter_unpack(page[position:position + count * self.SEPARATOR.size])), children)
+
+    def _read_node(self, page_id: int) -> BPlusTreeNode:
+        """Returns a page of the update in progress, from the operation cache when possible."""
+        node = self._cache.get(page_id)
+        if node is None:
+            node = self._cache[page_id] = self._load_node(self._file, page_id)
+        return node
+
+    def _allocate(self, node: BPlusTreeNode) -> int:
+        page_id = self._page_count
+        self._page_count += 1
+        self._cache[page_id] = node
+        self._dirty.add(page_id)
+        return page_id
+
+    @contextmanager
+    def _update(self):
+        """
+        Runs a modification: the header is marked unclean, then the changed pages and the
+        final header are written. An exception leaves the file unclean, to be rebuilt.
+        """
+        with open(self.index_path, 'r+b') as f:
+            if not self._read_state(f):
+                raise DatabaseError(f"Secondary index '{self.index_path}' is corrupt or was left mid-update.")
+            self._write_state(f, clean=False)
+            self._file = f
+            try:
+                yield
+                for page_id in sorted(self._dirty):
+                    f.seek(page_id * self.PAGE_SIZE)
+                    f.write(self._encode_node(self._cache[page_id]))
+                self._write_state(f, clean=True)
+            finally:
+                self._file = None
+                self._cache.clear()
+                self._dirty.clear()
+
+    def reset(self, data_size: int = 0):
+        """Recreates the file with empty trees covering data_size bytes."""
+        self.bulk_load({}, data_size)
+
+    def bulk_load(self, entries: Dict[str, List[Tuple[int, int, int]]], data_size: int):
+        """
+        Rewrites the file with trees built bottom-up from the (key, record_id, offset) entries
+        of each field: full leaves written in key order, then each internal level above them.
+        """
+        self._cache.clear()
+        self._dirty.clear()
+        with open(self.index_path, 'wb') as f:
+            f.write(bytes(self.PAGE_SIZE)) # Header page, written last
+            self._page_count = 1
+            for field in self.FIELDS:
+                field_entries = sorted(entries.get(field, ()))
+                self._counts[field] = len(field_entries)
+                chunks = [field_entries[start:start + self.LEAF_CAPACITY]
+                          for start in range(0, len(field_entries), self.LEAF_CAPACITY)] or [[]]
+                level = [] # (lowest separator, page) of each node of the level being built
+                for number, chunk in enumerate(chunks):
+                    next_leaf = self._page_count + 1 if number + 1 < len(chunks) else 0
+                    f.write(self._encode_node(BPlusTreeNode(True, chunk, next_leaf=next_leaf)))
+                    level.append((chunk[0][:2] if chunk else None, self._page_count))
+                    self._page_count += 1
+                while len(level) > 1:
+                    parents = []
+                    for start in range(0, len(level), self.INTERNAL_CAPACITY + 1):
+                        group = level[start:start + self.INTERNAL_CAPACITY + 1]
+                        f.write(self._encode_node(BPlusTreeNode(False, [separator for separator, _ in group[1:]],
+                                                                [page_id for _, page_id in group])))
+                        parents.append((group[0][0], self._page_count))
+                        self._page_count += 1
+                    level = parents
+                self._roots[field] = level[0][1]
+            self._data_size = data_size
+            self._write_state(f, clean=True)
+
+    def _insert_into(self, page_id: int, entry: Tuple[int, int, int]) -> Optional[Tuple[Tuple[int, int], int]]:
+        """Inserts below page_id; returns (separator, new right page) if the node had to split."""
+        node = self._read_node(page_id)
+        self._dirty.add(page_id)
+        if node.is_leaf:
+            bisect.insort(node.keys, entry)
+            if len(node.keys) <= self.LEAF_CAPACITY:
+                return None
+            middle = len(node.keys) // 2
+            right = BPlusTreeNode(True, node.keys[middle:], next_leaf=node.next_leaf)
+            node.keys = node.keys[:middle]
+            node.next_leaf = self._allocate(right)
+            return right.keys[0][:2], node.next_leaf
+
+        position = bisect.bisect_right(node.keys, entry[:2])
+        split = self._insert_into(node.children[position], entry)
+        if split is None:
+            return None
+        node.keys.insert(position, split[0])
+        node.children.insert(position + 1, split[1])
+        if len(node.keys) <= self.INTERNAL_CAPACITY:
+            return None
+        middle = len(node.keys) // 2
+        separator = node.keys[middle]
+        right = BPlusTreeNode(False, node.keys[middle + 1:], node.children[middle + 1:])
+        node.keys = node.keys[:middle]
+        node.children = node.children[:middle + 1]
+        return separator, self._allocate(right)
+
+    def _insert(self, field: str, entry: Tuple[int, int, int]):
+        split = self._insert_into(self._roots[field], entry)
+        if split is not None: # Root split: the tree grows one level
+            self._roots[field] = self._allocate(BPlusTreeNode(False, [split[0]], [self._roots[field], split[1]]))
+        self._counts[field] += 1
+
+    def _remove(self, field: str, key: int, record_id: int) -> bool:
+        """Removes the entry of record_id under key from its leaf, without rebalancing."""
+        target = (key, record_id)
+        page_id = self._roots[field]
+        node = self._read_node(page_id)
+        while not node.is_leaf:
+            page_id = node.children[bisect.bisect_right(node.keys, target)]
+            node = self._read_node(page_id)
+        position = bisect.bisect_left(node.keys, target)
+        if position == len(node.keys) or node.keys[position][:2] != target:
+            return False
+        del node.keys[position]
+        self._dirty.add(page_id)
+        self._counts[field] -= 1
+        return True
+
+    def add(self, entries: Dict[str, List[Tuple[int, int, int]]], data_size: int):
+        """Inserts (key, record_id, offset) entries per field and records the new indexed data size."""
+        with self._update():
+            for field, field_entries in entries.items():
+                for entry in sorted(field_entries): # Key order keeps the touched pages together
+                    self._insert(field, entry)
+            self._data_size = data_size
+
+    def replace(self, record_id: int, offset: int, old_keys: Dict[str, int], new_keys: Dict[str, int]):
+        """Moves a record rewritten in place from its old keys to its new ones."""
+        with self._update():
+            for field in self.FIELDS:
+                if old_keys[field] == new_keys[field]:
+                    continue
+                if not self._remove(field, old_keys[field], record_id):
+                    raise DatabaseError(f"Record {record_id} missing from the '{field}' secondary index.")
+                self._insert(field, (new_keys[field], record_id, offset))
+
+    def scan(self, field: str, low_key: Optional[int] = None, high_key: Optional[int] = None) -> Iterator[Tuple[int, int, int]]:
+        """Yields the (key, record_id, offset) entries with low_key <= key <= high_key, in key order."""
+        with open(self.index_path, 'rb') as f:
+            if not self._read_state(f):
+                raise DatabaseError(f"Secondary index '{self.index_path}' is corrupt or was left mid-update.")
+            target = (low_key, 0) if low_key is not None else None
+            node = self._load_node(f, self._roots[field])
+            while not node.is_leaf:
+                node = self._load_node(f, node.children[bisect.bisect_right(node.keys, target) if target else 0])
+            position = bisect.bisect_left(node.keys, target) if target else 0
+            while True:
+                for entry in itertools.islice(node.keys, position, None):
+                    if high_key is not None and entry[0] > high_key:
+                        return
+                    yield entry
+                if not node.next_leaf:
+                    return
+                node = self._load_node(f, node.next_leaf)
+                position = 0
+
+class RecordBatch:
+    """
+    Buffered appender handed out by TrafficAccidentsDB.transaction().
+    Assigns sequential IDs and packs record headers; the owning transaction
+    writes the last ID header, fsyncs and updates the indexes once on commit.
+    """
+
+    def __init__(self, file_obj, first_id: int, codec: str = CODEC_JSON, symbols: Optional[SymbolTable] = None):
+        self._file = file_obj
+        self._codec = codec
+        self._symbols = symbols
+        self.next_id = first_id
+        self.index_entries: List[Tuple[int, int, bool]] = [] # (record_id, offset, validation) per appended record
+
+    @property
+    def last_id(self) -> int:
+        """ID of the last record appended so far (or the previous last ID if none)."""
+        return self.next_id - 1
+
+    def add(self, data_object: DataObject) -> int:
+        """
+        Appends a DataObject to the batch, storing its current validation state as the record flag.
+        Returns the ID assigned to the record.
+        """
+        obj_bytes = data_object.to_bytes(self._codec, self._symbols)
+        validation_flag = data_object.validate()
+        record_id = self.next_id
+        self.index_entries.append((record_id, self._file.tell(), validation_flag))
+        self._file.write(TrafficAccidentsDB.RECORD_HEADER.pack(record_id, validation_flag, len(obj_bytes)))
+        self._file.write(obj_bytes)
+        self.next_id += 1
+        return record_id
+
+class RecordFilter:
+    """
+    Compiled where-clause of TrafficAccidentsDB.iter_records: field name -> value (equality)
+    or predicate on the field value. Conditions on the numeric block and on the symbol codes
+    of binary records are checked on the raw bytes; the rest after decoding.
+    Must be built with the database lock held (symbol codes are resolved up front).
+    """
+
+    def __init__(self, where: Dict[str, Any], symbols: SymbolTable):
+        self.conditions: Dict[str, Callable[[Any], bool]] = {
+            field: condition if callable(condition) else (lambda value, expected=condition: value == expected)
+            for field, condition in where.items()
+        }
+        self.fixed_fields = [field for field in self.conditions if field in BinaryRecordCodec.FIXED_FIELDS]
+        # Symbol codes whose value passes the condition: one set lookup per record instead of a decode
+        self.accepted_codes = {field: symbols.codes_matching(field, self.conditions[field])
+                               for field in self.conditions if field in SymbolTable.FIELDS}
+        self.all_fields = tuple(self.conditions)
+
+    def check_raw(self, byte_data: bytes) -> Optional[Tuple[str, ...]]:
+        """
+        Checks the conditions that can be decided from the stored bytes.
+        Returns None if the record is rejected, otherwise the fields still to check after decoding.
+        """
+        fixed_values = BinaryRecordCodec.fixed_values(byte_data)
+        if fixed_values is None: # JSON record
+            return self.all_fields
+        for field in self.fixed_fields:
+            if not self.conditions[field](fixed_values[field]):
+                return None
+        decided = set(self.fixed_fields)
+        symbol_codes = BinaryRecordCodec.symbol_codes(byte_data)
+        if symbol_codes:
+            for field, accepted in self.accepted_codes.items():
+                code = symbol_codes[field]
+                if code: # Code 0 is an inline value, checked after decoding
+                    if code not in accepted:
+                        return None
+                    decided.add(field)
+        return tuple(field for field in self.all_fields if field not in decided)
+
+    def matches(self, data_object: DataObject, fields: Iterable[str]) -> bool:
+        """Checks the given conditions against a decoded record."""
+        return all(self.conditions[field](getattr(data_object, field)) for field in fields)
+
+class WriteAheadLog:
+    """
+    Append-only undo/redo journal for the database file (.wal).
+    Every entry carries a CRC32 and the ID of the transaction it belongs to; a transaction
+    is finished once its COMMIT (or ABORT) entry is on disk. The data file is fsynced
+    before COMMIT, so a checkpoint only has to truncate the journal.
+    """
+    ENTRY = struct.Struct('<IQBQI') # CRC32, transaction ID, entry type, data file offset, payload length
+    APPEND = 1 # Records appended at offset; payload = previous last ID header (undo: truncate)
+    WRITE = 2  # In-place overwrite at offset; payload = before image + after image
+    COMMIT = 3
+    ABORT = 4
+
+    def __init__(self, wal_path: str):
+        self.wal_path = wal_path
+
+    def size(self) -> int:
+        """Current journal size in bytes (0 if the journal does not exist)."""
+        try:
+            return os.path.getsize(self.wal_path)
+        except FileNotFoundError:
+            return 0
+
+    def begin(self) -> int:
+        """
+        Returns a new transaction ID. The journal offset is unique until the next
+        checkpoint, and no transaction survives a checkpoint.
+        """
+        return self.size() + 1
+
+    def log(self, txid: int, entry_type: int, offset: int = 0, payload: bytes = b''):
+        """Appends one checksummed entry and fsyncs the journal before the caller touches the data file."""
+        body = self.ENTRY.pack(0, txid, entry_type, offset, len(payload))[4:] + payload
+        with open(self.wal_path, 'ab') as f:
+            f.write(struct.pack('<I', zlib.crc32(body)) + body)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read_entries(self) -> List[Tuple[int, int, int, bytes]]:
+        """
+        Returns the (txid, entry_type, offset, payload) entries in log order.
+        Stops at the first torn or corrupt entry, which can only be the tail of an interrupted write.
+        """
+        entries = []
+        try:
+            with open(self.wal_path, 'rb') as f:
+                while True:
+                    entry_start = f.tell()
+                    header_bytes = f.read(self.ENTRY.size)
+                    if not header_bytes:
+                        break
+                    if len(header_bytes) != self.ENTRY.size:
+                        logger.warning(f"Torn journal entry at offset {entry_start} of '{self.wal_path}'. Ignoring the tail.")
+                        break
+                    crc, txid, entry_type, offset, payload_len = self.ENTRY.unpack(header_bytes)
+                    payload = f.read(payload_len)
+                    if len(payload) != payload_len or zlib.crc32(header_bytes[4:] + payload) != crc:
+                        logger.warning(f"Corrupt journal entry at offset {entry_start} of '{self.wal_path}'. Ignoring the tail.")
+                        break
+                    entries.append((txid, entry_type, offset, payload))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def checkpoint(self):
+        """Discards all journal entries. Only valid when every logged transaction is finished."""
+        with open(self.wal_path, 'wb') as f:
+            f.flush()
+            os.fsync(f.fileno())
+
 # --- TrafficAccidentsDB Class ---
 class TrafficAccidentsDB:
     """
     Handles all database operations for traffic accident records.
     Implements file-based storage with robust locking, backups, and error recovery.
     """
+    RECORD_HEADER = struct.Struct('<I?I') # Record ID, validation flag, data size
     
     def __init__(self, db_path: str = DB_FILE):
         self.db_path = db_path
@@ -492,6 +1538,19 @@ class TrafficAccidentsDB:
         self._ensure_directories()
         self._last_read_id = 0 # To track the last ID in the file header
         self._lock = filelock.FileLock(self.lock_file_path) # Initialize filelock
+        self.index_path = os.path.splitext(self.db_path)[0] + '.idx' # IDX_FILE for the default database
+        self.id_index = RecordIndex(self.index_path)
+        self.page_table_path = os.path.splitext(self.db_path)[0] + '.pgx' # PGX_FILE for the default database
+        self.page_table = PageCheckpointTable(self.page_table_path)
+        self.secondary_index_path = os.path.splitext(self.db_path)[0] + '.btr' # BTR_FILE for the default database
+        self.secondary_index = SecondaryIndex(self.secondary_index_path)
+        self.wal_path = os.path.splitext(self.db_path)[0] + '.wal' # WAL_FILE for the default database
+        self.wal = WriteAheadLog(self.wal_path)
+        self._active_txid: Optional[int] = None # Journal transaction of the mutation in progress
+        self.meta_path = os.path.splitext(self.db_path)[0] + '.meta' # META_FILE for the default database
+        self.symbols = SymbolTable(os.path.splitext(self.db_path)[0] + '.sym') # SYM_FILE for the default database
+        self.columns_dir = os.path.splitext(self.db_path)[0] + '_columns' # COLUMNS_DIR for the default database
+        self._recover_journal()
 
     def _ensure_directories(self):
         """Ensures the database and backup directories exist with appropriate permissions."""
@@ -532,28 +1591,33 @@ class TrafficAccidentsDB:
             logger.error(f"Error releasing file lock: {e}")
             # Don't re-raise, as it might prevent cleanup
 
-    def _create_backup(self):
+    def _create_backup(self, prefix: str = "backup") -> Optional[str]:
         """
-        Creates a timestamped backup of the database file and manages backup rotation.
-        Keeps only the last MAX_BACKUPS.
+        Creates a timestamped backup of the database file, together with its symbol table
+        and settings (same name with .sym/.meta, as binary records cannot be decoded without
+        them), and manages backup rotation.
+        Keeps only the last MAX_BACKUPS with the given prefix. Returns the backup path (None if there is no database).
         """
         try:
             if not os.path.exists(self.db_path):
                 logger.info("No database file found to backup.")
-                return
+                return None
             
             # Clean up old backups first
-            backups = sorted(Path(BACKUP_DIR).glob("backup_*.db"))
+            backups = sorted(Path(BACKUP_DIR).glob(f"{prefix}_*.db"))
             while len(backups) >= MAX_BACKUPS:
                 oldest = backups.pop(0)
-                try:
-                    os.unlink(oldest)
-                    logger.info(f"Removed old backup: {oldest}")
-                except OSError as e:
-                    logger.warning(f"Could not remove old backup '{oldest}': {e}")
+                for old_file in (oldest, oldest.with_suffix('.sym'), oldest.with_suffix('.meta')):
+                    try:
+                        os.unlink(old_file)
+                        logger.info(f"Removed old backup: {old_file}")
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        logger.warning(f"Could not remove old backup '{old_file}': {e}")
 
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_path = os.path.join(BACKUP_DIR, f"backup_{timestamp}.db")
+            backup_path = os.path.join(BACKUP_DIR, f"{prefix}_{timestamp}.db")
             
             with open(self.db_path, 'rb') as src:
                 with open(backup_path, 'wb') as dst:
@@ -562,12 +1626,412 @@ class TrafficAccidentsDB:
                         if not chunk:
                             break
                         dst.write(chunk)
+            for sidecar_path in (self.symbols.table_path, self.meta_path):
+                if os.path.exists(sidecar_path):
+                    shutil.copy2(sidecar_path, os.path.splitext(backup_path)[0] + os.path.splitext(sidecar_path)[1])
             
             logger.info(f"Created database backup: {backup_path}")
+            return backup_path
         except Exception as e:
             logger.error(f"Backup failed: {traceback.format_exc()}")
             raise DatabaseError(f"Failed to create database backup: {str(e)}")
 
+    def _apply_journal_entries(self, entries: List[Tuple[int, int, int, bytes]], undo: bool) -> int:
+        """
+        Applies journal entries to the data file: before images newest first (undo=True)
+        or after images oldest first (undo=False). Redo only overwrites bytes that still
+        hold the before image, so a journal that no longer matches the file is not replayed.
+        Returns the number of entries applied.
+        """
+        if not os.path.exists(self.db_path):
+            return 0
+        applied = 0
+        with open(self.db_path, 'r+b') as f:
+            for txid, entry_type, offset, payload in (reversed(entries) if undo else entries):
+                if entry_type == WriteAheadLog.APPEND:
+                    if undo and f.seek(0, os.SEEK_END) >= offset:
+                        f.truncate(offset) # Drop the records appended by the transaction
+                        if payload:
+                            f.seek(0)
+                            f.write(payload) # Restore the previous last ID header
+                        applied += 1
+                elif entry_type == WriteAheadLog.WRITE:
+                    image_size = len(payload) // 2
+                    before_image, after_image = payload[:image_size], payload[image_size:]
+                    f.seek(offset)
+                    if not undo and f.read(image_size) != before_image:
+                        continue # Already applied, or the bytes belong to another file
+                    f.seek(offset)
+                    f.write(before_image if undo else after_image)
+                    applied += 1
+            f.flush()
+            os.fsync(f.fileno())
+        return applied
+
+    def _recover_journal(self):
+        """
+        Replays the journal left behind by an interrupted process: in-place writes of
+        committed transactions are redone, unfinished transactions are undone, and the
+        journal is checkpointed.
+        """
+        try:
+            self._acquire_lock()
+            if self.wal.size() == 0:
+                return
+            entries = self.wal.read_entries()
+            committed = {txid for txid, entry_type, _, _ in entries if entry_type == WriteAheadLog.COMMIT}
+            finished = committed | {txid for txid, entry_type, _, _ in entries if entry_type == WriteAheadLog.ABORT}
+            redone = self._apply_journal_entries([e for e in entries if e[0] in committed], undo=False)
+            undone = self._apply_journal_entries([e for e in entries if e[0] not in finished], undo=True)
+            self.wal.checkpoint()
+            if redone or undone:
+                logger.warning(f"Journal recovery on '{self.db_path}': {redone} change(s) redone, {undone} change(s) undone.")
+                self.rebuild_index()
+        except FileLockError:
+            raise
+        except Exception as e:
+            logger.critical(f"Journal recovery failed: {traceback.format_exc()}")
+            raise DatabaseError(f"Failed to recover database journal: {str(e)}")
+        finally:
+            self._release_lock()
+
+    @contextmanager
+    def _journaled(self) -> Iterator[int]:
+        """
+        Runs a mutation as one journal transaction and yields its ID; nested calls join the
+        open transaction. A clean exit logs COMMIT (checkpointing once the journal grows past
+        WAL_CHECKPOINT_SIZE); an exception undoes the logged changes and logs ABORT.
+        Must be called with the lock held.
+        """
+        if self._active_txid is not None:
+            yield self._active_txid
+            return
+        txid = self.wal.begin()
+        self._active_txid = txid
+        try:
+            yield txid
+        except BaseException:
+            self._active_txid = None
+            try:
+                self.symbols.refresh() # Drop symbol codes assigned by the rolled back records
+                entries = [entry for entry in self.wal.read_entries() if entry[0] == txid]
+                if entries:
+                    self._apply_journal_entries(entries, undo=True)
+                    self.wal.log(txid, WriteAheadLog.ABORT)
+                    # Indexes may describe the undone changes; they are rebuilt on next use
+                    self.id_index.reset()
+                    self.page_table.reset()
+                    self.secondary_index.reset()
+            except Exception:
+                logger.error(f"Rollback of transaction {txid} failed, it will be undone on next open: {traceback.format_exc()}")
+            raise
+        self._active_txid = None
+        if self.wal.size() >= txid: # Something was logged
+            self.wal.log(txid, WriteAheadLog.COMMIT)
+            if self.wal.size() > WAL_CHECKPOINT_SIZE:
+                self.wal.checkpoint()
+
+    def checkpoint(self):
+        """Truncates the journal. Every committed change is already fsynced to the data file."""
+        try:
+            self._acquire_lock()
+            self.wal.checkpoint()
+            logger.info(f"Journal '{self.wal_path}' checkpointed.")
+        except FileLockError:
+            raise
+        except Exception as e:
+            logger.error(f"Error checkpointing journal: {traceback.format_exc()}")
+            raise DatabaseError(f"Failed to checkpoint journal: {str(e)}")
+        finally:
+            self._release_lock()
+
+    def create_snapshot(self) -> Optional[str]:
+        """
+        Takes a full backup of the database file (explicit or scheduled admin action).
+        Returns the backup path, or None if there is no database yet.
+        """
+        try:
+            self._acquire_lock()
+            self.wal.checkpoint()
+            return self._create_backup()
+        except (FileLockError, DatabaseError):
+            raise
+        except Exception as e:
+            logger.error(f"Error creating snapshot: {traceback.format_exc()}")
+            raise DatabaseError(f"Failed to create snapshot: {str(e)}")
+        finally:
+            self._release_lock()
+
+    def snapshot_if_due(self, interval_hours: float = SNAPSHOT_INTERVAL_HOURS) -> Optional[str]:
+        """
+        Creates a snapshot if the newest backup is older than interval_hours (or missing).
+        Returns the new backup path, or None if no snapshot was needed.
+        """
+        backups = sorted(Path(BACKUP_DIR).glob("backup_*.db"))
+        if backups and time.time() - os.path.getmtime(backups[-1]) < interval_hours * 3600:
+            return None
+        return self.create_snapshot()
+
+    def _check_symbol_codes(self, data_path: str, table_path: Optional[str]):
+        """
+        Verifies that every symbol code used by the binary records of data_path is defined
+        by the symbol table at table_path (None = no table). Raises DatabaseError otherwise.
+        """
+        symbols = None
+        if table_path is not None:
+            symbols = SymbolTable(table_path)
+            symbols.refresh()
+        for _, record_id, _, payload in self._iter_mapped_records(strict=False, data_path=data_path):
+            symbol_codes = BinaryRecordCodec.symbol_codes(payload)
+            if not symbol_codes:
+                continue
+            for field, code in symbol_codes.items():
+                if not code:
+                    continue
+                if symbols is None:
+                    raise DatabaseError(f"Record ID {record_id} uses symbol codes, but no symbol table (.sym) was given with the data file.")
+                try:
+                    symbols.value(field, code)
+                except DatabaseError:
+                    raise DatabaseError(f"Record ID {record_id} uses symbol code {code} of '{field}', which the given symbol table does not define. "
+                                        f"It does not belong to this data file.")
+
+    def import_database(self, data_bytes: bytes, symbol_bytes: Optional[bytes] = None,
+                        meta_bytes: Optional[bytes] = None) -> Optional[str]:
+        """
+        Replaces the database with an uploaded data file and its symbol table (.sym) and
+        settings (.meta); a missing .sym/.meta leaves the database without one (defaults).
+        The new files are staged and checked first: a data file with binary records that the
+        given symbol table cannot decode is refused (DatabaseError) and nothing is replaced.
+        The current files are backed up together before the swap and the indexes are rebuilt.
+        Returns the backup path (None if there was no database).
+        """
+        staged = {self.db_path: data_bytes, self.symbols.table_path: symbol_bytes, self.meta_path: meta_bytes}
+        try:
+            self._acquire_lock()
+            for target_path, content in staged.items():
+                if content is not None:
+                    with open(target_path + '.import', 'wb') as f:
+                        f.write(content)
+                        f.flush()
+                        os.fsync(f.fileno())
+            self._check_symbol_codes(self.db_path + '.import',
+                                     self.symbols.table_path + '.import' if symbol_bytes is not None else None)
+
+            self.wal.checkpoint() # The journal describes the old file and must not be replayed on the new one
+            backup_path = self._create_backup(prefix="auto_backup_pre_import")
+            for target_path, content in staged.items():
+                if content is not None:
+                    os.replace(target_path + '.import', target_path)
+                elif os.path.exists(target_path):
+                    os.remove(target_path) # Belongs to the replaced database
+            self.symbols = SymbolTable(self.symbols.table_path)
+            self.rebuild_index() # Offsets of the previous file are no longer valid
+            logger.info(f"Database '{self.db_path}' imported ({len(data_bytes)} bytes, symbol table: {symbol_bytes is not None}, settings: {meta_bytes is not None}).")
+            return backup_path
+        except (FileLockError, DatabaseError):
+            raise
+        except Exception as e:
+            logger.error(f"Error importing database: {traceback.format_exc()}")
+            raise DatabaseError(f"Failed to import database: {str(e)}")
+        finally:
+            for target_path in staged:
+                if os.path.exists(target_path + '.import'):
+                    os.remove(target_path + '.import')
+            self._release_lock()
+
+    def _read_meta(self) -> Dict[str, Any]:
+        """Reads the database settings file; a missing or unreadable file means the defaults."""
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Could not read database settings '{self.meta_path}': {e}. Using defaults.")
+            return {}
+
+    def _write_meta(self, meta: Dict[str, Any]):
+        """Atomically replaces the database settings file."""
+        temp_path = self.meta_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.meta_path)
+
+    @property
+    def record_codec(self) -> str:
+        """Codec used for new records of this database (CODEC_JSON or CODEC_BINARY)."""
+        codec = self._read_meta().get('codec', DEFAULT_RECORD_CODEC)
+        return codec if codec in RECORD_CODECS else DEFAULT_RECORD_CODEC
+
+    def decode_record(self, data_bytes: bytes, trusted: bool = True) -> DataObject:
+        """
+        Rebuilds the DataObject of a stored record, resolving symbol codes with this database's table.
+        Trusted decoding (the default) skips validators and decodes symbol-coded fields lazily.
+        """
+        return DataObject.from_bytes(data_bytes, trusted=trusted, symbols=self.symbols)
+
+    def migrate_codec(self, codec: str, progress_callback: Optional[Callable[[int, int], None]] = None) -> int:
+        """
+        Rewrites every record of the database with the given codec, keeping IDs and
+        validation flags, and makes it the codec for new records.
+        The file is rebuilt next to the original and swapped in atomically.
+        Returns the number of migrated records.
+        """
+        if codec not in RECORD_CODECS:
+            raise ValueError(f"Unknown record codec '{codec}'. Expected one of {RECORD_CODECS}.")
+        temp_path = self.db_path + '.migrating'
+        migrated_count = 0
+        try:
+            self._acquire_lock()
+            if os.path.exists(self.db_path) and os.path.getsize(self.db_path) >= 4:
+                self.wal.checkpoint() # The journal describes the file being replaced
+                total_records = self.get_last_id()
+                self.symbols.refresh()
+                with open(self.db_path, 'rb') as src:
+                    last_id_header = src.read(4)
+                with open(temp_path, 'wb', buffering=WRITE_BUFFER_SIZE) as dst:
+                    dst.write(last_id_header)
+                    for _, record_id, validation_flag, payload in self._iter_mapped_records():
+                        data_obj = self.decode_record(payload)
+                        obj_bytes = data_obj.to_bytes(codec, self.symbols)
+                        dst.write(self.RECORD_HEADER.pack(record_id, validation_flag, len(obj_bytes)))
+                        dst.write(obj_bytes)
+                        migrated_count += 1
+                        if progress_callback:
+                            progress_callback(migrated_count, total_records)
+                    self.symbols.flush()
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.replace(temp_path, self.db_path)
+                self.rebuild_index() # Every record moved
+            meta = self._read_meta()
+            meta['codec'] = codec
+            self._write_meta(meta)
+            logger.info(f"Migrated {migrated_count} record(s) of '{self.db_path}' to the '{codec}' codec.")
+            return migrated_count
+        except FileLockError:
+            raise
+        except Exception as e:
+            logger.error(f"Error migrating record codec: {traceback.format_exc()}")
+            raise DatabaseError(f"Failed to migrate records to '{codec}': {str(e)}")
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path) # Leftover of a failed migration; the original file is untouched
+            self._release_lock()
+
+    def write_columnar_snapshot(self, snapshot_dir: Optional[str] = None) -> str:
+        """
+        Writes a column-store snapshot of the database: one .npy array per field (dates as
+        epoch days, strings dictionary-coded), the record IDs, a validity bitmap and a
+        manifest.json recording the data file it was taken from. The snapshot can be
+        memory-mapped by load_columnar_snapshot without per-row Python work.
+        Returns the snapshot directory.
+        """
+        snapshot_dir = snapshot_dir or self.columns_dir
+        temp_dir = snapshot_dir + '.tmp'
+        try:
+            self._acquire_lock()
+            source_state = self._data_file_state()
+            last_id = self.get_last_id()
+            record_ids, validity = [], []
+            column_values: Dict[str, list] = {field: [] for field in FIELDS}
+            for _, record_id, validation_flag, payload in self._iter_mapped_records():
+                data_obj = self.decode_record(payload)
+                record_ids.append(record_id)
+                validity.append(validation_flag)
+                for field in FIELDS:
+                    column_values[field].append(getattr(data_obj, field))
+
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            os.makedirs(temp_dir)
+            columns_manifest = {}
+            for field in FIELDS:
+                values = column_values[field]
+                if field == 'crash_date':
+                    # Epoch days as int64 so the array can be viewed as datetime64[D]; empty dates become NaT
+                    array = np.array([date.fromisoformat(value).toordinal() - BinaryRecordCodec.EPOCH_ORDINAL if value
+                                      else np.iinfo(np.int64).min for value in values], dtype=np.int64)
+                    spec = {'kind': 'date'}
+                elif field == 'intersection_related_i':
+                    array = np.array([value == "YES" for value in values], dtype=np.bool_)
+                    spec = {'kind': 'bool'}
+                elif field in BinaryRecordCodec.INJURY_FIELDS:
+                    array = np.array(values, dtype=np.float64)
+                    spec = {'kind': 'float'}
+                elif field == 'num_units':
+                    array = np.array(values, dtype=np.int32)
+                    spec = {'kind': 'int'}
+                elif field in ('crash_hour', 'crash_day_of_week', 'crash_month'):
+                    array = np.array(values, dtype=np.uint8)
+                    spec = {'kind': 'int'}
+                else:
+                    categories: Dict[str, int] = {}
+                    codes = [categories.setdefault(value, len(categories)) for value in values]
+                    array = np.array(codes, dtype=np.uint16 if len(categories) <= np.iinfo(np.uint16).max else np.int32)
+                    spec = {'kind': 'category', 'categories': list(categories)}
+                spec['file'] = f"{field}.npy"
+                np.save(os.path.join(temp_dir, spec['file']), array)
+                columns_manifest[field] = spec
+            np.save(os.path.join(temp_dir, 'id.npy'), np.array(record_ids, dtype=np.uint32))
+            np.save(os.path.join(temp_dir, 'valid.bits.npy'), np.packbits(np.array(validity, dtype=np.bool_)))
+            manifest = {
+                'format': 'traffic-accidents-columnar',
+                'version': 1,
+                'row_count': len(record_ids),
+                'source': {'db_path': self.db_path, 'last_id': last_id, **source_state},
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'columns': columns_manifest,
+            }
+            with open(os.path.join(temp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+            # Swap the new snapshot in place of the old one
+            old_dir = snapshot_dir + '.old'
+            shutil.rmtree(old_dir, ignore_errors=True)
+            if os.path.exists(snapshot_dir):
+                os.rename(snapshot_dir, old_dir)
+            os.rename(temp_dir, snapshot_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+            logger.info(f"Columnar snapshot of {len(record_ids)} record(s) written to '{snapshot_dir}'.")
+            return snapshot_dir
+        except FileLockError:
+            raise
+        except Exception as e:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            logger.error(f"Error writing columnar snapshot: {traceback.format_exc()}")
+            raise DatabaseError(f"Failed to write columnar snapshot: {str(e)}")
+        finally:
+            self._release_lock()
+
+    def _data_file_state(self) -> Dict[str, int]:
+        """Size and modification time of the data file; in-place updates change only the latter."""
+        try:
+            stat = os.stat(self.db_path)
+            return {'data_size': stat.st_size, 'data_mtime_ns': stat.st_mtime_ns}
+        except FileNotFoundError:
+            return {'data_size': 0, 'data_mtime_ns': 0}
+
+    def columnar_snapshot_is_current(self, snapshot_dir: Optional[str] = None) -> bool:
+        """True if the snapshot was taken from the current state of the data file."""
+        try:
+            with open(os.path.join(snapshot_dir or self.columns_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+                source = json.load(f)['source']
+            return all(source.get(key) == value for key, value in self._data_file_state().items())
+        except (OSError, KeyError, json.JSONDecodeError):
+            return False
+
+    def load_columnar(self, columns: Optional[List[str]] = None, only_valid: bool = False) -> pd.DataFrame:
+        """
+        Returns the database as a DataFrame backed by the memory-mapped columnar snapshot,
+        rewriting the snapshot first if the data file changed since it was taken.
+        """
+        if not self.columnar_snapshot_is_current():
+            self.write_columnar_snapshot()
+        return load_columnar_snapshot(self.columns_dir, columns=columns, only_valid=only_valid)
+
     def get_last_id(self) -> int:
         """Reads the last recorded ID from the database file header."""
         try:
@@ -620,42 +2084,38 @@ class TrafficAccidentsDB:
     def read_records_paginated(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Reads records from the database file with pagination.
-        Includes error recovery for individual corrupt records.
+        Seeks to the nearest page table checkpoint instead of walking the file from the start.
+        A structurally corrupt or truncated record is logged and ends the page at the last
+        good record, as no later record header can be located reliably.
         Returns raw record data (with 'data_bytes').
         """
         records = []
-        records_read_count = 0
         try:
             self._acquire_lock()
             if not os.path.exists(self.db_path) or os.path.getsize(self.db_path) < 4:
                 logger.info("No database file or empty file to read records from.")
                 return []
                 
-            with open(self.db_path, 'rb') as f:
-                f.read(4) # Skip last ID header
-                
-                current_record_index_in_file = 0 # Logical index counter for records in file (0-based)
-                while True:
-                    current_pos_before_read = f.tell() # Store position before attempting to read a record
-                    record_data_raw = self._read_next_record_raw(f)
-                    
-                    if record_data_raw is None: # End of file
-                        break
-                    
-                    current_record_index_in_file += 1 # Increment for each record successfully read (raw)
-                    
-                    # Apply offset (0-based index)
-                    if current_record_index_in_file <= offset:
-                        continue
-                    
-                    # Apply limit
-                    if limit is not None and records_read_count >= limit:
-                        break
-                    
-                    # Add start_offset to the raw record data for future use
-                    record_data_raw['start_offset'] = current_pos_before_read
-                    records.append(record_data_raw)
-                    records_read_count += 1
+            offset = max(offset, 0)
+            self._sync_sidecar(self.page_table)
+            checkpoint = self.page_table.checkpoint_for(offset)
+            if checkpoint is None: # Offset is past the last record
+                return []
+            checkpoint_ordinal, checkpoint_offset = checkpoint
+
+            # Start at the nearest checkpoint, then skip the few remaining headers
+            records_to_skip = offset - checkpoint_ordinal # Always < PAGE_CHECKPOINT_INTERVAL
+            page_end = None if limit is None else records_to_skip + limit
+            for record_offset, record_id, validation_flag, payload in itertools.islice(
+                    self._iter_mapped_records(checkpoint_offset, strict=False), records_to_skip, page_end):
+                records.append({
+                    'id': record_id,
+                    'validation': validation_flag,
+                    'size': len(payload),
+                    'checksum': hashlib.md5(payload).hexdigest(), # Checksum for data integrity verification
+                    'data_bytes': bytes(payload),
+                    'start_offset': record_offset, # Start offset for future use
+                })
         
             logger.info(f"Successfully read {len(records)} raw records from the database (offset: {offset}, limit: {limit}).")
             return records
@@ -674,42 +2134,357 @@ class TrafficAccidentsDB:
             self._release_lock()
 
 
+    def iter_records(self, where: Optional[Dict[str, Any]] = None, columns: Optional[List[str]] = None,
+                     only_valid: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Streams records lazily from the memory-mapped data file, in file order.
+        where maps field names to a value (equality) or a predicate on the field value.
+        Invalid records are skipped from the header flag alone with only_valid, and conditions
+        on the numeric block and symbol codes of binary records are checked on the raw bytes,
+        so rejected records are never decoded.
+        Yields {'id', 'validation', 'size', 'checksum', 'data'}, where data is the DataObject,
+        or a dict of just the given columns. Records that fail to decode are logged and skipped;
+        a structurally corrupt or truncated record is logged and ends the scan.
+        The database lock is held until the iterator is exhausted or closed, so callers that
+        may stop early or raise must close it explicitly: with closing(db.iter_records(...)) as records.
+        """
+        unknown_fields = [field for field in itertools.chain(where or (), columns or ()) if field not in FIELDS]
+        if unknown_fields:
+            raise ValueError(f"Unknown field(s) {unknown_fields}. Expected names from FIELDS.")
+        return self._iter_matching_records(dict(where or {}), list(columns) if columns is not None else None, only_valid)
+
+    def _iter_matching_records(self, where: Dict[str, Any], columns: Optional[List[str]],
+                               only_valid: bool) -> Iterator[Dict[str, Any]]:
+        try:
+            self._acquire_lock()
+            record_filter = RecordFilter(where, self.symbols) if where else None
+            for record_offset, record_id, validation_flag, payload in self._iter_mapped_records(strict=False):
+                if only_valid and not validation_flag:
+                    continue
+                remaining_fields = record_filter.check_raw(payload) if record_filter else ()
+                if remaining_fields is None:
+                    continue
+                try:
+                    data_obj = self.decode_record(payload)
+                    if remaining_fields and not record_filter.matches(data_obj, remaining_fields):
+                        continue
+                    record = {
+                        'id': record_id,
+                        'validation': validation_flag,
+                        'size': len(payload),
+                        'checksum': hashlib.md5(payload).hexdigest(),
+                        'data': data_obj if columns is None else {field: getattr(data_obj, field) for field in columns},
+                    }
+                except (DataValidationError, DatabaseError) as e:
+                    logger.warning(f"Skipping record ID {record_id} at offset {record_offset} due to deserialization error: {e}")
+                    continue
+                yield record
+        except FileLockError:
+            raise
+        except DatabaseError as e:
+            logger.error(f"Error iterating records: {traceback.format_exc()}")
+            raise DatabaseError(f"Failed to iterate records: {str(e)}")
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while iterating records: {traceback.format_exc()}")
+            raise DatabaseError(f"Failed to iterate records: {str(e)}")
+        finally:
+            self._release_lock()
+
+    def _iter_mapped_records(self, start_offset: int = 4, strict: bool = True,
+                             data_path: Optional[str] = None) -> Iterator[Tuple[int, int, bool, memoryview]]:
+        """
+        Walks the records of the data file (or of another file in the same format, data_path)
+        through a read-only memory map, unpacking headers with RECORD_HEADER.unpack_from
+        instead of three file reads per record.
+        Yields (start_offset, record_id, validation_flag, payload), where payload is a zero-copy
+        memoryview slice of the map (copy it with bytes() to keep it after the scan).
+        A structurally corrupt record raises DatabaseError (strict) or ends the scan with a warning.
+        Must be called with the lock held.
+        """
+        data_path = data_path or self.db_path
+        try:
+            file_size = os.path.getsize(data_path)
+        except FileNotFoundError:
+            return
+        if file_size <= start_offset:
+            return
+        with open(data_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            unpack_header = self.RECORD_HEADER.unpack_from
+            header_size = self.RECORD_HEADER.size
+            end = len(mapped)
+            record_offset = start_offset
+            while record_offset < end:
+                problem = None
+                if record_offset + header_size > end:
+                    problem = "Incomplete record header"
+                else:
+                    record_id, validation_flag, data_size = unpack_header(mapped, record_offset)
+                    data_start = record_offset + header_size
+                    if not (0 < data_size <= MAX_RECORD_SIZE):
+                        problem = f"Invalid record data size ({data_size} bytes)"
+                    elif data_start + data_size > end:
+                        problem = "Incomplete record data"
+                if problem:
+                    if strict:
+                        raise DatabaseError(f"{problem} at offset {record_offset}. Corrupt database file.")
+                    logger.warning(f"{problem} at offset {record_offset}. Stopping scan.")
+                    return
+                yield record_offset, record_id, validation_flag, view[data_start:data_start + data_size]
+                record_offset = data_start + data_size
+        finally:
+            view.release()
+            try:
+                mapped.close()
+            except BufferError:
+                pass # A caller still holds a payload slice; the map is closed when it is released
+
+    def _sync_sidecar(self, sidecar: Union['RecordIndex', 'PageCheckpointTable']):
+        """
+        Brings an index file (ID index or page table) up to date with the data file.
+        Records appended after the last indexed size are scanned and added;
+        a file that is missing, corrupt or ahead of the data file is rebuilt from scratch.
+        Must be called with the lock held.
+        """
+        data_size = os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+        header = sidecar.read_header()
+        if header is None or header[1] > data_size:
+            sidecar.reset()
+            indexed_size = 0
+        else:
+            indexed_size = header[1]
+
+        if indexed_size == data_size:
+            return
+        if data_size < 4:
+            sidecar.reset(data_size)
+            return
+
+        entries = [(record_id, offset, valid)
+                   for offset, record_id, valid, _ in self._iter_mapped_records(max(indexed_size, 4), strict=False)]
+        sidecar.append(entries, data_size)
+        logger.info(f"{type(sidecar).__name__} synchronized with '{self.db_path}': {len(entries)} record(s) added.")
+
+    def _sync_index(self):
+        """Brings the ID index up to date with the data file. Must be called with the lock held."""
+        self._sync_sidecar(self.id_index)
+
+    def _index_appended_records(self, entries: List[Tuple[int, int, bool]], previous_size: int):
+        """
+        Registers freshly appended records in the ID index and the page table.
+        Falls back to a catch-up scan for a file that was not in sync before the append.
+        """
+        for sidecar in (self.id_index, self.page_table):
+            try:
+                header = sidecar.read_header()
+                if header is not None and header[1] == previous_size:
+                    sidecar.append(entries, os.path.getsize(self.db_path))
+                else:
+                    self._sync_sidecar(sidecar)
+            except Exception as e:
+                # The data file is the source of truth; the file is caught up on its next use
+                logger.warning(f"Failed to update {type(sidecar).__name__} for '{self.db_path}': {e}")
+        try:
+            self._sync_secondary_index()
+        except Exception as e:
+            logger.warning(f"Failed to update secondary index '{self.secondary_index_path}': {e}")
+
+    def _secondary_keys(self, data_bytes: bytes) -> Dict[str, int]:
+        """SecondaryIndex keys of a stored record, read from the numeric block of binary records."""
+        values = BinaryRecordCodec.fixed_values(data_bytes)
+        if values is None: # JSON record
+            data_obj = self.decode_record(data_bytes)
+            values = {field: getattr(data_obj, field) for field in SecondaryIndex.FIELDS}
+        return {field: SecondaryIndex.key_for(field, values[field]) for field in SecondaryIndex.FIELDS}
+
+    def _sync_secondary_index(self):
+        """
+        Brings the secondary indexes up to date with the data file, like _sync_sidecar:
+        records appended after the last indexed size are inserted into the trees, while a
+        file that is missing, unusable, ahead of the data file, or behind by more records
+        than it holds is bulk rebuilt from a full scan. Must be called with the lock held.
+        """
+        data_size = os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+        header = self.secondary_index.read_header()
+        if header is not None and header[1] <= data_size:
+            indexed_count, indexed_size = header
+        else:
+            indexed_count, indexed_size = 0, 0
+        if header is not None and indexed_size == data_size:
+            return
+
+        def scan_keys(start_offset: int) -> Dict[str, List[Tuple[int, int, int]]]:
+            entries = {field: [] for field in SecondaryIndex.FIELDS}
+            for offset, record_id, _, payload in self._iter_mapped_records(start_offset, strict=False):
+                try:
+                    keys = self._secondary_keys(payload)
+                except (DataValidationError, DatabaseError, ValueError) as e:
+                    logger.warning(f"Record ID {record_id} at offset {offset} left out of the secondary index: {e}")
+                    continue
+                for field, key in keys.items():
+                    entries[field].append((key, record_id, offset))
+            return entries
+
+        entries = scan_keys(max(indexed_size, 4))
+        appended_count = len(entries[SecondaryIndex.FIELDS[0]])
+        if header is not None and 0 < indexed_size and appended_count <= indexed_count:
+            self.secondary_index.add(entries, data_size)
+        else:
+            if indexed_size > 4: # Bulk loading is cheaper than inserting more records than the trees hold
+                entries = scan_keys(4)
+            self.secondary_index.bulk_load(entries, data_size)
+        logger.info(f"Secondary index synchronized with '{self.db_path}': {appended_count} record(s) added.")
+
+    def _index_record_rewritten(self, record_id: int, offset: int, old_data_bytes: bytes, new_data_bytes: bytes):
+        """Moves a record updated in place to its new secondary index keys."""
+        try:
+            header = self.secondary_index.read_header()
+            if header is None or offset >= header[1]:
+                return # Not indexed yet: picked up with its new content on the next sync
+            old_keys = self._secondary_keys(old_data_bytes)
+            new_keys = self._secondary_keys(new_data_bytes)
+            if old_keys != new_keys:
+                self.secondary_index.replace(record_id, offset, old_keys, new_keys)
+        except Exception as e:
+            logger.warning(f"Failed to update secondary index '{self.secondary_index_path}' for record {record_id}: {e}")
+            self.secondary_index.reset() # Rebuilt from the data file on next use
+
+    def _index_validation_changed(self, record_id: int, validation_flag: bool):
+        """Mirrors a validation flag change of an existing record into the ID index."""
+        try:
+            if not self.id_index.set_validation(record_id, validation_flag):
+                self._sync_index()
+        except Exception as e:
+            logger.warning(f"Failed to update index '{self.index_path}' for record {record_id}: {e}")
+
+    def rebuild_index(self) -> int:
+        """
+        Rebuilds the ID index, the page table and the secondary indexes from the data file (recovery command).
+        Returns the number of indexed records.
+        """
+        try:
+            self._acquire_lock()
+            for sidecar in (self.id_index, self.page_table):
+                sidecar.reset()
+                self._sync_sidecar(sidecar)
+            self.secondary_index.reset()
+            self._sync_secondary_index()
+            header = self.id_index.read_header()
+            indexed_count = header[0] if header else 0
+            logger.info(f"Index '{self.index_path}' rebuilt with {indexed_count} record(s).")
+            return indexed_count
+        except FileLockError:
+            raise
+        except Exception as e:
+            logger.error(f"Error rebuilding index: {traceback.format_exc()}")
+            raise DatabaseError(f"Failed to rebuild index: {str(e)}")
+        finally:
+            self._release_lock()
+
+    def query_range(self, field: str, low: Any = None, high: Any = None, only_valid: bool = False,
+                    limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Returns the records whose field lies between low and high (inclusive; None leaves a side
+        open), in field order, by walking the SecondaryIndex leaves instead of scanning the file.
+        field is one of SecondaryIndex.FIELDS; dates are 'YYYY-MM-DD' strings or date objects.
+        Records come back as {'id', 'validation', 'size', 'checksum', 'data'}, like iter_records.
+        A stale index is rebuilt once.
+        """
+        if field not in SecondaryIndex.FIELDS:
+            raise ValueError(f"No secondary index on '{field}'. Expected one of {SecondaryIndex.FIELDS}.")
+        low_key = SecondaryIndex.key_for(field, low) if low is not None else None
+        high_key = SecondaryIndex.key_for(field, high) if high is not None else None
+        try:
+            self._acquire_lock()
+            for attempt in range(2):
+                self._sync_secondary_index()
+                if os.path.getsize(self.db_path) <= 4:
+                    return []
+                records, stale = [], False
+                with open(self.db_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    for key, record_id, offset in self.secondary_index.scan(field, low_key, high_key):
+                        if offset + self.RECORD_HEADER.size > len(mapped):
+                            stale = True
+                            break
+                        stored_id, validation_flag, data_size = self.RECORD_HEADER.unpack_from(mapped, offset)
+                        data_start = offset + self.RECORD_HEADER.size
+                        if stored_id != record_id or data_start + data_size > len(mapped):
+                            stale = True
+                            break
+                        if only_valid and not validation_flag:
+                            continue
+                        data_bytes = mapped[data_start:data_start + data_size]
+                        try:
+                            data_obj = self.decode_record(data_bytes)
+                        except DatabaseError as e:
+                            logger.warning(f"Skipping record ID {record_id} due to deserialization error: {e}")
+                            continue
+                        records.append({
+                            'id': record_id,
+                            'validation': validation_flag,
+                            'size': data_size,
+                            'checksum': hashlib.md5(data_bytes).hexdigest(),
+                            'data': data_obj,
+                        })
+                        if limit is not None and len(records) >= limit:
+                            break
+                if not stale:
+                    logger.info(f"Range query on '{field}' [{low}, {high}] returned {len(records)} record(s).")
+                    return records
+                logger.warning(f"Secondary index '{self.secondary_index_path}' is stale. Rebuilding it.")
+                self.secondary_index.reset()
+            raise DatabaseError(f"Secondary index on '{field}' is inconsistent with the data file after a rebuild.")
+        except FileLockError:
+            raise
+        except FileNotFoundError:
+            return []
+        except DatabaseError as e:
+            logger.error(f"Error in range query: {traceback.format_exc()}")
+            raise DatabaseError(f"Failed to run range query on '{field}': {str(e)}")
+        except Exception as e:
+            logger.error(f"An unexpected error occurred in range query: {traceback.format_exc()}")
+            raise DatabaseError(f"Failed to run range query on '{field}': {str(e)}")
+        finally:
+            self._release_lock()
+
     def read_record_by_id(self, search_id: int) -> Optional[Dict[str, Any]]:
         """
         Reads a specific record by its ID.
-        Performs a linear scan, as binary search is not practical for this file structure.
+        Uses the ID index to seek straight to the record; a stale index is rebuilt once.
         Returns the raw record data (with 'data_bytes' and 'start_offset').
         """
         if search_id <= 0:
             raise ValueError("Record ID must be positive.")
-        
+
         try:
             self._acquire_lock()
             if not os.path.exists(self.db_path) or os.path.getsize(self.db_path) < 4:
                 return None
-                
-            with open(self.db_path, 'rb') as f:
-                f.read(4) # Skip last ID header
-                
-                while True:
-                    current_pos_before_read = f.tell()
-                    record_data_raw = self._read_next_record_raw(f)
-                    if record_data_raw is None: # End of file
-                        break
-                    
-                    if record_data_raw['id'] == search_id:
-                        record_data_raw['start_offset'] = current_pos_before_read # Add offset
-                        return record_data_raw # Return raw data for subsequent DataObject creation
-                    # Catch DatabaseError specifically for structural issues
-                    if DatabaseError: 
-                        logger.warning(f"Skipping corrupt record at position {current_pos_before_read} during ID search: {str(DatabaseError)}")
-                        # Try to jump past the corrupt record
-                        f.seek(current_pos_before_read + CHUNK_SIZE)
-                        continue
-                    if Exception:
-                        logger.error(f"Unexpected error during search for ID {search_id} at {current_pos_before_read}: {traceback.format_exc()}")
-                        break # Stop search on unexpected error
-            
+
+            for attempt in range(2):
+                self._sync_index()
+                location = self.id_index.lookup(search_id)
+                if location is None:
+                    return None # Record not found
+
+                record_start_offset = location[0]
+                with open(self.db_path, 'rb') as f:
+                    f.seek(record_start_offset)
+                    try:
+                        record_data_raw = self._read_next_record_raw(f)
+                    except DatabaseError as e:
+                        logger.warning(f"Corrupt record at indexed offset {record_start_offset}: {e}")
+                        record_data_raw = None
+
+                if record_data_raw is not None and record_data_raw['id'] == search_id:
+                    record_data_raw['start_offset'] = record_start_offset # Add offset
+                    return record_data_raw # Return raw data for subsequent DataObject creation
+
+                logger.warning(f"Index entry for ID {search_id} is stale. Rebuilding index.")
+                self.id_index.reset()
+
             return None # Record not found
         except FileLockError:
             raise
@@ -747,7 +2522,7 @@ class TrafficAccidentsDB:
                 raise DatabaseError(f"Corrupt record header structure: {str(e)}")
             
             # Validate size before attempting to read data
-            if not (0 < data_size <= 10 * 1024 * 1024): # Max 10MB per record
+            if not (0 < data_size <= MAX_RECORD_SIZE): # Max 10MB per record
                 raise DatabaseError(f"Invalid record data size ({data_size} bytes). Corrupt header or too large.")
             
             data_bytes = file_obj.read(data_size)
@@ -770,10 +2545,81 @@ class TrafficAccidentsDB:
             logger.error(f"Unexpected error reading raw record: {traceback.format_exc()}")
             raise DatabaseError(f"Failed to read raw record data: {str(e)}")
 
+    @contextmanager
+    def transaction(self) -> Iterator[RecordBatch]:
+        """
+        Groups record appends under a single lock, a single journal transaction and a single fsync.
+        Yields a RecordBatch; on a clean exit the last ID header and the indexes are
+        updated once, on an exception the journal truncates the appended bytes away.
+
+            with db.transaction() as batch:
+                for obj in objects:
+                    batch.add(obj)
+        """
+        caller_error = False
+        try:
+            self._acquire_lock()
+            with self._journaled() as txid:
+                last_id = self.get_last_id() # Get last ID with lock acquired
+                file_exists = os.path.exists(self.db_path) and os.path.getsize(self.db_path) >= 4
+                previous_size = os.path.getsize(self.db_path) if file_exists else 0
+                # Undo information: where the appended records start and the header to restore
+                self.wal.log(txid, WriteAheadLog.APPEND, previous_size, struct.pack('I', last_id) if file_exists else b'')
+
+                # 'r+b' keeps the header writable; a new or empty file is created with 'w+b'
+                with open(self.db_path, 'r+b' if file_exists else 'w+b', buffering=WRITE_BUFFER_SIZE) as f:
+                    if not file_exists:
+                        f.write(struct.pack('I', 0)) # Placeholder for last ID
+                    f.seek(0, os.SEEK_END)
+                    self.symbols.refresh()
+                    batch = RecordBatch(f, last_id + 1, self.record_codec, self.symbols)
+                    try:
+                        yield batch
+                    except BaseException:
+                        caller_error = True
+                        raise
+
+                    if batch.index_entries:
+                        f.seek(0)
+                        f.write(struct.pack('I', batch.last_id)) # Update the file header with the new last ID
+                    self.symbols.flush() # Codes must be durable before the records using them
+                    f.flush()
+                    os.fsync(f.fileno()) # Ensure data is physically written before the commit
+
+                if batch.index_entries:
+                    self._last_read_id = batch.last_id
+                    self._index_appended_records(batch.index_entries, previous_size)
+                    logger.info(f"Committed {len(batch.index_entries)} record(s) to database (IDs {batch.index_entries[0][0]}-{batch.last_id}).")
+        except (FileLockError, DatabaseError, DataValidationError):
+            raise # Re-raise specific exceptions
+        except Exception as e:
+            if caller_error:
+                raise # Errors raised inside the 'with' block reach the caller unchanged
+            logger.error(f"Unexpected error in write transaction: {traceback.format_exc()}")
+            raise DatabaseError(f"Failed to write records: {str(e)}")
+        finally:
+            self._release_lock()
+
+    def write_records(self, data_objects: Iterable[DataObject]) -> List[int]:
+        """
+        Writes several DataObjects in one transaction (one lock, one journal entry, one fsync).
+        All objects must be valid; if any is rejected, none of them is written.
+        Returns the IDs assigned to the records, in order.
+        """
+        new_ids = []
+        with self.transaction() as batch:
+            for data_object in data_objects:
+                if not isinstance(data_object, DataObject):
+                    raise TypeError("Expected DataObject instance to write.")
+                if not data_object.validate():
+                    raise DataValidationError("Attempted to write an invalid DataObject.")
+                new_ids.append(batch.add(data_object))
+        return new_ids
+
     def write_record(self, data_object: DataObject) -> int:
         """
         Writes a single DataObject to the database file.
-        Acquires a lock, creates a backup, appends the record, and updates the last ID.
+        Acquires a lock, journals the append, appends the record, and updates the last ID.
         """
         if not isinstance(data_object, DataObject):
             raise TypeError("Expected DataObject instance to write.")
@@ -782,45 +2628,9 @@ class TrafficAccidentsDB:
         if not data_object.validate():
             raise DataValidationError("Attempted to write an invalid DataObject.")
 
-        try:
-            self._acquire_lock()
-            self._create_backup() # Backup before modification
-            
-            last_id = self.get_last_id() # Get last ID with lock acquired
-            new_id = last_id + 1 if last_id > 0 else 1
-            
-            obj_bytes = data_object.to_bytes()
-            size = len(obj_bytes)
-            validation_flag = data_object.validate() # Final validation flag
-            
-            # Use 'ab' (append binary) to append records.
-            # If the file is new or empty, 'wb' (write binary) will create/truncate it,
-            # ensuring the header is written correctly.
-            mode = 'ab' if os.path.exists(self.db_path) and os.path.getsize(self.db_path) >= 4 else 'wb'
-            with open(self.db_path, mode) as f:
-                # If opening in 'wb' mode, write the initial ID header (0 for now, updated later)
-                if mode == 'wb':
-                    f.write(struct.pack('I', 0)) # Placeholder for last ID
-                
-                # Write record header: ID, validation flag, size of data
-                f.write(struct.pack('I', new_id))
-                f.write(struct.pack('?', validation_flag))
-                f.write(struct.pack('I', size))
-                f.write(obj_bytes) # Write the actual data bytes
-                
-                f.flush()
-                os.fsync(f.fileno()) # Ensure data is physically written
-                
-            self.update_last_id(new_id) # Update the file header with the new last ID
-            logger.info(f"Successfully wrote record {new_id} to database.")
-            return new_id
-        except (FileLockError, DatabaseError, DataValidationError):
-            raise # Re-raise specific exceptions
-        except Exception as e:
-            logger.error(f"Unexpected error writing record: {traceback.format_exc()}")
-            raise DatabaseError(f"Failed to write record: {str(e)}")
-        finally:
-            self._release_lock()
+        new_id = self.write_records([data_object])[0]
+        logger.info(f"Successfully wrote record {new_id} to database.")
+        return new_id
 
     def invalidate_record(self, record_id: int, record_start_offset: int):
         """
@@ -832,14 +2642,19 @@ class TrafficAccidentsDB:
             if not os.path.exists(self.db_path):
                 raise FileNotFoundError(f"Database file not found: {self.db_path}")
 
-            with open(self.db_path, 'r+b') as f:
+            with self._journaled() as txid, open(self.db_path, 'r+b') as f:
                 # Seek to the position of the validation byte
                 # Header: 4 bytes (ID) + 1 byte (Validation Flag)
                 validation_byte_offset = record_start_offset + 4 
                 f.seek(validation_byte_offset)
-                f.write(struct.pack('?', False)) # Write False (0) for validation flag
+                before_image = f.read(1)
+                after_image = struct.pack('?', False) # Write False (0) for validation flag
+                self.wal.log(txid, WriteAheadLog.WRITE, validation_byte_offset, before_image + after_image)
+                f.seek(validation_byte_offset)
+                f.write(after_image)
                 f.flush()
                 os.fsync(f.fileno())
+            self._index_validation_changed(record_id, False)
             logger.info(f"Record ID {record_id} at offset {record_start_offset} marked as invalid.")
         except FileLockError:
             raise
@@ -860,49 +2675,50 @@ class TrafficAccidentsDB:
             raise TypeError("Expected DataObject instance for new data.")
         if not new_data_object.validate():
             raise DataValidationError("Attempted to update with an invalid DataObject.")
-
-        try:
-            self._acquire_lock()
-            self._create_backup() # Backup before modification
-
-            # Find the original record's details
-            original_record_info = self.read_record_by_id(original_record_id)
-            if not original_record_info:
-                raise DatabaseError(f"Original record with ID {original_record_id} not found for update.")
-            
-            original_start_offset = original_record_info['start_offset']
-            original_size = original_record_info['size']
-            
-            new_obj_bytes = new_data_object.to_bytes()
-            new_size = len(new_obj_bytes)
-            new_validation_flag = new_data_object.validate()
-
-            if new_size <= original_size:
-                # Overwrite in place
-                with open(self.db_path, 'r+b') as f:
-                    f.seek(original_start_offset)
-                    # Write original ID, new validation flag, new size, new data
-                    f.write(struct.pack('I', original_record_id)) # Keep original ID
-                    f.write(struct.pack('?', new_validation_flag))
-                    f.write(struct.pack('I', new_size))
-                    f.write(new_obj_bytes)
-                    
-                    # Pad with null bytes if new data is smaller
-                    padding_needed = original_size - new_size
-                    if padding_needed > 0:
-                        f.write(b'\x00' * padding_needed)
-                    
-                    f.flush()
-                    os.fsync(f.fileno())
-                logger.info(f"Record ID {original_record_id} updated in place at offset {original_start_offset}.")
-                return original_record_id # Return the original ID as it was updated in place
-            else:
-                # Invalidate old record and append new one
-                self.invalidate_record(original_record_id, original_start_offset)
-                # Append the new record; it will get a new ID automatically
-                new_appended_id = self.write_record(new_data_object)
-                logger.info(f"Record ID {original_record_id} invalidated, new record appended with ID {new_appended_id}.")
-                return new_appended_id
+
+        try:
+            self._acquire_lock()
+            with self._journaled() as txid:
+                # Find the original record's details
+                original_record_info = self.read_record_by_id(original_record_id)
+                if not original_record_info:
+                    raise DatabaseError(f"Original record with ID {original_record_id} not found for update.")
+                
+                original_start_offset = original_record_info['start_offset']
+                original_size = original_record_info['size']
+                
+                self.symbols.refresh()
+                new_obj_bytes = new_data_object.to_bytes(self.record_codec, self.symbols)
+                self.symbols.flush()
+                new_size = len(new_obj_bytes)
+                new_validation_flag = new_data_object.validate()
+
+                if new_size <= original_size:
+                    # Overwrite in place: original ID, new validation flag, original slot size, new data.
+                    # Keeping the slot size lets sequential scans step over the padding.
+                    before_image = self.RECORD_HEADER.pack(original_record_id, original_record_info['validation'], original_size) + original_record_info['data_bytes']
+                    after_image = (self.RECORD_HEADER.pack(original_record_id, new_validation_flag, original_size) # Keep original ID
+                                   + new_obj_bytes
+                                   + b'\x00' * (original_size - new_size)) # Pad with null bytes if new data is smaller
+                    self.wal.log(txid, WriteAheadLog.WRITE, original_start_offset, before_image + after_image)
+                    with open(self.db_path, 'r+b') as f:
+                        f.seek(original_start_offset)
+                        f.write(after_image)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    self._index_validation_changed(original_record_id, new_validation_flag)
+                    self._index_record_rewritten(original_record_id, original_start_offset,
+                                                 original_record_info['data_bytes'], new_obj_bytes)
+                    logger.info(f"Record ID {original_record_id} updated in place at offset {original_start_offset}.")
+                    return original_record_id # Return the original ID as it was updated in place
+                else:
+                    # Invalidate old record and append new one, both in this journal transaction
+                    self.invalidate_record(original_record_id, original_start_offset)
+                    # Append the new record; it will get a new ID automatically
+                    with self.transaction() as batch:
+                        new_appended_id = batch.add(new_data_object)
+                    logger.info(f"Record ID {original_record_id} invalidated, new record appended with ID {new_appended_id}.")
+                    return new_appended_id
         except (FileLockError, DatabaseError, DataValidationError):
             raise # Re-raise specific exceptions
         except Exception as e:
@@ -963,11 +2779,6 @@ class TrafficAccidentsDB:
         imported_count = 0
         try:
             self._acquire_lock()
-            self._create_backup() # Backup before bulk operation
-            
-            # Get the current last ID to calculate new IDs sequentially
-            last_id = self.get_last_id()
-            current_id = last_id + 1 if last_id > 0 else 1
 
             # Count total records for accurate progress reporting (requires a separate pass)
             total_records = 0
@@ -978,29 +2789,14 @@ class TrafficAccidentsDB:
                 logger.warning(f"No data rows found in CSV file '{csv_path}'.")
                 return 0 # No records to import
                 
-            # Determine initial write mode: 'ab' for append, 'wb' for new file (initial header)
-            mode = 'ab' if os.path.exists(self.db_path) and os.path.getsize(self.db_path) >= 4 else 'wb'
-            
-            with open(self.db_path, mode) as f:
-                if mode == 'wb':
-                    f.write(struct.pack('I', 0)) # Placeholder for last ID in new file
-                
+            # Single journaled transaction for the whole import
+            with self.transaction() as batch:
                 for i, row in enumerate(self._read_csv_iter(csv_path)):
                     try:
                         # Attempt to create DataObject from the raw row data
                         data_obj = DataObject(row)
-                        
-                        obj_bytes = data_obj.to_bytes()
-                        size = len(obj_bytes)
-                        validation_flag = data_obj.validate()
-                        
-                        f.write(struct.pack('I', current_id))
-                        f.write(struct.pack('?', validation_flag))
-                        f.write(struct.pack('I', size))
-                        f.write(obj_bytes)
-                        
+                        batch.add(data_obj)
                         imported_count += 1
-                        current_id += 1 # Increment for the next record
                         
                         # Update progress if callback is provided
                         if progress_callback:
@@ -1012,12 +2808,7 @@ class TrafficAccidentsDB:
                     except Exception as e:
                         logger.error(f"Unexpected error processing CSV line {i+2}: {traceback.format_exc()}")
                         # If an unexpected error occurs, log it and continue
-                        
-                f.flush()
-                os.fsync(f.fileno()) # Ensure all written data is on disk
                 
-            # Update the last ID in the header after all records are written
-            self.update_last_id(current_id - 1)
             logger.info(f"Successfully imported {imported_count} records from CSV.")
             return imported_count
         except (FileLockError, DatabaseError, ValueError, FileNotFoundError):
@@ -1028,6 +2819,43 @@ class TrafficAccidentsDB:
         finally:
             self._release_lock()
 
+def load_columnar_snapshot(snapshot_dir: str = COLUMNS_DIR, columns: Optional[List[str]] = None,
+                           only_valid: bool = False) -> pd.DataFrame:
+    """
+    Loads a snapshot written by TrafficAccidentsDB.write_columnar_snapshot as a DataFrame.
+    Numeric columns are memory-mapped, dates are viewed as datetime64[D] and strings become
+    Categoricals over their stored codes, so no per-row Python work is done.
+    """
+    try:
+        with open(os.path.join(snapshot_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != 'traffic-accidents-columnar' or manifest.get('version') != 1:
+            raise DatabaseError(f"Unsupported columnar snapshot in '{snapshot_dir}'.")
+        row_count = manifest['row_count']
+
+        def load_array(file_name: str) -> np.ndarray:
+            # Empty arrays cannot be memory-mapped
+            return np.load(os.path.join(snapshot_dir, file_name), mmap_mode='r' if row_count else None)
+
+        frame_data = {'id': load_array('id.npy')}
+        for field in columns or FIELDS:
+            spec = manifest['columns'][field]
+            array = load_array(spec['file'])
+            if spec['kind'] == 'category':
+                frame_data[field] = pd.Categorical.from_codes(array, categories=spec['categories'])
+            elif spec['kind'] == 'date':
+                frame_data[field] = array.view('datetime64[D]')
+            else:
+                frame_data[field] = array
+        frame_data['validation'] = np.unpackbits(load_array('valid.bits.npy'), count=row_count).astype(np.bool_)
+        data_frame = pd.DataFrame(frame_data, copy=False)
+        return data_frame[data_frame['validation']] if only_valid else data_frame
+    except FileNotFoundError:
+        raise DatabaseError(f"No columnar snapshot found in '{snapshot_dir}'.")
+    except (KeyError, ValueError, json.JSONDecodeError) as e:
+        logger.error(f"Error loading columnar snapshot: {traceback.format_exc()}")
+        raise DatabaseError(f"Corrupt columnar snapshot in '{snapshot_dir}': {str(e)}")
+
 # --- Streamlit UI Functions ---
 
 def setup_ui():
@@ -1122,7 +2950,11 @@ def setup_ui():
     st.caption("A comprehensive system for managing traffic accident records")
     
     try:
-        db = TrafficAccidentsDB() # Initialize DB handler
+        db = TrafficAccidentsDB() # Initialize DB handler (replays the journal after a crash)
+        try:
+            db.snapshot_if_due() # Scheduled full backup
+        except (DatabaseError, FileLockError) as e:
+            logger.warning(f"Scheduled snapshot failed: {e}")
         
         with st.sidebar:
             st.header("Navigation")
@@ -1283,12 +3115,36 @@ def view_all_records(db: TrafficAccidentsDB):
     # Calculate offset for fetching records
     start_offset = (current_page - 1) * page_size
     
-    # Fetch only the records for the current page
-    current_page_raw_records = []
+    # Filters are pushed down into the record scan, and pages count matching records only
+    where = {}
+    if search_query:
+        where['crash_type'] = lambda value: value.lower().startswith(search_query.lower())
+    if min_injuries > 0:
+        where['injuries_total'] = lambda value: value >= min_injuries
+
+    filtered_records_with_obj = [] # Will store {id, validation, size, checksum, data (DataObject)}
     with st.spinner(f"Loading records for page {current_page}..."):
         try:
-            current_page_raw_records = db.read_records_paginated(offset=start_offset, limit=page_size)
-            logger.info(f"Loaded {len(current_page_raw_records)} raw records for page {current_page}.")
+            if where or only_valid:
+                # The page is materialised and the iterator closed (releasing the lock) right here
+                with closing(db.iter_records(where=where, only_valid=only_valid)) as matching_records:
+                    filtered_records_with_obj = list(itertools.islice(matching_records, start_offset, start_offset + page_size))
+            else:
+                for record_raw in db.read_records_paginated(offset=start_offset, limit=page_size):
+                    try:
+                        # Reconstruct DataObject from raw bytes for display (validated when written)
+                        data_obj = db.decode_record(record_raw['data_bytes'])
+                    except (DataValidationError, DatabaseError) as e:
+                        logger.warning(f"Skipping record ID {record_raw.get('id', 'N/A')} due to deserialization/validation error: {e}")
+                        continue # Skip corrupt or invalid records during display
+                    filtered_records_with_obj.append({
+                        'id': record_raw['id'],
+                        'validation': record_raw['validation'],
+                        'size': record_raw['size'],
+                        'checksum': record_raw['checksum'],
+                        'data': data_obj # This is now the DataObject instance
+                    })
+            logger.info(f"Loaded {len(filtered_records_with_obj)} records for page {current_page}.")
         except DatabaseError as e:
             st.error(f"Failed to load records for current page: {str(e)}")
             logger.error(f"Error loading paginated records: {e}")
@@ -1296,42 +3152,6 @@ def view_all_records(db: TrafficAccidentsDB):
             st.error(f"An unexpected error occurred while loading page records: {str(e)}")
             logger.error(f"Unexpected error in view_all_records pagination: {traceback.format_exc()}")
 
-
-    # Filter records based on the fetched subset
-    filtered_records_with_obj = [] # Will store {id, validation, checksum, data_obj_instance}
-    for record_raw in current_page_raw_records:
-        try:
-            # Reconstruct DataObject from raw bytes for filtering and display
-            data_obj = DataObject.from_bytes(record_raw['data_bytes'])
-            
-            # Apply 'only_valid' filter
-            if only_valid and not record_raw.get('validation', True): 
-                continue
-            
-            # Apply search query filter (case-insensitive)
-            if search_query:
-                if not getattr(data_obj, 'crash_type', '').lower().startswith(search_query.lower()):
-                    continue
-            
-            # Apply min injuries filter
-            if getattr(data_obj, 'injuries_total', 0.0) < min_injuries:
-                continue
-            
-            # Add the reconstructed object and its original metadata
-            filtered_records_with_obj.append({
-                'id': record_raw['id'],
-                'validation': record_raw['validation'],
-                'size': record_raw['size'],
-                'checksum': record_raw['checksum'],
-                'data': data_obj # This is now the DataObject instance
-            })
-        except (DataValidationError, DatabaseError) as e:
-            logger.warning(f"Skipping record ID {record_raw.get('id', 'N/A')} due to deserialization/validation error: {e}")
-            continue # Skip corrupt or invalid records during display
-        except Exception as e:
-            logger.error(f"Unexpected error processing raw record for display (ID: {record_raw.get('id', 'N/A')}): {traceback.format_exc()}")
-            continue
-
     st.info(f"Displaying {len(filtered_records_with_obj)} record(s) on page {current_page} after filtering.")
     
     if not filtered_records_with_obj:
@@ -1412,7 +3232,7 @@ def search_by_id(db: TrafficAccidentsDB):
                         record_raw = db.read_record_by_id(search_id_input) # Get raw data including start_offset
                         if record_raw:
                             st.session_state.search_result_raw = record_raw
-                            st.session_state.search_result_data_obj = DataObject.from_bytes(record_raw['data_bytes'])
+                            st.session_state.search_result_data_obj = db.decode_record(record_raw['data_bytes'], trusted=False)
                             st.session_state.search_error_id = None
                             st.session_state.confirm_delete_id = None # Clear any pending confirmation
                             st.session_state.delete_message = None
@@ -1586,7 +3406,7 @@ def update_record_ui(db: TrafficAccidentsDB):
         if st.session_state.loaded_record_for_update:
             original_record_id = st.session_state.loaded_record_for_update['id']
             # Convert raw bytes to DataObject for form pre-filling
-            original_data_obj = DataObject.from_bytes(st.session_state.loaded_record_for_update['data_bytes'])
+            original_data_obj = db.decode_record(st.session_state.loaded_record_for_update['data_bytes'], trusted=False)
 
             st.subheader(f"Editing Record ID: {original_record_id}")
             if not st.session_state.loaded_record_for_update['validation']:
@@ -2085,36 +3905,34 @@ def display_activity_log():
 
 def export_to_json(db: TrafficAccidentsDB):
     st.header("📤 Export All Records to JSON")
-    st.info("This will load all records into memory and prepare them for download as a single JSON file.")
+    st.info("Records are streamed from the database and written straight into the download file.")
     
     if st.button("Prepare JSON Export"):
         try:
-            with st.spinner("Loading all records for JSON export... This may take a while for large databases."):
-                all_records_data = db.read_all_records() # This now returns list of dicts
+            json_output = io.StringIO()
+            exported_count = 0
+            with st.spinner("Exporting records to JSON... This may take a while for large databases."):
+                json_output.write("[")
+                with closing(db.iter_records(columns=FIELDS)) as records:
+                    for record in records:
+                        record_dict = {'id': record['id'], 'validation': record['validation'], **record['data']}
+                        json_output.write("," if exported_count else "")
+                        json_output.write("\n    " + json.dumps(record_dict, ensure_ascii=False))
+                        exported_count += 1
+                json_output.write("\n]\n")
             
-            if all_records_data:
-                # Convert date objects within records to string for JSON serialization
-                serializable_records = []
-                for record in all_records_data:
-                    temp_record = record.copy()
-                    for key, value in temp_record.items():
-                        if isinstance(value, date):
-                            temp_record[key] = value.isoformat()
-                    serializable_records.append(temp_record)
-
-                json_output = json.dumps(serializable_records, indent=4, ensure_ascii=False)
-                
-                st.success(f"Successfully loaded {len(serializable_records)} records. Ready for download.")
+            if exported_count:
+                st.success(f"Successfully exported {exported_count} records. Ready for download.")
                 
                 st.download_button(
                     label="Download records.json",
-                    data=json_output,
+                    data=json_output.getvalue(),
                     file_name="traffic_accidents_records.json",
                     mime="application/json"
                 )
             else:
                 st.warning("No records found to export.")
-        except DatabaseError as e:
+        except (DatabaseError, FileLockError) as e:
             st.error(f"Error exporting records to JSON: {str(e)}")
             logger.error(f"Failed to export all records to JSON: {e}")
         except Exception as e:
@@ -2122,89 +3940,252 @@ def export_to_json(db: TrafficAccidentsDB):
             logger.error(f"Unexpected error in export_to_json: {e}")
 
 #----------------------------------------------------------------------------> Compressão
+# Execução em processos paralelos
+def run_ordered(function: Callable, arguments: Iterable[tuple], workers: int) -> Iterator[Any]:
+    """
+    Aplica function a cada tupla de arguments e produz os resultados na ordem de entrada.
+    Com workers > 1 usa um ProcessPoolExecutor, mantendo no máximo 2 * workers tarefas
+    pendentes para que a memória continue limitada. Se o pool falhar (processo encerrado,
+    argumentos que não podem ser serializados, erro ao criar processos), as tarefas ainda
+    não entregues são refeitas neste processo.
+    """
+    arguments = iter(arguments)
+    pending = deque() # (argumentos, futuro), na ordem de entrada
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for args in arguments:
+                    pending.append((args, executor.submit(function, *args)))
+                    if len(pending) >= 2 * workers:
+                        result = pending[0][1].result()
+                        pending.popleft()
+                        yield result
+                while pending:
+                    result = pending[0][1].result()
+                    pending.popleft()
+                    yield result
+        except (BrokenProcessPool, pickle.PicklingError, AttributeError, TypeError, OSError) as e:
+            # AttributeError/TypeError vêm de objetos que o pickle não serializa; erros da própria function se repetem abaixo
+            logger.warning(f"Process pool failed ({e!r}); continuing serially")
+    for args, _ in pending:
+        yield function(*args)
+    for args in arguments:
+        yield function(*args)
+
 # Implementação Huffman
-class Node:
-    __slots__ = ['char', 'freq', 'left', 'right']  # Otimização de memória
-    
-    def __init__(self, char: Optional[bytes], freq: int, 
-                 left: Optional['Node'] = None, 
-                 right: Optional['Node'] = None):
-        self.char = char  # Armazenado como bytes
-        self.freq = freq
-        self.left = left
-        self.right = right
+class HuffmanProcessor:
+    V2_MAGIC = b'HUF2'
+    V2_HEADER = struct.Struct('<4sBBQ') # Magic, modo, bits de preenchimento, tamanho original
+    MODE_HUFFMAN = 0
+    MODE_STORED = 1 # Arquivos menores que MIN_COMPRESSION_SIZE, gravados sem compressão
+    STREAM_MAGIC = b'HUF3'
+    STREAM_HEADER = struct.Struct('<4sQ') # Magic, tamanho original; seguido dos comprimentos dos códigos
+    FRAME_HEADER = struct.Struct('<II') # Bytes decodificados do quadro, bits válidos do quadro
+    INDEX_MAGIC = b'HIDX'
+    INDEX_ENTRY = struct.Struct('<QQ') # Posição do quadro no arquivo original e no arquivo comprimido
+    INDEX_TRAILER = struct.Struct('<QI4s') # Posição do índice, número de quadros, magic
 
-    def __lt__(self, other: 'Node'):
-        return self.freq < other.freq
+    @staticmethod
+    def build_code_lengths(frequencies: Dict[int, int], max_length: int = HUFFMAN_MAX_CODE_LENGTH) -> Dict[int, int]:
+        """
+        Comprimentos ótimos de código {byte: comprimento} limitados a max_length bits (package-merge).
+        Cada nível agrupa os itens mais leves em pacotes; os 2n-2 itens mais leves do último
+        nível dão o comprimento de cada símbolo pelo número de vezes em que aparecem.
+        """
+        symbols = sorted(frequencies, key=lambda byte: (frequencies[byte], byte))
+        if len(symbols) == 1:
+            return {symbols[0]: 1}
+        if len(symbols) > 1 << max_length:
+            raise ValueError(f"{len(symbols)} símbolos não cabem em códigos de até {max_length} bits")
+        leaves = [(frequencies[byte], (byte,)) for byte in symbols]
+        items = leaves
+        for _ in range(max_length - 1):
+            packages = [(items[i][0] + items[i + 1][0], items[i][1] + items[i + 1][1])
+                        for i in range(0, len(items) - 1, 2)]
+            items = list(heapq.merge(leaves, packages, key=lambda item: item[0]))
+        return dict(Counter(byte for _, package in items[:2 * len(symbols) - 2] for byte in package))
 
-class HuffmanProcessor:
     @staticmethod
-    def generate_tree(data: bytes, progress_callback: Optional[Callable[[float, str], None]] = None) -> Optional[Node]:
-        """Geração otimizada de árvore com rastreamento de progresso"""
-        if not data:
-            return None
-            
-        if len(data) == 1:
-            return Node(data, 1)  # Lida com o caso de um único byte
+    def canonical_codes(code_lengths: Dict[int, int]) -> Dict[int, Tuple[int, int]]:
+        """
+        Códigos canônicos {byte: (código, comprimento)}: atribuídos em ordem de comprimento e
+        depois de byte, de modo que apenas os comprimentos precisam ser gravados.
+        """
+        codes = {}
+        code = 0
+        previous_length = 0
+        for byte in sorted(code_lengths, key=lambda byte: (code_lengths[byte], byte)):
+            length = code_lengths[byte]
+            code <<= length - previous_length
+            if not 0 < length <= 32 or code >> length:
+                raise ValueError("Comprimentos de código de Huffman inválidos")
+            codes[byte] = (code, length)
+            code += 1
+            previous_length = length
+        return codes
 
-        if progress_callback:
-            progress_callback(0, "Analisando conteúdo do arquivo...")
+    @staticmethod
+    def _pack_code_lengths(code_lengths: Dict[int, int]) -> bytes:
+        """Mapa de bits dos bytes presentes (32 bytes) seguido dos comprimentos em nibbles."""
+        present = sorted(code_lengths)
+        bitmap = sum(1 << byte for byte in present).to_bytes(32, 'little')
+        lengths = [code_lengths[byte] for byte in present] + [0]
+        return bitmap + bytes((lengths[i] << 4) | lengths[i + 1] for i in range(0, len(present), 2))
 
-        # Usa Counter para análise de frequência de bytes
-        byte_count = Counter(data)
-        
-        # Lida com o caso de um único byte
-        if len(byte_count) == 1:
-            byte = next(iter(byte_count))
-            return Node(bytes([byte]), byte_count[byte])
-        
-        if progress_callback:
-            progress_callback(0.2, "Construindo fila de prioridade...")
+    @staticmethod
+    def _unpack_code_lengths(content: bytes, position: int) -> Tuple[Dict[int, int], int]:
+        """Lê a tabela de _pack_code_lengths; retorna (comprimentos, posição seguinte)."""
+        bitmap = int.from_bytes(content[position:position + 32], 'little')
+        position += 32
+        present = [byte for byte in range(256) if bitmap >> byte & 1]
+        packed = content[position:position + (len(present) + 1) // 2]
+        if len(packed) != (len(present) + 1) // 2:
+            raise ValueError("Tabela de comprimentos de código truncada")
+        lengths = [nibble for value in packed for nibble in (value >> 4, value & 0x0F)]
+        return dict(zip(present, lengths)), position + len(packed)
 
-        nodes = [Node(bytes([byte]), freq) for byte, freq in byte_count.items()]
-        heapq.heapify(nodes)
+    @staticmethod
+    def pack_codes(codes: np.ndarray, lengths: np.ndarray, carry: int = 0, carry_bits: int = 0) -> Tuple[bytes, int, int]:
+        """
+        Empacota códigos de comprimento variável (arrays int64 paralelos, até 64 bits cada),
+        depois de carry_bits bits pendentes do bloco anterior.
+        Os códigos são posicionados em palavras de 64 bits (int64) com NumPy: como não se
+        sobrepõem, a soma dos códigos de cada palavra equivale ao OU de seus bits.
+        Retorna (bytes completos, bits que sobraram, quantidade desses bits).
+        """
+        if not len(codes):
+            return b'', carry, carry_bits
+        ends = np.cumsum(lengths)
+        ends += carry_bits
+        starts = ends - lengths
+        total_bits = int(ends[-1])
+
+        # Deslocamento de cada código dentro da sua palavra; negativo se ele continua na palavra seguinte
+        shifts = 64 - (starts & 63) - lengths
+        high_parts = (codes << np.maximum(shifts, 0)) >> np.maximum(-shifts, 0)
+        word_index = starts >> 6
+        first_in_word = np.flatnonzero(np.diff(word_index, prepend=-1))
+        words = np.zeros(total_bits // 64 + 1, dtype=np.int64)
+        words[word_index[first_in_word]] = np.add.reduceat(high_parts, first_in_word)
+        spanning = np.flatnonzero(shifts < 0)
+        words[word_index[spanning] + 1] |= codes[spanning] << (64 + shifts[spanning])
+        if carry_bits:
+            words[0] |= np.uint64(carry << (64 - carry_bits)).view(np.int64)
+
+        packed = words.view(np.uint64).astype('>u8').tobytes()
+        full_bytes, remaining_bits = divmod(total_bits, 8)
+        remaining = packed[full_bytes] >> (8 - remaining_bits) if remaining_bits else 0
+        return packed[:full_bytes], remaining, remaining_bits
 
-        if progress_callback:
-            progress_callback(0.3, "Construindo árvore de Huffman...")
+    @staticmethod
+    def encode_block(data: bytes, code_array: np.ndarray, length_array: np.ndarray,
+                     carry: int = 0, carry_bits: int = 0) -> Tuple[bytes, int, int]:
+        """
+        Empacota os códigos (por byte em code_array/length_array) de um bloco de dados,
+        depois de carry_bits bits pendentes do bloco anterior; veja pack_codes.
+        """
+        symbols = np.frombuffer(data, dtype=np.uint8)
+        return HuffmanProcessor.pack_codes(code_array[symbols], length_array[symbols], carry, carry_bits)
 
-        total_nodes = len(nodes)
-        while len(nodes) > 1:
-            left = heapq.heappop(nodes)
-            right = heapq.heappop(nodes)
-            heapq.heappush(nodes, Node(None, left.freq + right.freq, left, right))
-            
-            if progress_callback and len(nodes) % 10 == 0:
-                progress = 0.3 + 0.7 * (1 - len(nodes)/total_nodes)
-                progress_callback(progress, f"Mesclando nós: {len(nodes)} restantes")
+    @staticmethod
+    def _encode_frame(chunk: bytes, code_array: np.ndarray, length_array: np.ndarray) -> bytes:
+        """Codifica um bloco como quadro v3: FRAME_HEADER seguido dos bits, completados até o byte."""
+        packed, carry, carry_bits = HuffmanProcessor.encode_block(chunk, code_array, length_array)
+        frame = HuffmanProcessor.FRAME_HEADER.pack(len(chunk), len(packed) * 8 + carry_bits) + packed
+        if carry_bits:
+            frame += bytes((carry << (8 - carry_bits),))
+        return frame
 
-        if progress_callback:
-            progress_callback(1.0, "Árvore de Huffman completa!")
-            time.sleep(0.3)
+    @staticmethod
+    @functools.lru_cache(maxsize=8)
+    def _stream_tables(code_lengths: Tuple[Tuple[int, int], ...]) -> Tuple[int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Tabelas de decodificação de um arquivo v3, reaproveitadas entre os quadros de cada processo."""
+        return HuffmanProcessor.build_lane_tables(HuffmanProcessor.canonical_codes(dict(code_lengths)))
 
-        return nodes[0]
+    @staticmethod
+    def _decode_frame(payload: bytes, frame_bits: int, frame_size: int, code_lengths: Tuple[Tuple[int, int], ...]) -> bytes:
+        """Decodifica um quadro v3."""
+        return HuffmanProcessor.decode_lanes(payload, frame_bits, frame_size, HuffmanProcessor._stream_tables(code_lengths))
 
     @staticmethod
-    def build_codebook(root: Optional[Node]) -> Dict[bytes, str]:
-        """Geração otimizada de livro de códigos com DFS iterativo"""
-        if not root:
-            return {}
+    def compress_stream(input_path: str, output_path: str, progress_callback: Optional[Callable[[float, str], None]] = None,
+                        workers: int = HUFFMAN_WORKERS) -> Tuple[int, int, float, float]:
+        """
+        Compressão em fluxo (formato v3) com memória limitada: uma primeira passagem conta as
+        frequências em blocos de HUFFMAN_ENCODE_BLOCK_SIZE bytes; a segunda codifica cada bloco
+        como um quadro independente, em até `workers` processos. Ao final grava o índice de
+        quadros (INDEX_ENTRY por quadro e INDEX_TRAILER), usado por read_range.
+        """
+        start_time = time.time()
+        original_size = os.path.getsize(input_path)
+        if original_size == 0:
+            return 0, 0, 0.0, 0.0
 
-        codebook = {}
-        stack = [(root, "")]
-        
-        while stack:
-            node, code = stack.pop()
-            if node.char is not None:
-                codebook[node.char] = code or '0'
-            else:
-                stack.append((node.right, code + '1'))
-                stack.append((node.left, code + '0'))
-        
-        return codebook
+        # Passo 1: Frequências, lidas em blocos
+        if progress_callback:
+            progress_callback(0, "Analisando frequências dos bytes...")
+        byte_counts = np.zeros(256, dtype=np.int64)
+        bytes_counted = 0
+        with open(input_path, 'rb') as file:
+            while chunk := file.read(HUFFMAN_ENCODE_BLOCK_SIZE):
+                byte_counts += np.bincount(np.frombuffer(chunk, dtype=np.uint8), minlength=256)
+                bytes_counted += len(chunk)
+                if progress_callback:
+                    progress_callback(0.3 * bytes_counted / original_size, f"Analisados {bytes_counted}/{original_size} bytes")
+        frequencies = {byte: int(count) for byte, count in enumerate(byte_counts) if count}
+        code_lengths = HuffmanProcessor.build_code_lengths(frequencies)
+        codes = HuffmanProcessor.canonical_codes(code_lengths)
+        code_array = np.zeros(256, dtype=np.int64)
+        length_array = np.zeros(256, dtype=np.int64)
+        for byte, (code, length) in codes.items():
+            code_array[byte] = code
+            length_array[byte] = length
+
+        # Passo 2: Um quadro por bloco, codificados em paralelo e gravados na ordem original
+        workers = max(1, min(workers, -(-original_size // HUFFMAN_ENCODE_BLOCK_SIZE)))
+        with open(input_path, 'rb') as source, open(output_path, 'wb') as file:
+            file.write(HuffmanProcessor.STREAM_HEADER.pack(HuffmanProcessor.STREAM_MAGIC, original_size))
+            file.write(HuffmanProcessor._pack_code_lengths(code_lengths))
+            chunks = iter(lambda: source.read(HUFFMAN_ENCODE_BLOCK_SIZE), b'')
+            frames = run_ordered(HuffmanProcessor._encode_frame,
+                                                   ((chunk, code_array, length_array) for chunk in chunks), workers)
+            index = []
+            bytes_processed = 0
+            for frame in frames:
+                index.append(HuffmanProcessor.INDEX_ENTRY.pack(bytes_processed, file.tell()))
+                file.write(frame)
+                bytes_processed += HuffmanProcessor.FRAME_HEADER.unpack_from(frame)[0]
+                if progress_callback:
+                    progress = 0.3 + 0.7 * (bytes_processed / original_size)
+                    progress_callback(progress, f"Comprimidos {bytes_processed}/{original_size} bytes")
+
+            index_position = file.tell()
+            file.write(b''.join(index))
+            file.write(HuffmanProcessor.INDEX_TRAILER.pack(index_position, len(index), HuffmanProcessor.INDEX_MAGIC))
+
+        compressed_size = os.path.getsize(output_path)
+        compression_ratio = (original_size - compressed_size) / original_size * 100
+        process_time = time.time() - start_time
+
+        if progress_callback:
+            progress_callback(1.0, "Compressão completa!")
+
+        return original_size, compressed_size, compression_ratio, process_time
 
     @staticmethod
-    def compress_file(input_path: str, output_path: str, progress_callback: Optional[Callable[[float, str], None]] = None) -> Tuple[int, int, float, float]:
-        """Compressão otimizada com rastreamento de progresso"""
+    def compress_file(input_path: str, output_path: str, progress_callback: Optional[Callable[[float, str], None]] = None,
+                      streaming: Optional[bool] = None) -> Tuple[int, int, float, float]:
+        """
+        Compressão com códigos canônicos de comprimento limitado (formato v2) e rastreamento de progresso.
+        streaming=True usa compress_stream (formato v3); com None, ele é usado apenas para arquivos
+        maiores que MAX_FILE_SIZE_MB, como em LZWProcessor.compress. O formato gravado não depende
+        do número de processadores.
+        """
+        if streaming is None:
+            streaming = os.path.getsize(input_path) > MAX_FILE_SIZE_MB * 1024 * 1024
+        if streaming:
+            return HuffmanProcessor.compress_stream(input_path, output_path, progress_callback)
+
         start_time = time.time()
         
         # Lê o arquivo de entrada como binário
@@ -2216,78 +4197,58 @@ class HuffmanProcessor:
 
         original_size = len(data)
         
-        
-        # Ignora a compressão para arquivos pequenos
+        # Arquivos pequenos são armazenados sem compressão, ainda com o cabeçalho v2
         if original_size < MIN_COMPRESSION_SIZE:
             with open(output_path, 'wb') as file:
+                file.write(HuffmanProcessor.V2_HEADER.pack(HuffmanProcessor.V2_MAGIC, HuffmanProcessor.MODE_STORED, 0, original_size))
                 file.write(data)
-            return original_size, original_size, 0.0, time.time() - start_time
+            compressed_size = os.path.getsize(output_path)
+            return original_size, compressed_size, (original_size - compressed_size) / original_size * 100, time.time() - start_time
 
-        # Passo 1: Constrói a árvore de Huffman
+        # Passo 1: Frequências e comprimentos de código limitados
         if progress_callback:
-            progress_callback(0, "Construindo Árvore de Huffman...")
-        root = HuffmanProcessor.generate_tree(
-            data, 
-            lambda p, m: progress_callback(p * 0.3, f"Huffman: {m}") if progress_callback else None
-        )
+            progress_callback(0, "Analisando frequências dos bytes...")
+        byte_counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+        frequencies = {byte: int(count) for byte, count in enumerate(byte_counts) if count}
+        if progress_callback:
+            progress_callback(0.2, "Calculando comprimentos de código...")
+        code_lengths = HuffmanProcessor.build_code_lengths(frequencies)
 
-        # Passo 2: Constrói o livro de códigos
+        # Passo 2: Códigos canônicos
         if progress_callback:
             progress_callback(0.3, "Gerando dicionário de codificação...")
-        codebook = HuffmanProcessor.build_codebook(root)
-        
-        # Cria pesquisa reversa para codificação mais rápida
-        encode_table = {byte[0]: code for byte, code in codebook.items()}  # byte[0] pois sabemos que são bytes únicos
+        codes = HuffmanProcessor.canonical_codes(code_lengths)
+        code_array = np.zeros(256, dtype=np.int64)
+        length_array = np.zeros(256, dtype=np.int64)
+        for byte, (code, length) in codes.items():
+            code_array[byte] = code
+            length_array[byte] = length
+        total_bits = sum(frequency * code_lengths[byte] for byte, frequency in frequencies.items())
 
         # Passo 3: Comprime os dados
         if progress_callback:
             progress_callback(0.4, "Comprimindo dados...")
 
         with open(output_path, 'wb') as file:
-            # Escreve a tabela de caracteres (formato otimizado)
-            file.write(struct.pack('I', len(codebook)))
-            for byte, code in codebook.items():
-                file.write(struct.pack('B', byte[0]))  # Byte único
-                file.write(struct.pack('B', len(code)))
-                file.write(struct.pack('I', int(code, 2)))
-
-            # Escreve o tamanho dos dados
-            file.write(struct.pack('I', original_size))
-
-            # Escrita de bits em buffer
-            buffer = bytearray()
-            current_byte = 0
-            bit_count = 0
-            bytes_processed = 0
-            
-            for byte in data:
-                code = encode_table[byte]
-                for bit in code:
-                    current_byte = (current_byte << 1) | (bit == '1')
-                    bit_count += 1
-                    if bit_count == 8:
-                        buffer.append(current_byte)
-                        if len(buffer) >= BUFFER_SIZE:
-                            file.write(buffer)
-                            buffer.clear()
-                        current_byte = 0
-                        bit_count = 0
-                
-                bytes_processed += 1
-                if progress_callback and bytes_processed % 1000 == 0:
+            # Cabeçalho v2: apenas os comprimentos dos códigos
+            file.write(HuffmanProcessor.V2_HEADER.pack(HuffmanProcessor.V2_MAGIC, HuffmanProcessor.MODE_HUFFMAN,
+                                                       -total_bits % 8, original_size))
+            file.write(HuffmanProcessor._pack_code_lengths(code_lengths))
+
+            # Codifica em blocos; os bits que não completam um byte passam para o bloco seguinte
+            carry, carry_bits = 0, 0
+            for block_start in range(0, original_size, HUFFMAN_ENCODE_BLOCK_SIZE):
+                packed, carry, carry_bits = HuffmanProcessor.encode_block(
+                    data[block_start:block_start + HUFFMAN_ENCODE_BLOCK_SIZE], code_array, length_array, carry, carry_bits)
+                file.write(packed)
+                if progress_callback:
+                    bytes_processed = min(block_start + HUFFMAN_ENCODE_BLOCK_SIZE, original_size)
                     progress = 0.4 + 0.6 * (bytes_processed / original_size)
                     progress_callback(progress, f"Comprimidos {bytes_processed}/{original_size} bytes")
 
             # Descarrega bits restantes
-            if bit_count > 0:
-                current_byte <<= (8 - bit_count)
-                buffer.append(current_byte)
-            
-            if buffer:
-                file.write(buffer)
-            
-            # Escreve o tamanho do preenchimento
-            file.write(struct.pack('B', (8 - bit_count) % 8))
+            if carry_bits:
+                file.write(bytes((carry << (8 - carry_bits),)))
 
         compressed_size = os.path.getsize(output_path)
         compression_ratio = (original_size - compressed_size) / original_size * 100
@@ -2298,202 +4259,1050 @@ class HuffmanProcessor:
 
         return original_size, compressed_size, compression_ratio, process_time
 
+    @staticmethod
+    def build_decode_tables(codes: Dict[int, Tuple[int, int]], table_bits: int = HUFFMAN_TABLE_BITS) -> Tuple[int, list, dict]:
+        """
+        Monta as tabelas de decodificação de um código de prefixo {byte: (código, comprimento)}.
+        Tabela primária: indexada pelos próximos table_bits bits; cada entrada guarda
+        (bits consumidos, bytes decodificados) com todos os códigos completos que cabem
+        nesses bits, ou None se o primeiro código for mais longo.
+        Subtabelas de estouro: {primeiros table_bits bits: (bits extras, [(byte, comprimento)])}.
+        """
+        size = 1 << table_bits
+        mask = size - 1
+        single = [None] * size # (byte, comprimento) dos códigos curtos
+        long_codes = defaultdict(list)
+        for byte, (code, length) in codes.items():
+            if length <= table_bits:
+                start = code << (table_bits - length)
+                single[start:start + (1 << (table_bits - length))] = [(byte, length)] * (1 << (table_bits - length))
+            else:
+                long_codes[code >> (length - table_bits)].append((byte, code, length))
+
+        subtables = {}
+        for prefix, entries in long_codes.items():
+            extra_bits = max(length for _, _, length in entries) - table_bits
+            subtable = [None] * (1 << extra_bits)
+            for byte, code, length in entries:
+                free_bits = extra_bits - (length - table_bits)
+                start = (code & ((1 << (length - table_bits)) - 1)) << free_bits
+                subtable[start:start + (1 << free_bits)] = [(byte, length)] * (1 << free_bits)
+            subtables[prefix] = (extra_bits, subtable)
+
+        primary = [None] * size
+        for window in range(size):
+            consumed = 0
+            decoded = bytearray()
+            while consumed < table_bits:
+                entry = single[(window << consumed) & mask]
+                if entry is None or consumed + entry[1] > table_bits:
+                    break
+                decoded.append(entry[0])
+                consumed += entry[1]
+            if decoded:
+                primary[window] = (consumed, bytes(decoded))
+        return table_bits, primary, subtables
+
+    @staticmethod
+    def _peek_bits(data: bytes, bit_position: int, bit_count: int) -> int:
+        """Lê bit_count bits a partir de bit_position (data deve ter bytes de folga no fim)."""
+        start = bit_position >> 3
+        end = (bit_position + bit_count + 7) >> 3
+        chunk = int.from_bytes(data[start:end], 'big')
+        return (chunk >> ((end - start) * 8 - (bit_position & 7) - bit_count)) & ((1 << bit_count) - 1)
+
+    @staticmethod
+    def decode_bits(data: bytes, total_bits: int, data_size: int, tables: Tuple[int, list, dict],
+                    progress_callback: Optional[Callable[[float, str], None]] = None) -> bytes:
+        """
+        Decodifica os primeiros total_bits bits de data com as tabelas de build_decode_tables.
+        Cada consulta à tabela primária resolve vários símbolos; códigos mais longos que a
+        tabela passam pela subtabela do seu prefixo. Levanta ValueError para fluxos corrompidos.
+        """
+        table_bits, primary, subtables = tables
+        mask = (1 << table_bits) - 1
+        shift = 32 - table_bits
+        padded = bytes(data) + bytes(8) # Folga para as janelas do fim do fluxo
+        padded_array = np.frombuffer(padded, dtype=np.uint8).astype(np.uint32)
+        parts = []
+        append = parts.append
+        decoded_count = 0
+        position = 0 # Posição em bits relativa ao início do bloco
+        total_bytes = (total_bits + 7) >> 3
+        for block_start in range(0, total_bytes, HUFFMAN_DECODE_BLOCK_SIZE):
+            # Janela de 32 bits começando em cada byte do bloco
+            block = padded_array[block_start:block_start + HUFFMAN_DECODE_BLOCK_SIZE + 4]
+            windows = ((block[:-3] << 24) | (block[1:-2] << 16) | (block[2:-1] << 8) | block[3:]).tolist()
+            block_base = block_start * 8
+            block_end = min(HUFFMAN_DECODE_BLOCK_SIZE * 8, total_bits - block_base)
+            first_part = len(parts)
+            while position < block_end:
+                entry = primary[(windows[position >> 3] >> (shift - (position & 7))) & mask]
+                if entry is not None:
+                    append(entry[1])
+                    position += entry[0]
+                    continue
+                bit_position = block_base + position
+                subtable = subtables.get(HuffmanProcessor._peek_bits(padded, bit_position, table_bits))
+                if subtable is None:
+                    raise ValueError(f"Código de Huffman inválido na posição de bit {bit_position}")
+                extra_bits, entries = subtable
+                long_entry = entries[HuffmanProcessor._peek_bits(padded, bit_position + table_bits, extra_bits)]
+                if long_entry is None:
+                    raise ValueError(f"Código de Huffman inválido na posição de bit {bit_position}")
+                append(bytes((long_entry[0],)))
+                position += long_entry[1]
+            position -= HUFFMAN_DECODE_BLOCK_SIZE * 8 # Código que atravessa o fim do bloco
+
+            decoded_count += sum(map(len, itertools.islice(parts, first_part, None)))
+            if progress_callback:
+                progress = 0.3 + 0.7 * min(decoded_count / max(data_size, 1), 1.0)
+                progress_callback(progress, f"Decodificados {min(decoded_count, data_size)}/{data_size} bytes")
+
+        output = b''.join(parts)
+        if len(output) < data_size:
+            raise ValueError(f"Fluxo de bits truncado: {len(output)} de {data_size} bytes decodificados")
+        return output[:data_size] # Descarta símbolos lidos dos bits de preenchimento
+
+    LANE_SYMBOLS = 4 # Símbolos resolvidos por consulta no decodificador vetorizado
+
+    @staticmethod
+    def build_lane_tables(codes: Dict[int, Tuple[int, int]]) -> Tuple[int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Tabelas do decodificador vetorizado para códigos de até HUFFMAN_MAX_CODE_LENGTH bits,
+        indexadas pelos próximos table_bits bits (o comprimento do código mais longo).
+        Retorna (table_bits, bits consumidos, até LANE_SYMBOLS bytes empacotados em uint32,
+        máscara dos bytes presentes, janelas sem código válido).
+        """
+        table_bits = max(length for _, length in codes.values())
+        size = 1 << table_bits
+        single_byte = np.zeros(size, dtype=np.uint8)
+        single_length = np.full(size, table_bits + 1, dtype=np.int64) # Sem código: nunca cabe na janela
+        for byte, (code, length) in codes.items():
+            start = code << (table_bits - length)
+            single_byte[start:start + (1 << (table_bits - length))] = byte
+            single_length[start:start + (1 << (table_bits - length))] = length
+
+        windows = np.arange(size, dtype=np.int64)
+        consumed = np.zeros(size, dtype=np.int64)
+        symbols = np.zeros((size, HuffmanProcessor.LANE_SYMBOLS), dtype=np.uint8)
+        present = np.zeros((size, HuffmanProcessor.LANE_SYMBOLS), dtype=bool)
+        fits = np.ones(size, dtype=bool)
+        for slot in range(HuffmanProcessor.LANE_SYMBOLS):
+            index = (windows << consumed) & (size - 1)
+            length = single_length[index]
+            fits &= consumed + length <= table_bits
+            symbols[fits, slot] = single_byte[index[fits]]
+            present[fits, slot] = True
+            consumed[fits] += length[fits]
+        invalid = consumed == 0
+        consumed[invalid] = 1 # Mantém as faixas especulativas andando; o erro só conta em posições reais
+        return (table_bits, consumed.astype(np.int32), symbols.view(np.uint32).ravel(),
+                present.view(np.uint32).ravel(), invalid)
+
+    @staticmethod
+    def _lane_windows(padded: bytes, start: int, count: int) -> np.ndarray:
+        """Janela big-endian de 32 bits começando em cada um dos count bytes a partir de start."""
+        windows = np.empty(-(-count // 4) * 4, dtype=np.int32)
+        quads = windows.reshape(-1, 4)
+        for offset in range(4):
+            quads[:, offset] = np.frombuffer(padded, dtype='>i4', count=len(quads), offset=start + offset)
+        return windows
+
+    @staticmethod
+    def _decode_lanes(windows: np.ndarray, begin: int, end: int, consumed: np.ndarray,
+                      table_bits: int) -> Optional[Tuple[np.ndarray, np.ndarray, int]]:
+        """
+        Decodifica os bits [begin, end) de um bloco em faixas de HUFFMAN_LANE_BITS bits.
+        Primeira passada: todas as faixas avançam juntas a partir do início nominal, que
+        normalmente cai no meio de um código. Segunda passada: a partir da saída real da faixa
+        anterior, cada faixa desalinhada avança até reencontrar uma posição já visitada,
+        descartando o que foi lido antes dela. Retorna (entradas da tabela, máscara das
+        consultas verdadeiras, posição de saída) ou None se as faixas não se
+        ressincronizarem em HUFFMAN_SYNC_STEPS consultas.
+        """
+        shift = 32 - table_bits
+        mask = (1 << table_bits) - 1
+        lane_starts = np.arange(begin, end, HUFFMAN_LANE_BITS, dtype=np.int32)
+        lane_count = len(lane_starts)
+        lane_ends = np.minimum(lane_starts + HUFFMAN_LANE_BITS, end).astype(np.int32)
+
+        cursors = lane_starts
+        position_rows, entry_rows = [], []
+        while True:
+            for _ in range(8):
+                entry = (windows.take(cursors >> 3, mode='clip') >> (shift - (cursors & 7))) & mask
+                position_rows.append(cursors)
+                entry_rows.append(entry)
+                cursors = cursors + consumed.take(entry)
+            if (cursors >= lane_ends).all():
+                break
+        position_rows.append(cursors) # Posições de saída; a linha nunca é mantida
+        entry_rows.append(np.zeros_like(entry))
+        positions = np.array(position_rows)
+        entries = np.array(entry_rows)
+        inside = positions < lane_ends
+        exits = positions[np.count_nonzero(inside, axis=0), np.arange(lane_count)]
+        visited = np.zeros(end - begin + 64, dtype=bool)
+        visited[positions[inside] - begin] = True
+
+        # Entrada real de cada faixa: a saída da faixa anterior
+        starts = np.empty(lane_count, dtype=np.int32)
+        starts[0] = begin
+        starts[1:] = exits[:-1]
+        synced = visited[np.minimum(starts, end) - begin]
+        synced[0] = True
+        misaligned = np.flatnonzero(~synced)
+        cursors = starts[misaligned]
+        active = (cursors < end) & ~visited[np.minimum(cursors, end) - begin]
+        resync_positions, resync_entries = [], []
+        while active.any():
+            if len(resync_positions) == HUFFMAN_SYNC_STEPS:
+                return None
+            entry = (windows.take(cursors >> 3, mode='clip') >> (shift - (cursors & 7))) & mask
+            resync_positions.append(np.where(active, cursors, -1))
+            resync_entries.append(entry)
+            cursors = cursors + np.where(active, consumed.take(entry), 0)
+            active &= (cursors < end) & ~visited[np.minimum(cursors, end) - begin]
+
+        # Cada faixa desalinhada vale a partir do ponto onde reencontrou a primeira passada;
+        # se esse ponto está em faixas seguintes, as faixas puladas são descartadas
+        never = np.int32(np.iinfo(np.int32).max)
+        valid_from = np.where(synced, starts, never)
+        use_resync = np.zeros(lane_count, dtype=bool)
+        use_resync[misaligned] = True
+        merge_lane = np.where(cursors < end, (cursors - begin) // HUFFMAN_LANE_BITS, lane_count)
+        own = merge_lane == misaligned
+        valid_from[misaligned[own]] = cursors[own]
+        exit_position = int(exits[-1])
+        skipped = np.zeros(lane_count, dtype=bool)
+        for index in np.flatnonzero(~own):
+            lane = misaligned[index]
+            if skipped[lane]:
+                continue
+            target = merge_lane[index]
+            valid_from[lane + 1:target] = never
+            use_resync[lane + 1:target + 1] = False
+            skipped[lane + 1:target + 1] = True
+            if target < lane_count:
+                valid_from[target] = cursors[index]
+            else:
+                exit_position = int(cursors[index])
+        keep = inside & (positions >= valid_from)
+        if resync_positions:
+            rows = len(resync_positions)
+            resync_keep = np.zeros((rows, lane_count), dtype=bool)
+            resync_keep[:, misaligned] = (np.array(resync_positions) >= 0) & use_resync[misaligned]
+            resync_table = np.zeros((rows, lane_count), dtype=np.int32)
+            resync_table[:, misaligned] = np.array(resync_entries)
+            entries = np.concatenate([resync_table, entries])
+            keep = np.concatenate([resync_keep, keep])
+        return entries, keep, exit_position
+
+    @staticmethod
+    def _decode_sequential(windows: np.ndarray, begin: int, end: int, consumed: np.ndarray,
+                           table_bits: int) -> Tuple[np.ndarray, int]:
+        """Decodifica os bits [begin, end) consulta a consulta; usado quando as faixas não se ressincronizam."""
+        shift = 32 - table_bits
+        mask = (1 << table_bits) - 1
+        consumed_list = consumed.tolist()
+        entries = []
+        append = entries.append
+        position = begin
+        while position < end:
+            base = position >> 3
+            chunk = windows[base:base + HUFFMAN_DECODE_BLOCK_SIZE].tolist()
+            limit = min(end - base * 8, len(chunk) * 8)
+            relative = position - base * 8
+            while relative < limit:
+                entry = (chunk[relative >> 3] >> (shift - (relative & 7))) & mask
+                append(entry)
+                relative += consumed_list[entry]
+            position = base * 8 + relative
+        return np.array(entries, dtype=np.int32).reshape(-1, 1), position
+
+    @staticmethod
+    def decode_lanes(data: bytes, total_bits: int, data_size: int, tables: Tuple[int, np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+                     progress_callback: Optional[Callable[[float, str], None]] = None) -> bytes:
+        """
+        Decodifica os primeiros total_bits bits de data com as tabelas de build_lane_tables,
+        em blocos de HUFFMAN_LANE_BLOCK_SIZE bytes decodificados em faixas paralelas pelo NumPy
+        (ver _decode_lanes). Códigos em que as faixas não se ressincronizam (todos do mesmo
+        comprimento, por exemplo) caem para a decodificação sequencial de decode_bits.
+        Levanta ValueError para fluxos corrompidos.
+        """
+        table_bits, consumed, symbols, present, invalid = tables
+        check_invalid = bool(invalid.any())
+        padded = bytes(data) + bytes(16) # Folga para as janelas do fim do fluxo
+        parts = []
+        decoded_count = 0
+        position = 0
+        while position < total_bits:
+            byte_start = position >> 3
+            block_end = min(total_bits - byte_start * 8, HUFFMAN_LANE_BLOCK_SIZE * 8)
+            windows = HuffmanProcessor._lane_windows(padded, byte_start, min(HUFFMAN_LANE_BLOCK_SIZE, len(padded) - byte_start - 8))
+            begin = position - byte_start * 8
+            decoded = HuffmanProcessor._decode_lanes(windows, begin, block_end, consumed, table_bits)
+            if decoded is None:
+                entries, exit_position = HuffmanProcessor._decode_sequential(windows, begin, block_end, consumed, table_bits)
+                keep = np.ones(entries.shape, dtype=bool)
+            else:
+                entries, keep, exit_position = decoded
+            entries, keep = entries.T, keep.T # Ordem do fluxo: faixa por faixa
+            if check_invalid and invalid.take(entries[keep]).any():
+                raise ValueError(f"Código de Huffman inválido no bloco que começa no bit {position}")
+            selected = present.take(entries) * keep
+            part = symbols.take(entries).view(np.uint8).reshape(-1)[selected.view(np.bool_).reshape(-1)]
+            parts.append(part.tobytes())
+            decoded_count += len(part)
+            position = byte_start * 8 + exit_position
+            if progress_callback:
+                progress = 0.3 + 0.7 * min(decoded_count / max(data_size, 1), 1.0)
+                progress_callback(progress, f"Decodificados {min(decoded_count, data_size)}/{data_size} bytes")
+
+        output = b''.join(parts)
+        if len(output) < data_size:
+            raise ValueError(f"Fluxo de bits truncado: {len(output)} de {data_size} bytes decodificados")
+        return output[:data_size] # Descarta símbolos lidos dos bits de preenchimento
+
+    @staticmethod
+    def _parse_header(content: bytes) -> Tuple[Optional[Dict[int, Tuple[int, int]]], int, memoryview, int]:
+        """
+        Lê o cabeçalho de um arquivo .huff, no formato v2 (comprimentos canônicos) ou no formato
+        original (byte, comprimento e código de cada símbolo, preenchimento no último byte).
+        Retorna (códigos, tamanho original, fluxo de bits, bits válidos); códigos é None para
+        arquivos armazenados sem compressão.
+        """
+        if content[:4] == HuffmanProcessor.V2_MAGIC:
+            _, mode, padding_bits, data_size = HuffmanProcessor.V2_HEADER.unpack_from(content)
+            position = HuffmanProcessor.V2_HEADER.size
+            if mode == HuffmanProcessor.MODE_STORED:
+                stored = memoryview(content)[position:]
+                if len(stored) != data_size:
+                    raise ValueError(f"Arquivo armazenado truncado: {len(stored)} de {data_size} bytes")
+                return None, data_size, stored, len(stored) * 8
+            if mode != HuffmanProcessor.MODE_HUFFMAN:
+                raise ValueError(f"Modo de arquivo .huff desconhecido: {mode}")
+            code_lengths, position = HuffmanProcessor._unpack_code_lengths(content, position)
+            bitstream = memoryview(content)[position:]
+            return HuffmanProcessor.canonical_codes(code_lengths), data_size, bitstream, len(bitstream) * 8 - padding_bits
+
+        # Formato original
+        table_size = struct.unpack_from('I', content, 0)[0]
+        position = 4
+        codes = {}
+        for _ in range(table_size):
+            byte, code_length, code_int = struct.unpack_from('=BBI', content, position)
+            codes[byte] = (code_int, code_length)
+            position += 6
+        data_size = struct.unpack_from('I', content, position)[0]
+        position += 4
+        padding_bits = content[-1]
+        bitstream = memoryview(content)[position:-1]
+        return codes, data_size, bitstream, len(bitstream) * 8 - padding_bits
+
+    @staticmethod
+    def _read_stream_header(file: BinaryIO) -> Tuple[int, Tuple[Tuple[int, int], ...]]:
+        """Lê o cabeçalho v3 após o magic; retorna (tamanho original, comprimentos dos códigos)."""
+        data_size = struct.unpack('<Q', file.read(8))[0]
+        bitmap = file.read(32) # Bitmap de símbolos presentes seguido de um nibble por símbolo
+        nibbles = file.read((sum(bin(byte).count('1') for byte in bitmap) + 1) // 2)
+        code_lengths, _ = HuffmanProcessor._unpack_code_lengths(bitmap + nibbles, 0)
+        return data_size, tuple(sorted(code_lengths.items()))
+
+    @staticmethod
+    def _read_frames(file: BinaryIO, data_size: int, code_lengths: Tuple[Tuple[int, int], ...]) -> Iterator[tuple]:
+        """Produz os argumentos de _decode_frame para cada quadro, a partir da posição atual de file."""
+        decoded_count = 0
+        while decoded_count < data_size:
+            frame_header = file.read(HuffmanProcessor.FRAME_HEADER.size)
+            if len(frame_header) < HuffmanProcessor.FRAME_HEADER.size:
+                raise ValueError(f"Fluxo truncado: {decoded_count} de {data_size} bytes decodificados")
+            frame_size, frame_bits = HuffmanProcessor.FRAME_HEADER.unpack(frame_header)
+            payload = file.read((frame_bits + 7) // 8)
+            if len(payload) * 8 < frame_bits:
+                raise ValueError(f"Quadro truncado após {decoded_count} bytes decodificados")
+            yield payload, frame_bits, frame_size, code_lengths
+            decoded_count += frame_size
+
+    @staticmethod
+    def _decompress_stream(file: BinaryIO, output_path: str, progress_callback: Optional[Callable[[float, str], None]] = None,
+                           workers: int = HUFFMAN_WORKERS) -> None:
+        """Decodifica um arquivo v3 quadro a quadro, em até `workers` processos; file deve estar posicionado após o magic."""
+        data_size, code_lengths = HuffmanProcessor._read_stream_header(file)
+        HuffmanProcessor._stream_tables(code_lengths) # Valida a tabela antes de iniciar os processos
+        if progress_callback:
+            progress_callback(0.1, "Decodificando...")
+
+        workers = max(1, min(workers, -(-data_size // HUFFMAN_ENCODE_BLOCK_SIZE)))
+        decoded_count = 0
+        with open(output_path, 'wb') as output:
+            frames = HuffmanProcessor._read_frames(file, data_size, code_lengths)
+            for decoded in run_ordered(HuffmanProcessor._decode_frame, frames, workers):
+                output.write(decoded)
+                decoded_count += len(decoded)
+                if progress_callback:
+                    progress = 0.1 + 0.9 * min(decoded_count / data_size, 1.0)
+                    progress_callback(progress, f"Decodificados {min(decoded_count, data_size)}/{data_size} bytes")
+
+    @staticmethod
+    def read_range(input_path: str, offset: int, length: int) -> bytes:
+        """
+        Acesso aleatório a um arquivo .huff v3: decodifica apenas os quadros que cobrem
+        [offset, offset + length) do arquivo original, localizados pelo índice de quadros.
+        """
+        if offset < 0 or length < 0:
+            raise ValueError("offset e length devem ser não negativos")
+        with open(input_path, 'rb') as file:
+            if file.read(4) != HuffmanProcessor.STREAM_MAGIC:
+                raise ValueError(f"{input_path} não é um arquivo .huff em fluxo (v3)")
+            data_size, code_lengths = HuffmanProcessor._read_stream_header(file)
+            end = min(offset + length, data_size)
+            if offset >= end:
+                return b''
+
+            file.seek(-HuffmanProcessor.INDEX_TRAILER.size, os.SEEK_END)
+            index_position, frame_count, magic = HuffmanProcessor.INDEX_TRAILER.unpack(file.read(HuffmanProcessor.INDEX_TRAILER.size))
+            if magic != HuffmanProcessor.INDEX_MAGIC:
+                raise ValueError(f"{input_path} não possui índice de quadros")
+            file.seek(index_position)
+            index = list(HuffmanProcessor.INDEX_ENTRY.iter_unpack(file.read(frame_count * HuffmanProcessor.INDEX_ENTRY.size)))
+            starts = [frame_start for frame_start, _ in index]
+
+            first = bisect.bisect_right(starts, offset) - 1
+            file.seek(index[first][1])
+            frames = HuffmanProcessor._read_frames(file, end - starts[first], code_lengths)
+            decoded = b''.join(HuffmanProcessor._decode_frame(*args) for args in frames)
+            return decoded[offset - starts[first]:end - starts[first]]
+
     @staticmethod
     def decompress_file(input_path: str, output_path: str, progress_callback: Optional[Callable[[float, str], None]] = None) -> Tuple[int, int, float, float]:
-        """Descompressão otimizada com rastreamento de progresso"""
+        """Descompressão por tabelas de consulta com rastreamento de progresso; arquivos v3 são lidos em fluxo"""
         start_time = time.time()
         
-        # Descompressão reestruturada com preenchimento considerado
         with open(input_path, 'rb') as file:
-            # Lê a tabela de caracteres
-            table_size = struct.unpack('I', file.read(4))[0]
-            code_table = {}
-            max_code_length = 0
-            
+            streamed = file.read(4) == HuffmanProcessor.STREAM_MAGIC
+            if streamed:
+                HuffmanProcessor._decompress_stream(file, output_path, progress_callback)
+            else:
+                file.seek(0)
+                content = file.read()
+
+        if not streamed:
             if progress_callback:
                 progress_callback(0.1, "Lendo metadados...")
+            codes, data_size, bitstream, total_bits = HuffmanProcessor._parse_header(content)
+
+            if codes is None: # Arquivo pequeno armazenado sem compressão
+                decoded_data = bytes(bitstream)
+            else:
+                if progress_callback:
+                    progress_callback(0.2, "Montando tabelas de decodificação...")
+                if max(length for _, length in codes.values()) <= HUFFMAN_MAX_CODE_LENGTH:
+                    tables = HuffmanProcessor.build_lane_tables(codes)
+                    decode = HuffmanProcessor.decode_lanes
+                else: # Arquivos no formato original podem ter códigos de até 32 bits
+                    tables = HuffmanProcessor.build_decode_tables(codes)
+                    decode = HuffmanProcessor.decode_bits
+
+                if progress_callback:
+                    progress_callback(0.3, "Decodificando...")
+                decoded_data = decode(bitstream, total_bits, data_size, tables, progress_callback)
+
+            with open(output_path, 'wb') as file:
+                file.write(decoded_data)
+
+        compressed_size = os.path.getsize(input_path)
+        decompressed_size = os.path.getsize(output_path)
+        compression_ratio = (compressed_size - decompressed_size) / compressed_size * 100 # Esta proporção é geralmente para compressão
+        process_time = time.time() - start_time
+
+        if progress_callback:
+            progress_callback(1.0, "Descompressão completa!")
+
+        return compressed_size, decompressed_size, compression_ratio, process_time
+
+
+# Implementação LZW
+class LZWProcessor:
+    STREAM_MAGIC = b'LZW3'
+    STREAM_HEADER = struct.Struct('<4sBQ') # Magic, largura máxima dos códigos, tamanho original
+    FRAME_HEADER = struct.Struct('<QQ') # Bytes decodificados do quadro, bytes de códigos do quadro
+    CLEAR_CODE = 256 # Reinicia o dicionário; o primeiro código livre passa a ser 257
+    HASH_INITIAL_BITS = 16 # Posições iniciais (até 2^16) da tabela hash do dicionário de compressão
+    HASH_MULTIPLIER = 2654435761 # Hash multiplicativo (Knuth) das chaves do dicionário
+
+    @staticmethod
+    def _unpack_codes(data: bytes, count: int, width: int) -> np.ndarray:
+        """Lê `count` códigos de largura fixa `width`, do bit mais significativo para o menos significativo."""
+        if len(data) * 8 < count * width:
+            raise ValueError(f"Esperava {count} códigos, mas obteve {len(data) * 8 // width}")
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=count * width)
+        weights = np.left_shift(1, np.arange(width - 1, -1, -1, dtype=np.int64))
+        return bits.reshape(count, width) @ weights
+
+    @staticmethod
+    def _read_codes(data: bytes, num_codes: int, width: int) -> Iterator[List[int]]:
+        """Produz os códigos de largura fixa de data em blocos de LZW_BLOCK_SIZE."""
+        for code_start in range(0, num_codes, LZW_BLOCK_SIZE):
+            count = min(LZW_BLOCK_SIZE, num_codes - code_start)
+            block_offset = code_start * width // 8
+            block = data[block_offset:block_offset + (count * width + 7) // 8]
+            yield LZWProcessor._unpack_codes(block, count, width).tolist()
+
+    @staticmethod
+    def _code_widths(indexes: np.ndarray, max_bits: int) -> np.ndarray:
+        """
+        Largura de cada código a partir do seu índice desde o último CLEAR: o código de índice k
+        é emitido quando o próximo código livre é 257 + k (limitado a 2^max_bits) e usa os bits
+        necessários para o maior código já atribuído.
+        """
+        next_codes = np.minimum(257 + indexes, 1 << max_bits)
+        thresholds = np.left_shift(1, np.arange(9, max_bits, dtype=np.int64))
+        return 9 + np.searchsorted(thresholds, next_codes - 1, side='right')
+
+    @staticmethod
+    def _code_indexes(is_clear: np.ndarray) -> np.ndarray:
+        """Índice de cada código desde o último CLEAR (is_clear marca as posições dos CLEAR)."""
+        segment_starts = np.zeros(len(is_clear), dtype=np.int64)
+        clears = np.flatnonzero(is_clear[:-1]) + 1
+        segment_starts[clears] = clears
+        return np.arange(len(is_clear), dtype=np.int64) - np.maximum.accumulate(segment_starts)
+
+    @staticmethod
+    def _pack_bits(values: np.ndarray, widths: np.ndarray) -> bytes:
+        """Empacota valores int64 com as larguras dadas em blocos de LZW_BLOCK_SIZE, completando o último byte."""
+        parts = []
+        carry, carry_bits = 0, 0
+        for start in range(0, len(values), LZW_BLOCK_SIZE):
+            block = slice(start, start + LZW_BLOCK_SIZE)
+            packed, carry, carry_bits = HuffmanProcessor.pack_codes(values[block], widths[block], carry, carry_bits)
+            parts.append(packed)
+        if carry_bits:
+            parts.append(bytes((carry << (8 - carry_bits),)))
+        return b''.join(parts)
+
+    @staticmethod
+    def _pack_code_blocks(blocks: Iterable[array.array], max_bits: int) -> Iterator[bytes]:
+        """
+        Empacota os blocos de códigos de um quadro com larguras crescentes, reiniciadas após cada
+        CLEAR; os bits pendentes e o índice desde o último CLEAR passam de um bloco para o seguinte.
+        """
+        index = 0 # Índice do próximo código desde o último CLEAR
+        carry, carry_bits = 0, 0
+        for codes in blocks:
+            code_array = np.frombuffer(codes, dtype=np.uint32).astype(np.int64)
+            is_clear = code_array == LZWProcessor.CLEAR_CODE
+            indexes = LZWProcessor._code_indexes(is_clear)
+            clears = np.flatnonzero(is_clear)
+            indexes[:int(clears[0]) + 1 if len(clears) else len(indexes)] += index
+            index = 0 if is_clear[-1] else int(indexes[-1]) + 1
+            packed, carry, carry_bits = HuffmanProcessor.pack_codes(
+                code_array, LZWProcessor._code_widths(indexes, max_bits), carry, carry_bits)
+            yield packed
+        if carry_bits:
+            yield bytes((carry << (8 - carry_bits),))
+
+    @staticmethod
+    def _extract_bits(padded: np.ndarray, starts: np.ndarray, widths: np.ndarray) -> np.ndarray:
+        """Lê os campos de até 25 bits que começam nos bits starts (padded deve ter 4 bytes de folga no fim)."""
+        byte_index = starts >> 3
+        windows = ((padded[byte_index].astype(np.int64) << 24) | (padded[byte_index + 1].astype(np.int64) << 16)
+                   | (padded[byte_index + 2].astype(np.int64) << 8) | padded[byte_index + 3])
+        return (windows >> (32 - (starts & 7) - widths)) & ((1 << widths) - 1)
+
+    @staticmethod
+    def _read_variable_codes(data: bytes, max_bits: int) -> Iterator[Tuple[List[int], int]]:
+        """
+        Inverso de _pack_variable_codes: produz (bloco de até LZW_BLOCK_SIZE códigos, bits lidos).
+        Cada bloco é lido supondo que não há CLEAR; se houver, o bloco termina nele e as larguras
+        recomeçam. Os bits de preenchimento do fim (menos que um código) são ignorados.
+        """
+        padded = np.frombuffer(bytes(data) + bytes(4), dtype=np.uint8)
+        total_bits = len(data) * 8
+        position = 0 # Bit do próximo código
+        index = 0 # Índice do próximo código desde o último CLEAR
+        while True:
+            widths = LZWProcessor._code_widths(np.arange(index, index + LZW_BLOCK_SIZE, dtype=np.int64), max_bits)
+            ends = position + np.cumsum(widths)
+            count = int(np.searchsorted(ends, total_bits, side='right'))
+            if count == 0:
+                return
+            widths, ends = widths[:count], ends[:count]
+            codes = LZWProcessor._extract_bits(padded, ends - widths, widths)
+
+            clears = np.flatnonzero(codes == LZWProcessor.CLEAR_CODE)
+            if len(clears):
+                count = int(clears[0]) + 1
+                index = 0
+            else:
+                index += count
+            position = int(ends[count - 1])
+            yield codes[:count].tolist(), position
+
+    @staticmethod
+    def _build_slots(keys: array.array, table_bits: int) -> array.array:
+        """Tabela hash com 2^table_bits posições (sondagem linear) para os códigos 257 em diante de keys."""
+        mask = (1 << table_bits) - 1
+        slots = array.array('I', bytes(4 << table_bits))
+        for code in range(257, len(keys)):
+            slot = (keys[code] * LZWProcessor.HASH_MULTIPLIER >> 8) & mask
+            while slots[slot]:
+                slot = (slot + 1) & mask
+            slots[slot] = code
+        return slots
+
+    @staticmethod
+    def _encode_blocks(read: Callable[[int], bytes], size: int, max_bits: int = LZW_MAX_CODE_BITS,
+                       block_callback: Optional[Callable[[int], None]] = None) -> Iterator[array.array]:
+        """
+        Codifica os size bytes lidos com read com um dicionário novo e produz os códigos, incluindo
+        os CLEAR emitidos, em blocos de pelo menos LZW_BLOCK_SIZE códigos (exceto o último).
+        O dicionário é uma tabela hash em arrays: keys[código] guarda a chave (código do prefixo
+        << 8) | próximo byte e slots o código de cada posição, mantida com no máximo metade das
+        posições ocupadas (12-20 bytes por entrada, contra cerca de 95 de um dict de inteiros).
+        A entrada é lida em trechos de LZW_RESET_CHECK_INTERVAL bytes; com o dicionário cheio, a
+        razão bytes/código desde o início é verificada a cada trecho e, se não subir, o dicionário
+        é reiniciado (como no compress(1)). block_callback recebe os bytes já processados a cada
+        LZW_BLOCK_SIZE.
+        """
+        if size <= 0:
+            return
+        max_codes = 1 << max_bits
+        multiplier = LZWProcessor.HASH_MULTIPLIER
+        initial_bits = min(LZWProcessor.HASH_INITIAL_BITS, (2 * size).bit_length()) # Quadros pequenos não precisam da tabela inteira
+        table_bits = initial_bits
+        mask = (1 << table_bits) - 1
+        slots = array.array('I', bytes(4 << table_bits))
+        keys = array.array('I', bytes(4 * 257)) # Os códigos 0-256 não têm chave
+        next_code = 257
+        codes = array.array('I')
+        emit = codes.append
+        emitted = 0 # Códigos dos blocos já produzidos
+        w = read(1)[0]
+        last_ratio = 0.0
+
+        position = 1
+        while position < size:
+            segment = read(min(LZW_RESET_CHECK_INTERVAL, size - position))
+            if not segment:
+                raise ValueError(f"Entrada terminou em {position} de {size} bytes")
+            for byte in segment:
+                key = (w << 8) | byte
+                slot = (key * multiplier >> 8) & mask
+                code = slots[slot]
+                while code:
+                    if keys[code] == key:
+                        break
+                    slot = (slot + 1) & mask
+                    code = slots[slot]
+                if code:
+                    w = code
+                    continue
+                emit(w)
+                # Adiciona a sequência ao dicionário apenas se ainda houver códigos livres
+                if next_code < max_codes:
+                    slots[slot] = next_code
+                    keys.append(key)
+                    next_code += 1
+                    if (next_code - 257) * 2 > 1 << table_bits:
+                        table_bits += 1
+                        mask = (1 << table_bits) - 1
+                        slots = LZWProcessor._build_slots(keys, table_bits)
+                w = byte
+            end = position + len(segment)
+
+            if next_code == max_codes and end < size:
+                ratio = end / (emitted + len(codes))
+                if ratio <= last_ratio:
+                    # A compressão parou de melhorar: emite a sequência pendente e reinicia o dicionário
+                    emit(w)
+                    emit(LZWProcessor.CLEAR_CODE)
+                    table_bits = initial_bits
+                    mask = (1 << table_bits) - 1
+                    slots = array.array('I', bytes(4 << table_bits))
+                    keys = array.array('I', bytes(4 * 257))
+                    next_code = 257
+                    last_ratio = 0.0
+                    w = read(1)[0]
+                    end += 1
+                else:
+                    last_ratio = ratio
+
+            if block_callback and end // LZW_BLOCK_SIZE != position // LZW_BLOCK_SIZE:
+                block_callback(end)
+            position = end
+            if len(codes) >= LZW_BLOCK_SIZE:
+                emitted += len(codes)
+                yield codes
+                codes = array.array('I')
+                emit = codes.append
+        emit(w)
+        yield codes
+
+    @staticmethod
+    def _encode(data: bytes, max_bits: int = LZW_MAX_CODE_BITS, block_callback: Optional[Callable[[int], None]] = None) -> array.array:
+        """Codifica data com _encode_blocks e retorna todos os códigos, incluindo os CLEAR emitidos."""
+        codes = array.array('I')
+        for block in LZWProcessor._encode_blocks(io.BytesIO(data).read, len(data), max_bits, block_callback):
+            codes += block
+        return codes
+
+    @staticmethod
+    def _decode(code_blocks: Iterable[List[int]], max_bits: int = LZW_MAX_CODE_BITS, first_code: int = 257) -> bytearray:
+        """
+        Decodifica blocos de códigos com um dicionário novo. Cada entrada do dicionário é uma
+        sequência já escrita na saída, guardada em arrays paralelos de posição e comprimento;
+        cada sequência é copiada de lá com uma única fatia. Com first_code=257 o código 256 é
+        CLEAR; arquivos antigos usam first_code=256 e não têm CLEAR.
+        """
+        # As entradas 0-255 (e o CLEAR) não ocupam os arrays
+        offsets = array.array('q')
+        lengths = array.array('I')
+        next_code = first_code
+        max_codes = 1 << max_bits
+        clear_code = LZWProcessor.CLEAR_CODE if first_code > LZWProcessor.CLEAR_CODE else -1
+        output = bytearray()
+        previous = -1 # Código anterior, sua posição e seu comprimento na saída
+        previous_position = previous_length = 0
+
+        for codes in code_blocks:
+            for code in codes:
+                position = len(output)
+                if code < 256:
+                    output.append(code)
+                    length = 1
+                elif code == clear_code:
+                    offsets = array.array('q')
+                    lengths = array.array('I')
+                    next_code = first_code
+                    previous = -1
+                    continue
+                elif code < next_code:
+                    start = offsets[code - first_code]
+                    length = lengths[code - first_code]
+                    output += output[start:start + length]
+                elif code == next_code and previous >= 0:
+                    # Sequência ainda não registrada: anterior + primeiro byte do anterior
+                    output += output[previous_position:previous_position + previous_length]
+                    output.append(output[previous_position])
+                    length = previous_length + 1
+                else:
+                    raise ValueError(f"Código comprimido inválido: {code}")
+
+                # Anterior + primeiro byte da sequência atual, que a segue na saída
+                if previous >= 0 and next_code < max_codes:
+                    offsets.append(previous_position)
+                    lengths.append(previous_length + 1)
+                    next_code += 1
+                previous, previous_position, previous_length = code, position, length
+        return output
+
+    @staticmethod
+    def compress_stream(input_file_path: str, output_file_path: str, progress_callback: Optional[Callable[[float, str], None]] = None,
+                        max_bits: int = LZW_MAX_CODE_BITS, frame_size: int = LZW_STREAM_BLOCK_SIZE) -> Tuple[int, int, float, float]:
+        """
+        Compressão LZW com códigos de largura variável (de 9 até max_bits bits) e CLEAR adaptativo.
+        Cada bloco de frame_size bytes é codificado com um dicionário próprio e gravado como um
+        quadro (FRAME_HEADER seguido dos códigos empacotados). A entrada é lida em trechos e os
+        códigos são gravados a cada LZW_BLOCK_SIZE, de modo que a memória fica limitada ao
+        dicionário (até 2^max_bits entradas de 12-20 bytes), qualquer que seja frame_size.
+        """
+        if not 9 <= max_bits <= LZW_MAX_CODE_BITS:
+            raise ValueError(f"max_bits deve estar entre 9 e {LZW_MAX_CODE_BITS}")
+        start_time = time.time()
+        original_size = os.path.getsize(input_file_path)
+        if original_size == 0:
+            return 0, 0, 0.0, 0.0
+
+        try:
+            bytes_processed = 0
+            with open(input_file_path, 'rb') as source, open(output_file_path, 'wb') as f:
+                f.write(LZWProcessor.STREAM_HEADER.pack(LZWProcessor.STREAM_MAGIC, max_bits, original_size))
+                while bytes_processed < original_size:
+                    def report(block_bytes: int) -> None:
+                        processed = bytes_processed + block_bytes
+                        progress_callback(0.9 * processed / original_size, f"Comprimindo... {processed}/{original_size} bytes processados")
+
+                    frame_bytes = min(frame_size, original_size - bytes_processed)
+                    header_position = f.tell()
+                    f.write(LZWProcessor.FRAME_HEADER.pack(frame_bytes, 0)) # Tamanho dos códigos gravado ao fim do quadro
+                    payload_size = 0
+                    blocks = LZWProcessor._encode_blocks(source.read, frame_bytes, max_bits, report if progress_callback else None)
+                    for packed in LZWProcessor._pack_code_blocks(blocks, max_bits):
+                        f.write(packed)
+                        payload_size += len(packed)
+                    frame_end = f.tell()
+                    f.seek(header_position)
+                    f.write(LZWProcessor.FRAME_HEADER.pack(frame_bytes, payload_size))
+                    f.seek(frame_end)
+                    bytes_processed += frame_bytes
+
+            compressed_size = os.path.getsize(output_file_path)
+            compression_ratio = (original_size - compressed_size) / original_size * 100
+            process_time = time.time() - start_time
+
+            if progress_callback:
+                progress_callback(1.0, "Compressão completa!")
+
+            return original_size, compressed_size, compression_ratio, process_time
+
+        except Exception as e:
+            if progress_callback:
+                progress_callback(1.0, f"Erro durante a compressão: {str(e)}")
+            raise e
+
+    @staticmethod
+    def compress(input_file_path: str, output_file_path: str, progress_callback: Optional[Callable[[float, str], None]] = None,
+                 streaming: Optional[bool] = None, max_bits: int = LZW_MAX_CODE_BITS) -> Tuple[int, int, float, float]:
+        """
+        Comprime um arquivo usando o algoritmo LZW, em um único quadro (um dicionário para o arquivo
+        inteiro, reiniciado apenas por CLEAR). streaming=True usa quadros de LZW_STREAM_BLOCK_SIZE
+        bytes; com None, eles são usados para arquivos maiores que MAX_FILE_SIZE_MB.
+        """
+        input_size = os.path.getsize(input_file_path)
+        if streaming is None:
+            streaming = input_size > MAX_FILE_SIZE_MB * 1024 * 1024
+        frame_size = LZW_STREAM_BLOCK_SIZE if streaming else max(input_size, 1)
+        return LZWProcessor.compress_stream(input_file_path, output_file_path, progress_callback, max_bits, frame_size)
+
+    @staticmethod
+    def _decompress_stream(f: BinaryIO, output_file_path: str, progress_callback: Optional[Callable[[float, str], None]] = None) -> None:
+        """Decodifica um arquivo LZW3 quadro a quadro; f deve estar posicionado após o magic."""
+        max_bits, data_size = struct.unpack('<BQ', f.read(9))
+        if not 9 <= max_bits <= LZW_MAX_CODE_BITS:
+            raise ValueError(f"Largura de código inválida: {max_bits}")
+        decoded_count = 0
+        with open(output_file_path, 'wb') as output:
+            while decoded_count < data_size:
+                frame_header = f.read(LZWProcessor.FRAME_HEADER.size)
+                if len(frame_header) < LZWProcessor.FRAME_HEADER.size:
+                    raise ValueError(f"Fluxo truncado: {decoded_count} de {data_size} bytes decodificados")
+                frame_size, payload_size = LZWProcessor.FRAME_HEADER.unpack(frame_header)
+                payload = f.read(payload_size)
+                if len(payload) < payload_size:
+                    raise ValueError(f"Quadro truncado após {decoded_count} bytes decodificados")
+
+                def code_blocks() -> Iterator[List[int]]:
+                    # O progresso é informado quando o bloco seguinte é pedido, isto é, após decodificar o atual
+                    for codes, bits_read in LZWProcessor._read_variable_codes(payload, max_bits):
+                        yield codes
+                        if progress_callback:
+                            processed = decoded_count + frame_size * bits_read // (len(payload) * 8)
+                            progress_callback(processed / data_size, f"Descomprimindo... {processed // 1024}KB processados")
+
+                decoded = LZWProcessor._decode(code_blocks(), max_bits)
+                if len(decoded) != frame_size:
+                    raise ValueError(f"Quadro com {len(decoded)} bytes, esperados {frame_size}")
+                output.write(decoded)
+                decoded_count += frame_size
+                if progress_callback:
+                    progress_callback(decoded_count / data_size, f"Descomprimindo... {decoded_count // 1024}KB processados")
 
-            for i in range(table_size):
-                byte = struct.unpack('B', file.read(1))[0]
-                code_length = struct.unpack('B', file.read(1))[0]
-                code_int = struct.unpack('I', file.read(4))[0]
-                code = format(code_int, f'0{code_length}b')
-                code_table[code] = bytes([byte])
-                max_code_length = max(max_code_length, code_length)
-                
-                if progress_callback and i % 100 == 0:
-                    progress = 0.1 + 0.2 * (i / table_size)
-                    progress_callback(progress, f"Carregando tabela de códigos: {i}/{table_size}")
+    @staticmethod
+    def decompress(input_file_path: str, output_file_path: str, progress_callback: Optional[Callable[[float, str], None]] = None) -> Tuple[int, int, float, float]:
+        """Descomprime um arquivo LZW (LZW3 ou o formato original de largura fixa) quadro a quadro"""
+        start_time = time.time()
 
-            # Lê o tamanho original dos dados
-            data_size = struct.unpack('I', file.read(4))[0]
+        try:
+            # Lê o arquivo comprimido
+            with open(input_file_path, 'rb') as f:
+                magic = f.read(4)
+                if magic == LZWProcessor.STREAM_MAGIC:
+                    LZWProcessor._decompress_stream(f, output_file_path, progress_callback)
+                else:
+                    # Formato original: número de códigos, largura e códigos de largura fixa
+                    num_codes = int.from_bytes(magic, byteorder='big')
+                    bits = int.from_bytes(f.read(1), byteorder='big')
+                    if not 9 <= bits <= LZW_MAX_CODE_BITS:
+                        raise ValueError(f"Largura de código inválida: {bits}")
+                    compressed_bytes = f.read()
+
+                    def code_blocks() -> Iterator[List[int]]:
+                        for code_start, codes in zip(itertools.count(0, LZW_BLOCK_SIZE), LZWProcessor._read_codes(compressed_bytes, num_codes, bits)):
+                            yield codes
+                            if progress_callback:
+                                processed_codes = code_start + len(codes)
+                                progress_callback(processed_codes / num_codes, f"Descomprimindo... {processed_codes}/{num_codes} códigos processados")
+
+                    decompressed_data = LZWProcessor._decode(code_blocks(), first_code=256)
+
+                    # Escreve os dados descomprimidos no arquivo de saída
+                    with open(output_file_path, 'wb') as output:
+                        output.write(decompressed_data)
 
-            # Obtém a posição atual (após ler a tabela e data_size)
-            current_read_pos = file.tell()
-            
-            # Busca o fim do arquivo, lê o último byte (preenchimento) e depois volta
-            file.seek(-1, os.SEEK_END)
-            padding_bits = struct.unpack('B', file.read(1))[0]
-            
-            # Volta para onde os dados começam (após o cabeçalho, antes do byte de preenchimento)
-            file.seek(current_read_pos)
+            compressed_size = os.path.getsize(input_file_path)
+            decompressed_size = os.path.getsize(output_file_path)
+            compression_ratio = (compressed_size - decompressed_size) / compressed_size * 100
+            process_time = time.time() - start_time
 
             if progress_callback:
-                progress_callback(0.3, "Preparando para decodificar...")
-
-            result = io.BytesIO()
-            current_bits = ""
-            bytes_decoded = 0
-            
-            # Lê todos os dados comprimidos restantes, excluindo o último byte de preenchimento
-            compressed_data_bytes = file.read() # Lê da posição atual até EOF-1 (byte de preenchimento)
+                progress_callback(1.0, "Descompressão completa!")
 
-            total_compressed_bits = len(compressed_data_bytes) * 8 - padding_bits
-            bits_processed = 0
+            return compressed_size, decompressed_size, compression_ratio, process_time
 
-            for byte_val in compressed_data_bytes:
-                bits_in_byte = format(byte_val, '08b')
-                
-                # Adiciona bits apenas se não atingimos o fim dos bits comprimidos significativos
-                for bit in bits_in_byte:
-                    if bits_processed < total_compressed_bits:
-                        current_bits += bit
-                        bits_processed += 1
-                        
-                        # Tenta decodificar a partir de current_bits
-                        while True:
-                            found_match = False
-                            # Itera até max_code_length ou comprimento de current_bits
-                            for length in range(1, min(len(current_bits), max_code_length) + 1):
-                                prefix = current_bits[:length]
-                                if prefix in code_table:
-                                    result.write(code_table[prefix])
-                                    bytes_decoded += 1
-                                    current_bits = current_bits[length:]
-                                    found_match = True
-                                    
-                                    if bytes_decoded >= data_size:
-                                        # Decodificou todos os bytes originais, para.
-                                        break
-                            if bytes_decoded >= data_size:
-                                break # Sai do loop de decodificação interno
-                            if not found_match:
-                                break # Nenhuma correspondência encontrada para o prefixo current_bits, espera por mais bits
-                        
-                        if bytes_decoded >= data_size:
-                            break # Sai do loop de bits
-                    else:
-                        break # Excedeu total_compressed_bits (incluindo preenchimento)
-                
-                if bytes_decoded >= data_size:
-                    break # Sai do loop de bytes
-                
-                if progress_callback and bytes_decoded % 1000 == 0:
-                    progress = 0.3 + 0.7 * (bytes_decoded / data_size)
-                    progress_callback(progress, f"Decodificados {bytes_decoded}/{data_size} bytes")
+        except Exception as e:
+            if os.path.exists(output_file_path):
+                os.remove(output_file_path) # Não deixa uma saída parcial
+            if progress_callback:
+                progress_callback(1.0, f"Erro durante a descompressão: {str(e)}")
+            raise e
 
-        # Escreve os dados decodificados
-        with open(output_path, 'wb') as file:
-            final_decoded_data = result.getvalue()
-            # Garante que apenas os dados até o data_size original sejam gravados
-            file.write(final_decoded_data[:data_size])
+class LZWHuffmanProcessor:
+    """
+    LZW seguido de Huffman, no espírito do deflate. Cada código LZW vira um símbolo de classe,
+    codificado com Huffman, mais bits extras gravados sem codificação:
+    classe 0 é um byte literal (codificado com uma segunda tabela de Huffman), classe 1 é o CLEAR
+    e a classe 1 + b é um código do dicionário cuja distância a uma referência tem b bits,
+    seguida dos b - 1 bits menos significativos dessa distância. A referência de cada quadro é a
+    que gera menos bits: o próximo código livre (REFERENCE_NEXT; sequências registradas há pouco,
+    as mais reutilizadas em texto repetitivo, ficam nas classes curtas) ou o CLEAR (REFERENCE_CLEAR,
+    melhor quando os códigos antigos dominam).
+    """
+    STREAM_MAGIC = b'LZH1'
+    STREAM_HEADER = struct.Struct('<4sBQ') # Magic, largura máxima dos códigos LZW, tamanho original
+    # Bytes decodificados, códigos, literais, bits das classes, bits dos literais, bytes do quadro e referência;
+    # o quadro traz a tabela e os bits das classes, a tabela e os bits dos literais e, por fim, os bits extras
+    FRAME_HEADER = struct.Struct('<6QB')
+    LITERAL_CLASS = 0
+    CLEAR_CLASS = 1
+    REFERENCE_NEXT = 0 # Distância = próximo código livre - código
+    REFERENCE_CLEAR = 1 # Distância = código - CLEAR
 
-        compressed_size = os.path.getsize(input_path)
-        decompressed_size = os.path.getsize(output_path)
-        compression_ratio = (compressed_size - decompressed_size) / compressed_size * 100 # Esta proporção é geralmente para compressão
-        process_time = time.time() - start_time
+    @staticmethod
+    def _entropy_encode(symbols: bytes) -> Tuple[bytes, int]:
+        """
+        Codifica symbols com códigos canônicos de Huffman; retorna (tabela de comprimentos seguida
+        dos bits completados até o byte, número de bits válidos).
+        """
+        counts = np.bincount(np.frombuffer(symbols, dtype=np.uint8), minlength=256)
+        code_lengths = HuffmanProcessor.build_code_lengths({symbol: int(count) for symbol, count in enumerate(counts) if count})
+        code_array = np.zeros(256, dtype=np.int64)
+        length_array = np.zeros(256, dtype=np.int64)
+        for symbol, (code, length) in HuffmanProcessor.canonical_codes(code_lengths).items():
+            code_array[symbol] = code
+            length_array[symbol] = length
+
+        parts = [HuffmanProcessor._pack_code_lengths(code_lengths)]
+        carry, carry_bits = 0, 0
+        view = memoryview(symbols)
+        for start in range(0, len(view), HUFFMAN_ENCODE_BLOCK_SIZE):
+            packed, carry, carry_bits = HuffmanProcessor.encode_block(view[start:start + HUFFMAN_ENCODE_BLOCK_SIZE],
+                                                                      code_array, length_array, carry, carry_bits)
+            parts.append(packed)
+        total_bits = (sum(map(len, parts)) - len(parts[0])) * 8 + carry_bits
+        if carry_bits:
+            parts.append(bytes((carry << (8 - carry_bits),)))
+        return b''.join(parts), total_bits
 
-        if progress_callback:
-            progress_callback(1.0, "Descompressão completa!")
+    @staticmethod
+    def _entropy_decode(payload: bytes, position: int, total_bits: int, count: int) -> Tuple[np.ndarray, int]:
+        """Inverso de _entropy_encode a partir de position; retorna (count símbolos, posição seguinte)."""
+        code_lengths, position = HuffmanProcessor._unpack_code_lengths(payload, position)
+        end = position + (total_bits + 7) // 8
+        if end > len(payload):
+            raise ValueError("Quadro truncado")
+        if not count:
+            return np.zeros(0, dtype=np.uint8), end
+        tables = HuffmanProcessor._stream_tables(tuple(sorted(code_lengths.items())))
+        decoded = HuffmanProcessor.decode_lanes(payload[position:end], total_bits, count, tables)
+        return np.frombuffer(decoded, dtype=np.uint8), end
 
-        return compressed_size, decompressed_size, compression_ratio, process_time
+    @staticmethod
+    def _encode_frame(chunk: bytes, max_bits: int, block_callback: Optional[Callable[[int], None]] = None) -> bytes:
+        """Codifica um bloco com um dicionário LZW novo; retorna FRAME_HEADER seguido do quadro."""
+        codes = np.frombuffer(LZWProcessor._encode(chunk, max_bits, block_callback), dtype=np.uint32).astype(np.int64)
+        is_literal = codes < 256
+        is_clear = codes == LZWProcessor.CLEAR_CODE
+        is_dictionary = ~(is_literal | is_clear)
+        next_codes = np.minimum(257 + LZWProcessor._code_indexes(is_clear), 1 << max_bits)
+        powers = np.left_shift(1, np.arange(max_bits + 1, dtype=np.int64))
+
+        best = None
+        for reference, distances in ((LZWHuffmanProcessor.REFERENCE_NEXT, next_codes - codes),
+                                     (LZWHuffmanProcessor.REFERENCE_CLEAR, codes - LZWProcessor.CLEAR_CODE)):
+            distances = np.where(is_dictionary, distances, 1)
+            distance_bits = np.searchsorted(powers, distances, side='right')
+            classes = np.where(is_literal, LZWHuffmanProcessor.LITERAL_CLASS,
+                               np.where(is_clear, LZWHuffmanProcessor.CLEAR_CLASS, 1 + distance_bits))
+            extra_widths = np.where(is_dictionary, distance_bits - 1, 0)
+            class_part, class_bits = LZWHuffmanProcessor._entropy_encode(classes.astype(np.uint8).tobytes())
+            if best is None or class_bits + int(extra_widths.sum()) < best[0]:
+                best = (class_bits + int(extra_widths.sum()), reference, class_part, class_bits, distances, extra_widths)
+        _, reference, class_part, class_bits, distances, extra_widths = best
+
+        literals = codes[is_literal].astype(np.uint8).tobytes()
+        literal_part, literal_bits = LZWHuffmanProcessor._entropy_encode(literals)
+        extra_part = LZWProcessor._pack_bits(distances - np.left_shift(1, extra_widths), extra_widths)
+        frame_size = len(class_part) + len(literal_part) + len(extra_part)
+        return (LZWHuffmanProcessor.FRAME_HEADER.pack(len(chunk), len(codes), len(literals), class_bits, literal_bits,
+                                                      frame_size, reference)
+                + class_part + literal_part + extra_part)
 
+    @staticmethod
+    def _decode_codes(payload: bytes, num_codes: int, num_literals: int, class_bits: int, literal_bits: int,
+                      reference: int, max_bits: int) -> np.ndarray:
+        """Reconstrói os códigos LZW de um quadro a partir das classes, dos literais e dos bits extras."""
+        classes, position = LZWHuffmanProcessor._entropy_decode(payload, 0, class_bits, num_codes)
+        literals, position = LZWHuffmanProcessor._entropy_decode(payload, position, literal_bits, num_literals)
+        if num_codes and int(classes.max()) > 1 + max_bits:
+            raise ValueError(f"Classe de código inválida: {int(classes.max())}")
+        classes = classes.astype(np.int64)
+        is_literal = classes == LZWHuffmanProcessor.LITERAL_CLASS
+        is_clear = classes == LZWHuffmanProcessor.CLEAR_CLASS
+        if np.count_nonzero(is_literal) != num_literals:
+            raise ValueError(f"Esperava {num_literals} literais, mas o quadro tem {np.count_nonzero(is_literal)}")
+
+        extra_widths = np.maximum(classes - 2, 0)
+        ends = np.cumsum(extra_widths)
+        extra_bytes = payload[position:]
+        if num_codes and int(ends[-1]) > len(extra_bytes) * 8:
+            raise ValueError("Bits extras truncados")
+        padded = np.frombuffer(bytes(extra_bytes) + bytes(4), dtype=np.uint8)
+        distances = np.left_shift(1, extra_widths) + LZWProcessor._extract_bits(padded, ends - extra_widths, extra_widths)
+
+        if reference == LZWHuffmanProcessor.REFERENCE_NEXT:
+            codes = np.minimum(257 + LZWProcessor._code_indexes(is_clear), 1 << max_bits) - distances
+        elif reference == LZWHuffmanProcessor.REFERENCE_CLEAR:
+            codes = LZWProcessor.CLEAR_CODE + distances
+        else:
+            raise ValueError(f"Referência de distância inválida: {reference}")
+        codes[is_literal] = literals
+        codes[is_clear] = LZWProcessor.CLEAR_CODE
+        if np.any(codes[~(is_literal | is_clear)] <= LZWProcessor.CLEAR_CODE):
+            raise ValueError("Distância de código inválida")
+        return codes
 
-# Implementação LZW
-class LZWProcessor:
     @staticmethod
-    def compress(input_file_path: str, output_file_path: str, progress_callback: Optional[Callable[[float, str], None]] = None) -> Tuple[int, int, float, float]:
-        """Comprime um arquivo usando o algoritmo LZW com códigos de comprimento variável"""
+    def compress(input_file_path: str, output_file_path: str, progress_callback: Optional[Callable[[float, str], None]] = None,
+                 streaming: Optional[bool] = None, max_bits: int = LZW_MAX_CODE_BITS) -> Tuple[int, int, float, float]:
+        """
+        Comprime um arquivo com LZW (largura máxima max_bits, CLEAR adaptativo) e codifica os códigos
+        com Huffman. Como em LZWProcessor.compress, streaming=True usa quadros de LZW_STREAM_BLOCK_SIZE
+        bytes e, com None, eles são usados para arquivos maiores que MAX_FILE_SIZE_MB.
+        """
+        if not 9 <= max_bits <= LZW_MAX_CODE_BITS:
+            raise ValueError(f"max_bits deve estar entre 9 e {LZW_MAX_CODE_BITS}")
         start_time = time.time()
-        
+        original_size = os.path.getsize(input_file_path)
+        if original_size == 0:
+            return 0, 0, 0.0, 0.0
+        if streaming is None:
+            streaming = original_size > MAX_FILE_SIZE_MB * 1024 * 1024
+        frame_size = LZW_STREAM_BLOCK_SIZE if streaming else original_size
+
         try:
-            # Lê o arquivo de entrada como bytes
-            with open(input_file_path, 'rb') as f:
-                data = f.read()
-            
-            original_size = len(data)
-            if not data:
-                return 0, 0, 0.0, 0.0
-
-            # Inicializa o dicionário com todos os bytes únicos possíveis
-            dictionary = {bytes([i]): i for i in range(256)}
-            next_code = 256
-            compressed_data = []
-            w = bytes()
-            
-            total_bytes = len(data)
-            processed_bytes = 0
-            
-            # Determina o número mínimo de bits necessários inicialmente
-            bits = 9  # Começa com 9 bits (pode representar até 511)
-            max_code = 2**bits - 1
-            
-            for byte in data:
-                c = bytes([byte])
-                wc = w + c
-                if wc in dictionary:
-                    w = wc
-                else:
-                    compressed_data.append(dictionary[w])
-                    # Adiciona wc ao dicionário
-                    if next_code <= 2**24 - 1: # Adiciona apenas se o tamanho do dicionário estiver dentro do limite
-                        dictionary[wc] = next_code
-                        next_code += 1
-                    
-                    # Aumenta o comprimento dos bits se necessário (apenas se o dicionário crescer além do max_code atual)
-                    if next_code > max_code and bits < 24:  # Limita a 24 bits (dicionário de 16MB)
-                        bits += 1
-                        max_code = 2**bits - 1
-                    
-                    w = c
-                
-                processed_bytes += 1
-                if progress_callback and processed_bytes % 1000 == 0:
-                    progress = processed_bytes / total_bytes
-                    progress_callback(progress, f"Comprimindo... {processed_bytes}/{total_bytes} bytes processados")
-            
-            if w:
-                compressed_data.append(dictionary[w])
-            
-            # Escreve os dados comprimidos no arquivo de saída
-            with open(output_file_path, 'wb') as f:
-                # Escreve o cabeçalho com o número de códigos e bits iniciais
-                f.write(len(compressed_data).to_bytes(4, byteorder='big'))
-                f.write(bits.to_bytes(1, byteorder='big'))
-                
-                # Empacota os códigos em bytes
-                buffer = 0
-                buffer_length = 0
-                
-                for code in compressed_data:
-                    current_code_bits = math.ceil(math.log2(next_code)) if next_code > 1 else 1
-                    if current_code_bits < 9: current_code_bits = 9
-                    if current_code_bits > 24: current_code_bits = 24
-                    
-                    buffer = (buffer << current_code_bits) | code
-                    buffer_length += current_code_bits
-                    
-                    while buffer_length >= 8:
-                        byte = (buffer >> (buffer_length - 8)) & 0xFF
-                        f.write(bytes([byte]))
-                        buffer_length -= 8
-                        buffer = buffer & ((1 << buffer_length) - 1)
-                
-                # Escreve os bits restantes
-                if buffer_length > 0:
-                    byte = (buffer << (8 - buffer_length)) & 0xFF
-                    f.write(bytes([byte]))
-            
+            bytes_processed = 0
+            with open(input_file_path, 'rb') as source, open(output_file_path, 'wb') as f:
+                f.write(LZWHuffmanProcessor.STREAM_HEADER.pack(LZWHuffmanProcessor.STREAM_MAGIC, max_bits, original_size))
+                while chunk := source.read(frame_size):
+                    def report(block_bytes: int) -> None:
+                        processed = bytes_processed + block_bytes
+                        progress_callback(0.9 * processed / original_size, f"Comprimindo... {processed}/{original_size} bytes processados")
+
+                    f.write(LZWHuffmanProcessor._encode_frame(chunk, max_bits, report if progress_callback else None))
+                    bytes_processed += len(chunk)
+
             compressed_size = os.path.getsize(output_file_path)
             compression_ratio = (original_size - compressed_size) / original_size * 100
             process_time = time.time() - start_time
@@ -2502,7 +5311,7 @@ class LZWProcessor:
                 progress_callback(1.0, "Compressão completa!")
 
             return original_size, compressed_size, compression_ratio, process_time
-        
+
         except Exception as e:
             if progress_callback:
                 progress_callback(1.0, f"Erro durante a compressão: {str(e)}")
@@ -2510,172 +5319,230 @@ class LZWProcessor:
 
     @staticmethod
     def decompress(input_file_path: str, output_file_path: str, progress_callback: Optional[Callable[[float, str], None]] = None) -> Tuple[int, int, float, float]:
-        """Descomprime um arquivo usando o algoritmo LZW com códigos de comprimento variável"""
+        """Descomprime um arquivo LZW+Huffman quadro a quadro"""
         start_time = time.time()
-        
+
         try:
-            # Lê o arquivo comprimido
-            with open(input_file_path, 'rb') as f:
-                # Lê o cabeçalho
-                num_codes = int.from_bytes(f.read(4), byteorder='big')
-                initial_bits = int.from_bytes(f.read(1), byteorder='big') # 'bits' renomeado para 'initial_bits' para clareza
-                
-                # Lê todos os dados restantes
-                compressed_bytes = f.read()
-            
+            with open(input_file_path, 'rb') as f, open(output_file_path, 'wb') as output:
+                header = f.read(LZWHuffmanProcessor.STREAM_HEADER.size)
+                if len(header) < LZWHuffmanProcessor.STREAM_HEADER.size or header[:4] != LZWHuffmanProcessor.STREAM_MAGIC:
+                    raise ValueError("Arquivo LZW+Huffman inválido")
+                _, max_bits, data_size = LZWHuffmanProcessor.STREAM_HEADER.unpack(header)
+                if not 9 <= max_bits <= LZW_MAX_CODE_BITS:
+                    raise ValueError(f"Largura de código inválida: {max_bits}")
+
+                decoded_count = 0
+                while decoded_count < data_size:
+                    frame_header = f.read(LZWHuffmanProcessor.FRAME_HEADER.size)
+                    if len(frame_header) < LZWHuffmanProcessor.FRAME_HEADER.size:
+                        raise ValueError(f"Fluxo truncado: {decoded_count} de {data_size} bytes decodificados")
+                    frame_size, num_codes, num_literals, class_bits, literal_bits, payload_size, reference = \
+                        LZWHuffmanProcessor.FRAME_HEADER.unpack(frame_header)
+                    payload = f.read(payload_size)
+                    if len(payload) < payload_size:
+                        raise ValueError(f"Quadro truncado após {decoded_count} bytes decodificados")
+                    codes = LZWHuffmanProcessor._decode_codes(payload, num_codes, num_literals, class_bits, literal_bits,
+                                                              reference, max_bits)
+
+                    def code_blocks() -> Iterator[List[int]]:
+                        for code_start in range(0, len(codes), LZW_BLOCK_SIZE):
+                            yield codes[code_start:code_start + LZW_BLOCK_SIZE].tolist()
+                            if progress_callback:
+                                processed = decoded_count + frame_size * min(code_start + LZW_BLOCK_SIZE, len(codes)) // len(codes)
+                                progress_callback(processed / data_size, f"Descomprimindo... {processed // 1024}KB processados")
+
+                    decoded = LZWProcessor._decode(code_blocks(), max_bits)
+                    if len(decoded) != frame_size:
+                        raise ValueError(f"Quadro com {len(decoded)} bytes, esperados {frame_size}")
+                    output.write(decoded)
+                    decoded_count += frame_size
+
             compressed_size = os.path.getsize(input_file_path)
-            
-            # Inicializa o dicionário com todos os bytes únicos possíveis
-            dictionary = {i: bytes([i]) for i in range(256)}
-            next_code = 256
-            decompressed_data = bytearray()
-            
-            # Desempacota bits em códigos
-            buffer = 0
-            buffer_length = 0
-            byte_pos = 0
-            codes = []
-            
-            # Gerencia dinamicamente os bits para decodificação
-            current_bits = initial_bits
-            
-            while len(codes) < num_codes:
-                # Preenche o buffer
-                while buffer_length < current_bits and byte_pos < len(compressed_bytes):
-                    buffer = (buffer << 8) | compressed_bytes[byte_pos]
-                    byte_pos += 1
-                    buffer_length += 8
-                
-                if buffer_length < current_bits:
-                    break  # Fim dos dados ou bits insuficientes para o próximo código
-                
-                # Extrai o código
-                code = (buffer >> (buffer_length - current_bits)) & ((1 << current_bits) - 1)
-                codes.append(code)
-                buffer_length -= current_bits
-                buffer = buffer & ((1 << buffer_length) - 1)
-                
-                # Atualiza o progresso
-                if progress_callback and len(codes) % 1000 == 0:
-                    progress = len(codes) / num_codes
-                    progress_callback(progress, f"Lendo dados comprimidos... {len(codes)}/{num_codes} códigos processados")
-            
-            # Verifica se obtivemos todos os códigos esperados
-            if len(codes) != num_codes:
-                raise ValueError(f"Esperava {num_codes} códigos, mas obteve {len(codes)}")
-            
-            # Processa os códigos
-            w = dictionary[codes[0]]
-            decompressed_data.extend(w)
-            
-            for code in codes[1:]:
-                # Ajusta `current_bits` dinamicamente com base em `next_code` durante a descompressão
-                if next_code >= (1 << current_bits) and current_bits < 24:
-                    current_bits += 1
-
-                if code in dictionary:
-                    entry = dictionary[code]
-                elif code == next_code:
-                    entry = w + w[:1]
-                else:
-                    raise ValueError(f"Código comprimido inválido: {code}")
-                
-                decompressed_data.extend(entry)
-                
-                # Adiciona w + entry[0] ao dicionário
-                if next_code <= 2**24 - 1:
-                    dictionary[next_code] = w + entry[:1]
-                    next_code += 1
-                
-                w = entry
-                
-                # Atualiza o progresso
-                progress = len(decompressed_data) / (num_codes * 3) # Estima aproximadamente com base no tamanho médio da entrada
-                if progress_callback and len(decompressed_data) % 100000 == 0:  # Atualiza a cada 100KB
-                    progress_callback(min(1.0, progress), f"Descomprimindo... {len(decompressed_data)//1024}KB processados") # Limita a 1.0
-
-            # Escreve os dados descomprimidos no arquivo de saída
-            with open(output_file_path, 'wb') as f:
-                f.write(decompressed_data)
-            
             decompressed_size = os.path.getsize(output_file_path)
-            compression_ratio = (compressed_size - decompressed_size) / compressed_size * 100 
+            compression_ratio = (compressed_size - decompressed_size) / compressed_size * 100
             process_time = time.time() - start_time
 
             if progress_callback:
                 progress_callback(1.0, "Descompressão completa!")
 
             return compressed_size, decompressed_size, compression_ratio, process_time
-        
+
         except Exception as e:
+            if os.path.exists(output_file_path):
+                os.remove(output_file_path) # Não deixa uma saída parcial
             if progress_callback:
                 progress_callback(1.0, f"Erro durante a descompressão: {str(e)}")
             raise e
 
-def compare_algorithms(input_path: str, progress_callback: Optional[Callable[[float, str], None]] = None) -> pd.DataFrame:
-    """Compara o desempenho dos algoritmos Huffman e LZW no mesmo arquivo"""
-    results = []
-    
-    # Cria caminhos de saída temporários
-    huffman_output = os.path.join(TEMP_FOLDER, "temp_huffman.huff")
-    lzw_output = os.path.join(TEMP_FOLDER, "temp_lzw.lzw")
-    
-    # Cria caminhos de saída descomprimidos temporários para verificação
-    huffman_decompressed_output = os.path.join(TEMP_FOLDER, os.path.basename(input_path) + ".huffout")
-    lzw_decompressed_output = os.path.join(TEMP_FOLDER, os.path.basename(input_path) + ".lzwout")
+# Registro de codecs
+class Codec:
+    """
+    Codec de compressão registrado. compress_stream e decompress_stream recebem
+    (caminho de entrada, caminho de saída, progress_callback) e retornam a mesma tupla
+    de tamanhos, taxa e tempo que HuffmanProcessor.compress_file/decompress_file.
+    """
+    def __init__(self, name: str, extension: str, magic: Tuple[bytes, ...],
+                 compress_stream: Callable[..., Tuple[int, int, float, float]],
+                 decompress_stream: Callable[..., Tuple[int, int, float, float]]):
+        self.name = name
+        self.extension = extension
+        self.magic = magic # Prefixos que identificam os arquivos do codec (vazio se não houver)
+        self.compress_stream = compress_stream
+        self.decompress_stream = decompress_stream
+
+CODECS: Dict[str, Codec] = {}
+
+def register_codec(codec: Codec) -> Codec:
+    """Registra (ou substitui) um codec pelo nome."""
+    CODECS[codec.name] = codec
+    return codec
+
+def get_codec(name: str) -> Codec:
+    """Retorna o codec registrado com esse nome; levanta ValueError se não existir."""
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"Codec desconhecido: {name}. Disponíveis: {', '.join(CODECS)}") from None
+
+def detect_codec(file_path: str) -> Optional[Codec]:
+    """Identifica o codec de um arquivo comprimido pelos bytes mágicos ou, sem eles, pela extensão."""
+    with open(file_path, 'rb') as f:
+        header = f.read(8)
+    for codec in CODECS.values():
+        if any(header.startswith(magic) for magic in codec.magic):
+            return codec
+    for codec in CODECS.values():
+        if file_path.endswith(codec.extension):
+            return codec
+    return None
+
+def _stdlib_compress(compressor_factory: Callable[[], Any], input_path: str, output_path: str,
+                     progress_callback: Optional[Callable[[float, str], None]] = None) -> Tuple[int, int, float, float]:
+    """Compressão em fluxo com um compressor incremental da biblioteca padrão (zlib, bz2, lzma)."""
+    start_time = time.time()
+    original_size = os.path.getsize(input_path)
+    compressor = compressor_factory()
+    bytes_processed = 0
+    with open(input_path, 'rb') as source, open(output_path, 'wb') as f:
+        while chunk := source.read(CODEC_CHUNK_SIZE):
+            f.write(compressor.compress(chunk))
+            bytes_processed += len(chunk)
+            if progress_callback:
+                progress_callback(bytes_processed / original_size, f"Comprimidos {bytes_processed}/{original_size} bytes")
+        f.write(compressor.flush())
 
-    # Testa Huffman
-    if progress_callback:
-        progress_callback(0, "Testando compressão Huffman...")
-    huff_compress = HuffmanProcessor.compress_file(input_path, huffman_output, 
-        lambda p, m: progress_callback(p * 0.3, f"Huffman: {m}") if progress_callback else None)
-    
-    if progress_callback:
-        progress_callback(0.4, "Testando descompressão Huffman...")
-    huff_decompress = HuffmanProcessor.decompress_file(huffman_output, huffman_decompressed_output, 
-        lambda p, m: progress_callback(0.4 + p * 0.2, f"Huffman: {m}") if progress_callback else None)
-    
-    # Testa LZW
+    compressed_size = os.path.getsize(output_path)
+    compression_ratio = (original_size - compressed_size) / original_size * 100 if original_size else 0.0
     if progress_callback:
-        progress_callback(0.6, "Testando compressão LZW...")
-    lzw_compress = LZWProcessor.compress(input_path, lzw_output, 
-        lambda p, m: progress_callback(0.6 + p * 0.2, f"LZW: {m}") if progress_callback else None)
-    
+        progress_callback(1.0, "Compressão completa!")
+    return original_size, compressed_size, compression_ratio, time.time() - start_time
+
+def _stdlib_decompress(decompressor_factory: Callable[[], Any], input_path: str, output_path: str,
+                       progress_callback: Optional[Callable[[float, str], None]] = None) -> Tuple[int, int, float, float]:
+    """
+    Descompressão em fluxo com um descompressor incremental da biblioteca padrão (zlib, bz2, lzma).
+    Cada chamada produz no máximo CODEC_CHUNK_SIZE bytes, de modo que um bloco muito comprimido
+    não é expandido de uma só vez na memória. Se o fluxo estiver corrompido ou truncado, a
+    saída parcial é removida.
+    """
+    start_time = time.time()
+    compressed_size = os.path.getsize(input_path)
+    decompressor = decompressor_factory()
+    bytes_read = 0
+    try:
+        with open(input_path, 'rb') as source, open(output_path, 'wb') as f:
+            while not decompressor.eof and (chunk := source.read(CODEC_CHUNK_SIZE)):
+                data = chunk
+                while True:
+                    f.write(decompressor.decompress(data, CODEC_CHUNK_SIZE))
+                    if decompressor.eof:
+                        break
+                    if hasattr(decompressor, 'needs_input'): # bz2 e lzma guardam a entrada pendente
+                        if decompressor.needs_input:
+                            break
+                        data = b''
+                    else: # zlib devolve a entrada não consumida em unconsumed_tail
+                        data = decompressor.unconsumed_tail
+                        if not data:
+                            break
+                bytes_read += len(chunk)
+                if progress_callback:
+                    progress_callback(bytes_read / compressed_size, f"Lidos {bytes_read}/{compressed_size} bytes comprimidos")
+            if hasattr(decompressor, 'flush'):
+                f.write(decompressor.flush())
+            if not decompressor.eof:
+                raise ValueError("Fluxo comprimido truncado")
+            if decompressor.unused_data or source.read(1):
+                raise ValueError("Dados após o fim do fluxo comprimido")
+    except (ValueError, EOFError, OSError, zlib.error, lzma.LZMAError):
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+    decompressed_size = os.path.getsize(output_path)
+    compression_ratio = (compressed_size - decompressed_size) / compressed_size * 100
     if progress_callback:
-        progress_callback(0.8, "Testando descompressão LZW...")
-    lzw_decompress = LZWProcessor.decompress(lzw_output, lzw_decompressed_output, 
-        lambda p, m: progress_callback(0.8 + p * 0.2, f"LZW: {m}") if progress_callback else None)
-    
-    # Limpa arquivos temporários
-    for f in [huffman_output, lzw_output, huffman_decompressed_output, lzw_decompressed_output]:
-        try:
-            if os.path.exists(f):
-                os.remove(f)
-        except OSError as e: # Captura OSError específico para operações de arquivo
-            st.warning(f"Não foi possível excluir o arquivo temporário {f}: {e}")
-            pass # Continua mesmo que a limpeza falhe para um arquivo
-    
-    # Prepara resultados
-    results.append({
-        'Algorithm': 'Huffman',
-        'Original Size (KB)': huff_compress[0] / 1024,
-        'Compressed Size (KB)': huff_compress[1] / 1024,
-        'Compression Ratio (%)': huff_compress[2],
-        'Compression Time (s)': huff_compress[3],
-        'Decompression Time (s)': huff_decompress[3],
-        'Total Time (s)': huff_compress[3] + huff_decompress[3]
-    })
-    
-    results.append({
-        'Algorithm': 'LZW',
-        'Original Size (KB)': lzw_compress[0] / 1024,
-        'Compressed Size (KB)': lzw_compress[1] / 1024,
-        'Compression Ratio (%)': lzw_compress[2],
-        'Compression Time (s)': lzw_compress[3],
-        'Decompression Time (s)': lzw_decompress[3],
-        'Total Time (s)': lzw_compress[3] + lzw_decompress[3]
-    })
-    
+        progress_callback(1.0, "Descompressão completa!")
+    return compressed_size, decompressed_size, compression_ratio, time.time() - start_time
+
+register_codec(Codec("Huffman", HUFFMAN_COMPRESSED_EXTENSION, (HuffmanProcessor.V2_MAGIC, HuffmanProcessor.STREAM_MAGIC),
+                     HuffmanProcessor.compress_file, HuffmanProcessor.decompress_file))
+register_codec(Codec("LZW", LZW_COMPRESSED_EXTENSION, (LZWProcessor.STREAM_MAGIC,),
+                     LZWProcessor.compress, LZWProcessor.decompress))
+register_codec(Codec("LZW+Huffman", LZW_HUFFMAN_COMPRESSED_EXTENSION, (LZWHuffmanProcessor.STREAM_MAGIC,),
+                     LZWHuffmanProcessor.compress, LZWHuffmanProcessor.decompress))
+register_codec(Codec("zlib", ZLIB_COMPRESSED_EXTENSION, (b'\x1f\x8b',), # Contêiner gzip
+                     functools.partial(_stdlib_compress, lambda: zlib.compressobj(6, zlib.DEFLATED, 31)),
+                     functools.partial(_stdlib_decompress, lambda: zlib.decompressobj(31))))
+register_codec(Codec("bz2", BZ2_COMPRESSED_EXTENSION, (b'BZh',),
+                     functools.partial(_stdlib_compress, lambda: bz2.BZ2Compressor(9)),
+                     functools.partial(_stdlib_decompress, bz2.BZ2Decompressor)))
+register_codec(Codec("lzma", LZMA_COMPRESSED_EXTENSION, (b'\xfd7zXZ\x00',), # Contêiner xz
+                     functools.partial(_stdlib_compress, lambda: lzma.LZMACompressor(preset=6)),
+                     functools.partial(_stdlib_decompress, lzma.LZMADecompressor)))
+
+def compare_algorithms(input_path: str, progress_callback: Optional[Callable[[float, str], None]] = None,
+                       codec_names: Optional[List[str]] = None) -> pd.DataFrame:
+    """Compara o desempenho dos codecs registrados (todos, ou os de codec_names) no mesmo arquivo"""
+    results = []
+    codecs = [get_codec(name) for name in (codec_names or CODECS)]
+    share = 1.0 / max(len(codecs), 1) # Fração da barra de progresso para cada codec
+
+    for index, codec in enumerate(codecs):
+        # Cria caminhos de saída temporários, incluindo o descomprimido para verificação
+        compressed_output = os.path.join(TEMP_FOLDER, f"temp_{codec.name}{codec.extension}")
+        decompressed_output = os.path.join(TEMP_FOLDER, f"{os.path.basename(input_path)}.{codec.name}out")
+        base = index * share
+
+        if progress_callback:
+            progress_callback(base, f"Testando compressão {codec.name}...")
+        compress_result = codec.compress_stream(input_path, compressed_output,
+            lambda p, m: progress_callback(base + p * share * 0.5, f"{codec.name}: {m}") if progress_callback else None)
+
+        if progress_callback:
+            progress_callback(base + share * 0.5, f"Testando descompressão {codec.name}...")
+        decompress_result = codec.decompress_stream(compressed_output, decompressed_output,
+            lambda p, m: progress_callback(base + share * (0.5 + p * 0.5), f"{codec.name}: {m}") if progress_callback else None)
+
+        # Limpa arquivos temporários
+        for f in [compressed_output, decompressed_output]:
+            try:
+                if os.path.exists(f):
+                    os.remove(f)
+            except OSError as e: # Captura OSError específico para operações de arquivo
+                st.warning(f"Não foi possível excluir o arquivo temporário {f}: {e}")
+                pass # Continua mesmo que a limpeza falhe para um arquivo
+
+        results.append({
+            'Algorithm': codec.name,
+            'Original Size (KB)': compress_result[0] / 1024,
+            'Compressed Size (KB)': compress_result[1] / 1024,
+            'Compression Ratio (%)': compress_result[2],
+            'Compression Time (s)': compress_result[3],
+            'Decompression Time (s)': decompress_result[3],
+            'Total Time (s)': compress_result[3] + decompress_result[3]
+        })
+
     return pd.DataFrame(results)
 
 def plot_comparison(df: pd.DataFrame):
@@ -2733,7 +5600,8 @@ def show_compression_ui():#"📦 Compactação ":
 
     if selected_view == "Compressão/Descompressão":
         # Seleção do algoritmo
-        algorithm = st.radio("Selecionar Algoritmo:", ("Huffman", "LZW"), key="algo_select")
+        algorithm = st.radio("Selecionar Algoritmo:", tuple(CODECS), key="algo_select")
+        codec = get_codec(algorithm)
         
         # Seleção da operação
         operation = st.radio("Selecionar Operação:", ("Compressão", "Descompressão"), key="op_select")
@@ -2741,12 +5609,9 @@ def show_compression_ui():#"📦 Compactação ":
         # Determina os tipos de arquivo permitidos para upload
         allowed_types = []
         if operation == "Compressão":
-            allowed_types = [".lzw", ".huff", ".csv", ".db", ".idx", ".btr"]
+            allowed_types = [".csv", ".db", ".idx", ".btr"] + [registered.extension for registered in CODECS.values()]
         else: # Descompressão
-            if algorithm == "Huffman":
-                allowed_types = [".huff"]
-            elif algorithm == "LZW":
-                allowed_types = [".lzw"]
+            allowed_types = [codec.extension]
         
         # Seleção de arquivo
         file_source = st.radio("Selecionar Origem do Arquivo:", ("Padrão", "Escolha do Usuário"), key="file_source")
@@ -2804,14 +5669,11 @@ def show_compression_ui():#"📦 Compactação ":
 #---------------------------------                    
                     original_file_name = os.path.basename(input_path_tab1)
 #---------------------------------
-                    output_ext = HUFFMAN_COMPRESSED_EXTENSION if algorithm == "Huffman" else LZW_COMPRESSED_EXTENSION
+                    output_ext = codec.extension
                     output_file_name = f"{original_file_name}_version{count_file(original_file_name,output_ext,COMPRESSED_FOLDER)}{output_ext}"
                     output_path_tab1 = os.path.join(output_folder, output_file_name)
 
-                    if algorithm == "Huffman":
-                        orig_s, comp_s, ratio, proc_t = HuffmanProcessor.compress_file(input_path_tab1, output_path_tab1, update_progress)
-                    else: # LZW
-                        orig_s, comp_s, ratio, proc_t = LZWProcessor.compress(input_path_tab1, output_path_tab1, update_progress)
+                    orig_s, comp_s, ratio, proc_t = codec.compress_stream(input_path_tab1, output_path_tab1, update_progress)
                     
                     st.success(f"Compressão {algorithm} Concluída!")
                     st.write(f"Tamanho Original: {orig_s / 1024:.2f} KB")
@@ -2830,18 +5692,18 @@ def show_compression_ui():#"📦 Compactação ":
 
                 else: # Descompressão
                     # Para descompressão, o arquivo de saída geralmente volta para a pasta de origem com uma nova extensão
-                    original_file_name, _ = os.path.splitext(os.path.basename(input_path_tab1))
-                    # Assumindo que queremos nomear o arquivo descomprimido com uma extensão reconhecível
-                    output_ext = HUFFMAN_COMPRESSED_EXTENSION if algorithm == "Huffman" else LZW_COMPRESSED_EXTENSION
-                    output_file_name = get_original(original_file_name,output_ext)
+                    # Remove o sufixo '_version<N><extensão>' para recuperar o nome do arquivo original
+                    original_file_name = os.path.basename(input_path_tab1)
+                    output_file_name = get_original(original_file_name, codec.extension)
+                    if output_file_name == original_file_name: # Sem sufixo de versão: apenas retira a extensão
+                        output_file_name = os.path.splitext(original_file_name)[0]
                     output_path_tab1 = os.path.join(TEMP_FOLDER, output_file_name) # Descomprime para temp por enquanto
                     
-                    if algorithm == "Huffman":
-                        comp_s, decomp_s, ratio, proc_t = HuffmanProcessor.decompress_file(input_path_tab1, output_path_tab1, update_progress)
-                    else: # LZW
-                        comp_s, decomp_s, ratio, proc_t = LZWProcessor.decompress(input_path_tab1, output_path_tab1, update_progress)
+                    # Os bytes mágicos têm precedência sobre o algoritmo selecionado
+                    file_codec = detect_codec(input_path_tab1) or codec
+                    comp_s, decomp_s, ratio, proc_t = file_codec.decompress_stream(input_path_tab1, output_path_tab1, update_progress)
                     
-                    st.success(f"Descompressão {algorithm} Concluída!")
+                    st.success(f"Descompressão {file_codec.name} Concluída!")
                     st.write(f"Tamanho Comprimido: {comp_s / 1024:.2f} KB")
                     st.write(f"Tamanho Descomprimido: {decomp_s / 1024:.2f} KB")
                     st.write(f"Tempo Gasto: {proc_t:.4f} segundos")
@@ -2880,7 +5742,8 @@ def show_compression_ui():#"📦 Compactação ":
     
     elif selected_view == "Comparação de Algoritmos":
         st.header("Comparação de Desempenho de Algoritmos")
-        st.write("Compare os algoritmos Huffman e LZW no mesmo arquivo")
+        st.write("Compare os codecs registrados (Huffman, LZW e os da biblioteca padrão) no mesmo arquivo")
+        compare_codecs = st.multiselect("Codecs:", list(CODECS), default=list(CODECS), key="compare_codecs")
         
         compare_file_source = st.radio(
             "Selecione o arquivo para comparação:", 
@@ -2907,8 +5770,8 @@ def show_compression_ui():#"📦 Compactação ":
             except Exception as e:
                 st.error(f"Erro ao acessar o diretório de origem: {str(e)}")
         else:
-            # Para comparação, permite .lzw, .huff, .csv, .db, .idx, .btr
-            compare_uploaded_allowed_types = [".lzw", ".huff", ".csv", ".db", ".idx", ".btr"]
+            # Para comparação, permite .csv, .db, .idx, .btr e as extensões dos codecs
+            compare_uploaded_allowed_types = [".csv", ".db", ".idx", ".btr"] + [codec.extension for codec in CODECS.values()]
             uploaded_file_types_for_st = [ext.strip('.') for ext in compare_uploaded_allowed_types]
 
             compare_uploaded = st.file_uploader(
@@ -2923,13 +5786,13 @@ def show_compression_ui():#"📦 Compactação ":
                 with open(input_path_compare, "wb") as f:
                     f.write(compare_uploaded.getbuffer())
         
-        if (compare_file or compare_uploaded) and st.button("Executar Comparação"):
+        if (compare_file or compare_uploaded) and compare_codecs and st.button("Executar Comparação"):
             progress_bar.progress(0)
             progress_text.text("Iniciando comparação...")
             
             try:
                 # Executa comparação
-                df = compare_algorithms(input_path_compare, update_progress)
+                df = compare_algorithms(input_path_compare, update_progress, compare_codecs)
                 
                 # Exibe resultados
                 st.success("Comparação concluída!")
@@ -2987,112 +5850,363 @@ S_INIT = [
     [
         0xD1310BA6, 0x98DFB5AC, 0x2FFD72DB, 0xD01ADFB7, 0xB8E1AFED, 0x6A267E96,
         0xBA7C9045, 0xF12C7F99, 0x24A19947, 0xB3916CF7, 0x0801F2E2, 0x858EFC16,
-        0x636920D8, 0x71574E69, 0xA458FE3E, 0x1BBEB41B
+        0x636920D8, 0x71574E69, 0xA458FEA3, 0xF4933D7E, 0x0D95748F, 0x728EB658,
+        0x718BCD58, 0x82154AEE, 0x7B54A41D, 0xC25A59B5, 0x9C30D539, 0x2AF26013,
+        0xC5D1B023, 0x286085F0, 0xCA417918, 0xB8DB38EF, 0x8E79DCB0, 0x603A180E,
+        0x6C9E0E8B, 0xB01E8A3E, 0xD71577C1, 0xBD314B27, 0x78AF2FDA, 0x55605C60,
+        0xE65525F3, 0xAA55AB94, 0x57489862, 0x63E81440, 0x55CA396A, 0x2AAB10B6,
+        0xB4CC5C34, 0x1141E8CE, 0xA15486AF, 0x7C72E993, 0xB3EE1411, 0x636FBC2A,
+        0x2BA9C55D, 0x741831F6, 0xCE5C3E16, 0x9B87931E, 0xAFD6BA33, 0x6C24CF5C,
+        0x7A325381, 0x28958677, 0x3B8F4898, 0x6B4BB9AF, 0xC4BFE81B, 0x66282193,
+        0x61D809CC, 0xFB21A991, 0x487CAC60, 0x5DEC8032, 0xEF845D5D, 0xE98575B1,
+        0xDC262302, 0xEB651B88, 0x23893E81, 0xD396ACC5, 0x0F6D6FF3, 0x83F44239,
+        0x2E0B4482, 0xA4842004, 0x69C8F04A, 0x9E1F9B5E, 0x21C66842, 0xF6E96C9A,
+        0x670C9C61, 0xABD388F0, 0x6A51A0D2, 0xD8542F68, 0x960FA728, 0xAB5133A3,
+        0x6EEF0B6C, 0x137A3BE4, 0xBA3BF050, 0x7EFB2A98, 0xA1F1651D, 0x39AF0176,
+        0x66CA593E, 0x82430E88, 0x8CEE8619, 0x456F9FB4, 0x7D84A5C3, 0x3B8B5EBE,
+        0xE06F75D8, 0x85C12073, 0x401A449F, 0x56C16AA6, 0x4ED3AA62, 0x363F7706,
+        0x1BFEDF72, 0x429B023D, 0x37D0D724, 0xD00A1248, 0xDB0FEAD3, 0x49F1C09B,
+        0x075372C9, 0x80991B7B, 0x25D479D8, 0xF6E8DEF7, 0xE3FE501A, 0xB6794C3B,
+        0x976CE0BD, 0x04C006BA, 0xC1A94FB6, 0x409F60C4, 0x5E5C9EC2, 0x196A2463,
+        0x68FB6FAF, 0x3E6C53B5, 0x1339B2EB, 0x3B52EC6F, 0x6DFC511F, 0x9B30952C,
+        0xCC814544, 0xAF5EBD09, 0xBEE3D004, 0xDE334AFD, 0x660F2807, 0x192E4BB3,
+        0xC0CBA857, 0x45C8740F, 0xD20B5F39, 0xB9D3FBDB, 0x5579C0BD, 0x1A60320A,
+        0xD6A100C6, 0x402C7279, 0x679F25FE, 0xFB1FA3CC, 0x8EA5E9F8, 0xDB3222F8,
+        0x3C7516DF, 0xFD616B15, 0x2F501EC8, 0xAD0552AB, 0x323DB5FA, 0xFD238760,
+        0x53317B48, 0x3E00DF82, 0x9E5C57BB, 0xCA6F8CA0, 0x1A87562E, 0xDF1769DB,
+        0xD542A8F6, 0x287EFFC3, 0xAC6732C6, 0x8C4F5573, 0x695B27B0, 0xBBCA58C8,
+        0xE1FFA35D, 0xB8F011A0, 0x10FA3D98, 0xFD2183B8, 0x4AFCB56C, 0x2DD1D35B,
+        0x9A53E479, 0xB6F84565, 0xD28E49BC, 0x4BFB9790, 0xE1DDF2DA, 0xA4CB7E33,
+        0x62FB1341, 0xCEE4C6E8, 0xEF20CADA, 0x36774C01, 0xD07E9EFE, 0x2BF11FB4,
+        0x95DBDA4D, 0xAE909198, 0xEAAD8E71, 0x6B93D5A0, 0xD08ED1D0, 0xAFC725E0,
+        0x8E3C5B2F, 0x8E7594B7, 0x8FF6E2FB, 0xF2122B64, 0x8888B812, 0x900DF01C,
+        0x4FAD5EA0, 0x688FC31C, 0xD1CFF191, 0xB3A8C1AD, 0x2F2F2218, 0xBE0E1777,
+        0xEA752DFE, 0x8B021FA1, 0xE5A0CC0F, 0xB56F74E8, 0x18ACF3D6, 0xCE89E299,
+        0xB4A84FE0, 0xFD13E0B7, 0x7CC43B81, 0xD2ADA8D9, 0x165FA266, 0x80957705,
+        0x93CC7314, 0x211A1477, 0xE6AD2065, 0x77B5FA86, 0xC75442F5, 0xFB9D35CF,
+        0xEBCDAF0C, 0x7B3E89A0, 0xD6411BD3, 0xAE1E7E49, 0x00250E2D, 0x2071B35E,
+        0x226800BB, 0x57B8E0AF, 0x2464369B, 0xF009B91E, 0x5563911D, 0x59DFA6AA,
+        0x78C14389, 0xD95A537F, 0x207D5BA2, 0x02E5B9C5, 0x83260376, 0x6295CFA9,
+        0x11C81968, 0x4E734A41, 0xB3472DCA, 0x7B14A94A, 0x1B510052, 0x9A532915,
+        0xD60F573F, 0xBC9BC6E4, 0x2B60A476, 0x81E67400, 0x08BA6FB5, 0x571BE91F,
+        0xF296EC6B, 0x2A0DD915, 0xB6636521, 0xE7B9F9B6, 0xFF34052E, 0xC5855664,
+        0x53B02D5D, 0xA99F8FA1, 0x08BA4799, 0x6E85076A
     ],
     [
-        0xE01BECD3, 0x86FA67DB, 0xF9D50F25, 0xBA7C9045, 0xF12C7F99, 0x24A19947,
-        0xB3916CF7, 0x0801F2E2, 0x858EFC16, 0x636920D8, 0x71574E69, 0xA458FE3E,
-        0x1BBEB41B, 0xE01BECD3, 0x86FA67DB, 0xF9D50F25
+        0x4B7A70E9, 0xB5B32944, 0xDB75092E, 0xC4192623, 0xAD6EA6B0, 0x49A7DF7D,
+        0x9CEE60B8, 0x8FEDB266, 0xECAA8C71, 0x699A17FF, 0x5664526C, 0xC2B19EE1,
+        0x193602A5, 0x75094C29, 0xA0591340, 0xE4183A3E, 0x3F54989A, 0x5B429D65,
+        0x6B8FE4D6, 0x99F73FD6, 0xA1D29C07, 0xEFE830F5, 0x4D2D38E6, 0xF0255DC1,
+        0x4CDD2086, 0x8470EB26, 0x6382E9C6, 0x021ECC5E, 0x09686B3F, 0x3EBAEFC9,
+        0x3C971814, 0x6B6A70A1, 0x687F3584, 0x52A0E286, 0xB79C5305, 0xAA500737,
+        0x3E07841C, 0x7FDEAE5C, 0x8E7D44EC, 0x5716F2B8, 0xB03ADA37, 0xF0500C0D,
+        0xF01C1F04, 0x0200B3FF, 0xAE0CF51A, 0x3CB574B2, 0x25837A58, 0xDC0921BD,
+        0xD19113F9, 0x7CA92FF6, 0x94324773, 0x22F54701, 0x3AE5E581, 0x37C2DADC,
+        0xC8B57634, 0x9AF3DDA7, 0xA9446146, 0x0FD0030E, 0xECC8C73E, 0xA4751E41,
+        0xE238CD99, 0x3BEA0E2F, 0x3280BBA1, 0x183EB331, 0x4E548B38, 0x4F6DB908,
+        0x6F420D03, 0xF60A04BF, 0x2CB81290, 0x24977C79, 0x5679B072, 0xBCAF89AF,
+        0xDE9A771F, 0xD9930810, 0xB38BAE12, 0xDCCF3F2E, 0x5512721F, 0x2E6B7124,
+        0x501ADDE6, 0x9F84CD87, 0x7A584718, 0x7408DA17, 0xBC9F9ABC, 0xE94B7D8C,
+        0xEC7AEC3A, 0xDB851DFA, 0x63094366, 0xC464C3D2, 0xEF1C1847, 0x3215D908,
+        0xDD433B37, 0x24C2BA16, 0x12A14D43, 0x2A65C451, 0x50940002, 0x133AE4DD,
+        0x71DFF89E, 0x10314E55, 0x81AC77D6, 0x5F11199B, 0x043556F1, 0xD7A3C76B,
+        0x3C11183B, 0x5924A509, 0xF28FE6ED, 0x97F1FBFA, 0x9EBABF2C, 0x1E153C6E,
+        0x86E34570, 0xEAE96FB1, 0x860E5E0A, 0x5A3E2AB3, 0x771FE71C, 0x4E3D06FA,
+        0x2965DCB9, 0x99E71D0F, 0x803E89D6, 0x5266C825, 0x2E4CC978, 0x9C10B36A,
+        0xC6150EBA, 0x94E2EA78, 0xA5FC3C53, 0x1E0A2DF4, 0xF2F74EA7, 0x361D2B3D,
+        0x1939260F, 0x19C27960, 0x5223A708, 0xF71312B6, 0xEBADFE6E, 0xEAC31F66,
+        0xE3BC4595, 0xA67BC883, 0xB17F37D1, 0x018CFF28, 0xC332DDEF, 0xBE6C5AA5,
+        0x65582185, 0x68AB9802, 0xEECEA50F, 0xDB2F953B, 0x2AEF7DAD, 0x5B6E2F84,
+        0x1521B628, 0x29076170, 0xECDD4775, 0x619F1510, 0x13CCA830, 0xEB61BD96,
+        0x0334FE1E, 0xAA0363CF, 0xB5735C90, 0x4C70A239, 0xD59E9E0B, 0xCBAADE14,
+        0xEECC86BC, 0x60622CA7, 0x9CAB5CAB, 0xB2F3846E, 0x648B1EAF, 0x19BDF0CA,
+        0xA02369B9, 0x655ABB50, 0x40685A32, 0x3C2AB4B3, 0x319EE9D5, 0xC021B8F7,
+        0x9B540B19, 0x875FA099, 0x95F7997E, 0x623D7DA8, 0xF837889A, 0x97E32D77,
+        0x11ED935F, 0x16681281, 0x0E358829, 0xC7E61FD6, 0x96DEDFA1, 0x7858BA99,
+        0x57F584A5, 0x1B227263, 0x9B83C3FF, 0x1AC24696, 0xCDB30AEB, 0x532E3054,
+        0x8FD948E4, 0x6DBC3128, 0x58EBF2EF, 0x34C6FFEA, 0xFE28ED61, 0xEE7C3C73,
+        0x5D4A14D9, 0xE864B7E3, 0x42105D14, 0x203E13E0, 0x45EEE2B6, 0xA3AAABEA,
+        0xDB6C4F15, 0xFACB4FD0, 0xC742F442, 0xEF6ABBB5, 0x654F3B1D, 0x41CD2105,
+        0xD81E799E, 0x86854DC7, 0xE44B476A, 0x3D816250, 0xCF62A1F2, 0x5B8D2646,
+        0xFC8883A0, 0xC1C7B6A3, 0x7F1524C3, 0x69CB7492, 0x47848A0B, 0x5692B285,
+        0x095BBF00, 0xAD19489D, 0x1462B174, 0x23820E00, 0x58428D2A, 0x0C55F5EA,
+        0x1DADF43E, 0x233F7061, 0x3372F092, 0x8D937E41, 0xD65FECF1, 0x6C223BDB,
+        0x7CDE3759, 0xCBEE7460, 0x4085F2A7, 0xCE77326E, 0xA6078084, 0x19F8509E,
+        0xE8EFD855, 0x61D99735, 0xA969A7AA, 0xC50C06C2, 0x5A04ABFC, 0x800BCADC,
+        0x9E447A2E, 0xC3453484, 0xFDD56705, 0x0E1E9EC9, 0xDB73DBD3, 0x105588CD,
+        0x675FDA79, 0xE3674340, 0xC5C43465, 0x713E38D8, 0x3D28F89E, 0xF16DFF20,
+        0x153E21E7, 0x8FB03D4A, 0xE6E39F2B, 0xDB83ADF7
     ],
     [
-        0x26027E2D, 0x94B7E38C, 0x0119E153, 0x858ECDBA, 0x98DFB5AC, 0x2FFD72DB,
-        0xD01ADFB7, 0xB8E1AFED, 0x6A267E96, 0xBA7C9045, 0xF12C7F99, 0x24A19947,
-        0xB3916CF7, 0x0801F2E2, 0x858EFC16, 0x636920D8
+        0xE93D5A68, 0x948140F7, 0xF64C261C, 0x94692934, 0x411520F7, 0x7602D4F7,
+        0xBCF46B2E, 0xD4A20068, 0xD4082471, 0x3320F46A, 0x43B7D4B7, 0x500061AF,
+        0x1E39F62E, 0x97244546, 0x14214F74, 0xBF8B8840, 0x4D95FC1D, 0x96B591AF,
+        0x70F4DDD3, 0x66A02F45, 0xBFBC09EC, 0x03BD9785, 0x7FAC6DD0, 0x31CB8504,
+        0x96EB27B3, 0x55FD3941, 0xDA2547E6, 0xABCA0A9A, 0x28507825, 0x530429F4,
+        0x0A2C86DA, 0xE9B66DFB, 0x68DC1462, 0xD7486900, 0x680EC0A4, 0x27A18DEE,
+        0x4F3FFEA2, 0xE887AD8C, 0xB58CE006, 0x7AF4D6B6, 0xAACE1E7C, 0xD3375FEC,
+        0xCE78A399, 0x406B2A42, 0x20FE9E35, 0xD9F385B9, 0xEE39D7AB, 0x3B124E8B,
+        0x1DC9FAF7, 0x4B6D1856, 0x26A36631, 0xEAE397B2, 0x3A6EFA74, 0xDD5B4332,
+        0x6841E7F7, 0xCA7820FB, 0xFB0AF54E, 0xD8FEB397, 0x454056AC, 0xBA489527,
+        0x55533A3A, 0x20838D87, 0xFE6BA9B7, 0xD096954B, 0x55A867BC, 0xA1159A58,
+        0xCCA92963, 0x99E1DB33, 0xA62A4A56, 0x3F3125F9, 0x5EF47E1C, 0x9029317C,
+        0xFDF8E802, 0x04272F70, 0x80BB155C, 0x05282CE3, 0x95C11548, 0xE4C66D22,
+        0x48C1133F, 0xC70F86DC, 0x07F9C9EE, 0x41041F0F, 0x404779A4, 0x5D886E17,
+        0x325F51EB, 0xD59BC0D1, 0xF2BCC18F, 0x41113564, 0x257B7834, 0x602A9C60,
+        0xDFF8E8A3, 0x1F636C1B, 0x0E12B4C2, 0x02E1329E, 0xAF664FD1, 0xCAD18115,
+        0x6B2395E0, 0x333E92E1, 0x3B240B62, 0xEEBEB922, 0x85B2A20E, 0xE6BA0D99,
+        0xDE720C8C, 0x2DA2F728, 0xD0127845, 0x95B794FD, 0x647D0862, 0xE7CCF5F0,
+        0x5449A36F, 0x877D48FA, 0xC39DFD27, 0xF33E8D1E, 0x0A476341, 0x992EFF74,
+        0x3A6F6EAB, 0xF4F8FD37, 0xA812DC60, 0xA1EBDDF8, 0x991BE14C, 0xDB6E6B0D,
+        0xC67B5510, 0x6D672C37, 0x2765D43B, 0xDCD0E804, 0xF1290DC7, 0xCC00FFA3,
+        0xB5390F92, 0x690FED0B, 0x667B9FFB, 0xCEDB7D9C, 0xA091CF0B, 0xD9155EA3,
+        0xBB132F88, 0x515BAD24, 0x7B9479BF, 0x763BD6EB, 0x37392EB3, 0xCC115979,
+        0x8026E297, 0xF42E312D, 0x6842ADA7, 0xC66A2B3B, 0x12754CCC, 0x782EF11C,
+        0x6A124237, 0xB79251E7, 0x06A1BBE6, 0x4BFB6350, 0x1A6B1018, 0x11CAEDFA,
+        0x3D25BDD8, 0xE2E1C3C9, 0x44421659, 0x0A121386, 0xD90CEC6E, 0xD5ABEA2A,
+        0x64AF674E, 0xDA86A85F, 0xBEBFE988, 0x64E4C3FE, 0x9DBC8057, 0xF0F7C086,
+        0x60787BF8, 0x6003604D, 0xD1FD8346, 0xF6381FB0, 0x7745AE04, 0xD736FCCC,
+        0x83426B33, 0xF01EAB71, 0xB0804187, 0x3C005E5F, 0x77A057BE, 0xBDE8AE24,
+        0x55464299, 0xBF582E61, 0x4E58F48F, 0xF2DDFDA2, 0xF474EF38, 0x8789BDC2,
+        0x5366F9C3, 0xC8B38E74, 0xB475F255, 0x46FCD9B9, 0x7AEB2661, 0x8B1DDF84,
+        0x846A0E79, 0x915F95E2, 0x466E598E, 0x20B45770, 0x8CD55591, 0xC902DE4C,
+        0xB90BACE1, 0xBB8205D0, 0x11A86248, 0x7574A99E, 0xB77F19B6, 0xE0A9DC09,
+        0x662D09A1, 0xC4324633, 0xE85A1F02, 0x09F0BE8C, 0x4A99A025, 0x1D6EFE10,
+        0x1AB93D1D, 0x0BA5A4DF, 0xA186F20F, 0x2868F169, 0xDCB7DA83, 0x573906FE,
+        0xA1E2CE9B, 0x4FCD7F52, 0x50115E01, 0xA70683FA, 0xA002B5C4, 0x0DE6D027,
+        0x9AF88C27, 0x773F8641, 0xC3604C06, 0x61A806B5, 0xF0177A28, 0xC0F586E0,
+        0x006058AA, 0x30DC7D62, 0x11E69ED7, 0x2338EA63, 0x53C2DD94, 0xC2C21634,
+        0xBBCBEE56, 0x90BCB6DE, 0xEBFC7DA1, 0xCE591D76, 0x6F05E409, 0x4B7C0188,
+        0x39720A3D, 0x7C927C24, 0x86E3725F, 0x724D9DB9, 0x1AC15BB4, 0xD39EB8FC,
+        0xED545578, 0x08FCA5B5, 0xD83D7CD3, 0x4DAD0FC4, 0x1E50EF5E, 0xB161E6F8,
+        0xA28514D9, 0x6C51133C, 0x6FD5C7E7, 0x56E14EC4, 0x362ABFCE, 0xDDC6C837,
+        0xD79A3234, 0x92638212, 0x670EFA8E, 0x406000E0
     ],
     [
-        0x71574E69, 0xA458FE3E, 0x1BBEB41B, 0xE01BECD3, 0x86FA67DB, 0xF9D50F25,
-        0xBA7C9045, 0xF12C7F99, 0x24A19947, 0xB3916CF7, 0x0801F2E2, 0x858EFC16,
-        0x636920D8, 0x71574E69, 0xA458FE3E, 0x1BBEB41B
+        0x3A39CE37, 0xD3FAF5CF, 0xABC27737, 0x5AC52D1B, 0x5CB0679E, 0x4FA33742,
+        0xD3822740, 0x99BC9BBE, 0xD5118E9D, 0xBF0F7315, 0xD62D1C7E, 0xC700C47B,
+        0xB78C1B6B, 0x21A19045, 0xB26EB1BE, 0x6A366EB4, 0x5748AB2F, 0xBC946E79,
+        0xC6A376D2, 0x6549C2C8, 0x530FF8EE, 0x468DDE7D, 0xD5730A1D, 0x4CD04DC6,
+        0x2939BBDB, 0xA9BA4650, 0xAC9526E8, 0xBE5EE304, 0xA1FAD5F0, 0x6A2D519A,
+        0x63EF8CE2, 0x9A86EE22, 0xC089C2B8, 0x43242EF6, 0xA51E03AA, 0x9CF2D0A4,
+        0x83C061BA, 0x9BE96A4D, 0x8FE51550, 0xBA645BD6, 0x2826A2F9, 0xA73A3AE1,
+        0x4BA99586, 0xEF5562E9, 0xC72FEFD3, 0xF752F7DA, 0x3F046F69, 0x77FA0A59,
+        0x80E4A915, 0x87B08601, 0x9B09E6AD, 0x3B3EE593, 0xE990FD5A, 0x9E34D797,
+        0x2CF0B7D9, 0x022B8B51, 0x96D5AC3A, 0x017DA67D, 0xD1CF3ED6, 0x7C7D2D28,
+        0x1F9F25CF, 0xADF2B89B, 0x5AD6B472, 0x5A88F54C, 0xE029AC71, 0xE019A5E6,
+        0x47B0ACFD, 0xED93FA9B, 0xE8D3C48D, 0x283B57CC, 0xF8D56629, 0x79132E28,
+        0x785F0191, 0xED756055, 0xF7960E44, 0xE3D35E8C, 0x15056DD4, 0x88F46DBA,
+        0x03A16125, 0x0564F0BD, 0xC3EB9E15, 0x3C9057A2, 0x97271AEC, 0xA93A072A,
+        0x1B3F6D9B, 0x1E6321F5, 0xF59C66FB, 0x26DCF319, 0x7533D928, 0xB155FDF5,
+        0x03563482, 0x8ABA3CBB, 0x28517711, 0xC20AD9F8, 0xABCC5167, 0xCCAD925F,
+        0x4DE81751, 0x3830DC8E, 0x379D5862, 0x9320F991, 0xEA7A90C2, 0xFB3E7BCE,
+        0x5121CE64, 0x774FBE32, 0xA8B6E37E, 0xC3293D46, 0x48DE5369, 0x6413E680,
+        0xA2AE0810, 0xDD6DB224, 0x69852DFD, 0x09072166, 0xB39A460A, 0x6445C0DD,
+        0x586CDECF, 0x1C20C8AE, 0x5BBEF7DD, 0x1B588D40, 0xCCD2017F, 0x6BB4E3BB,
+        0xDDA26A7E, 0x3A59FF45, 0x3E350A44, 0xBCB4CDD5, 0x72EACEA8, 0xFA6484BB,
+        0x8D6612AE, 0xBF3C6F47, 0xD29BE463, 0x542F5D9E, 0xAEC2771B, 0xF64E6370,
+        0x740E0D8D, 0xE75B1357, 0xF8721671, 0xAF537D5D, 0x4040CB08, 0x4EB4E2CC,
+        0x34D2466A, 0x0115AF84, 0xE1B00428, 0x95983A1D, 0x06B89FB4, 0xCE6EA048,
+        0x6F3F3B82, 0x3520AB82, 0x011A1D4B, 0x277227F8, 0x611560B1, 0xE7933FDC,
+        0xBB3A792B, 0x344525BD, 0xA08839E1, 0x51CE794B, 0x2F32C9B7, 0xA01FBAC9,
+        0xE01CC87E, 0xBCC7D1F6, 0xCF0111C3, 0xA1E8AAC7, 0x1A908749, 0xD44FBD9A,
+        0xD0DADECB, 0xD50ADA38, 0x0339C32A, 0xC6913667, 0x8DF9317C, 0xE0B12B4F,
+        0xF79E59B7, 0x43F5BB3A, 0xF2D519FF, 0x27D9459C, 0xBF97222C, 0x15E6FC2A,
+        0x0F91FC71, 0x9B941525, 0xFAE59361, 0xCEB69CEB, 0xC2A86459, 0x12BAA8D1,
+        0xB6C1075E, 0xE3056A0C, 0x10D25065, 0xCB03A442, 0xE0EC6E0E, 0x1698DB3B,
+        0x4C98A0BE, 0x3278E964, 0x9F1F9532, 0xE0D392DF, 0xD3A0342B, 0x8971F21E,
+        0x1B0A7441, 0x4BA3348C, 0xC5BE7120, 0xC37632D8, 0xDF359F8D, 0x9B992F2E,
+        0xE60B6F47, 0x0FE3F11D, 0xE54CDA54, 0x1EDAD891, 0xCE6279CF, 0xCD3E7E6F,
+        0x1618B166, 0xFD2C1D05, 0x848FD2C5, 0xF6FB2299, 0xF523F357, 0xA6327623,
+        0x93A83531, 0x56CCCD02, 0xACF08162, 0x5A75EBB5, 0x6E163697, 0x88D273CC,
+        0xDE966292, 0x81B949D0, 0x4C50901B, 0x71C65614, 0xE6C6C7BD, 0x327A140A,
+        0x45E1D006, 0xC3F27B9A, 0xC9AA53FD, 0x62A80F00, 0xBB25BFE2, 0x35BDD2F6,
+        0x71126905, 0xB2040222, 0xB6CBCF7C, 0xCD769C2B, 0x53113EC0, 0x1640E3D3,
+        0x38ABBD60, 0x2547ADF0, 0xBA38209C, 0xF746CE76, 0x77AFA1C5, 0x20756060,
+        0x85CBFE4E, 0x8AE88DD8, 0x7AAAF9B0, 0x4CF9AA7E, 0x1948C25C, 0x02FB8A8C,
+        0x01C36AE4, 0xD6EBE1F9, 0x90D4F869, 0xA65CDEA0, 0x3F09252D, 0xC208E69F,
+        0xB74E6132, 0xCE77E25B, 0x578FDFE3, 0x3AC372E6
     ]
 ]
 
 class Blowfish:
-    def __init__(self, key):
-        self.P = list(P_INIT)  # Make a copy
-        self.S = [list(s_arr) for s_arr in S_INIT] # Make a deep copy
+    BLOCK_SIZE = 8
+    # Streamed file format: STREAM_HEADER followed by the ciphertext of the chosen mode
+    STREAM_MAGIC = b'BFS1'
+    STREAM_HEADER = struct.Struct('<4sB16s8s') # Magic, mode, PBKDF2 salt, IV (CBC) or initial counter (CTR)
+    MODE_CBC = 1
+    MODE_CTR = 2
+    MODE_CTR_HMAC = 3 # CTR in independent chunks, each with an HMAC-SHA256 tag; processed in parallel
+    MODES = {'CTR+HMAC': MODE_CTR_HMAC, 'CTR': MODE_CTR, 'CBC': MODE_CBC}
+    CHUNKED_HEADER = struct.Struct('<I') # Chunk size, after STREAM_HEADER (and the file salt) in CTR+HMAC files
+    SUBKEY_FLAG = 0x80 # Set in the mode byte when the key is derived from a batch master key and a file salt
+    CHUNK_INFO = struct.Struct('<QB') # Chunk index and final-chunk flag, authenticated with each chunk
+    MAC_SIZE = 32
 
-        key_bytes = key
-        key_len = len(key_bytes)
-        
-        j = 0
+    def __init__(self, key):
+        if not 4 <= len(key) <= 56:
+            raise ValueError("A chave Blowfish deve ter entre 4 e 56 bytes")
+        P = list(P_INIT)  # Make a copy
+        S = [list(s_arr) for s_arr in S_INIT] # Make a deep copy
+        self.P = P
+        self.S = S
+
+        # XOR the P-array with the key, cycled byte by byte
+        key_stream = itertools.cycle(key)
         for i in range(18):
-            # Ensure key_bytes is long enough for struct.unpack, pad with zeros if not
-            chunk = key_bytes[j:j+4]
-            if len(chunk) < 4:
-                chunk += b'\x00' * (4 - len(chunk))
-            self.P[i] ^= struct.unpack('>I', chunk)[0]
-            j = (j + 4) % key_len
+            P[i] ^= int.from_bytes(bytes(itertools.islice(key_stream, 4)), 'big')
 
+        # Replace P and S with the output of the evolving cipher (521 block encryptions)
         L = 0
         R = 0
         for i in range(0, 18, 2):
             L, R = self._encrypt_block(L, R)
-            self.P[i] = L
-            self.P[i+1] = R
+            P[i] = L
+            P[i+1] = R
 
-        for i in range(4):
+        for box in S:
             for j in range(0, 256, 2):
                 L, R = self._encrypt_block(L, R)
-                self.S[i][j] = L
-                self.S[i][j+1] = R
+                box[j] = L
+                box[j+1] = R
 
-    def _feistel(self, x):
-        h = self.S[0][x >> 24 & 0xFF] + self.S[1][x >> 16 & 0xFF]
-        h ^= self.S[2][x >> 8 & 0xFF]
-        h += self.S[3][x & 0xFF]
-        return h & 0xFFFFFFFF
+        self._P_reversed = P[::-1] # Decryption runs the same rounds with the P-array reversed
+        self._tables = None
+
+    @staticmethod
+    def _crypt_block(L, R, P, S):
+        # Two rounds per iteration, so the halves never need swapping; all lookups are on locals
+        S0, S1, S2, S3 = S
+        for i in range(0, 16, 2):
+            L ^= P[i]
+            R ^= ((S0[L >> 24] + S1[L >> 16 & 0xFF] ^ S2[L >> 8 & 0xFF]) + S3[L & 0xFF]) & 0xFFFFFFFF
+            R ^= P[i+1]
+            L ^= ((S0[R >> 24] + S1[R >> 16 & 0xFF] ^ S2[R >> 8 & 0xFF]) + S3[R & 0xFF]) & 0xFFFFFFFF
+        return R ^ P[17], L ^ P[16]
 
     def _encrypt_block(self, L, R):
-        for i in range(16):
-            L ^= self.P[i]
-            R ^= self._feistel(L)
-            L, R = R, L # Swap L and R
-        R ^= self.P[16]
-        L ^= self.P[17]
-        return L, R # Don't swap after last round
+        return self._crypt_block(L, R, self.P, self.S)
 
     def _decrypt_block(self, L, R):
-        for i in range(17, 1, -1):
-            L ^= self.P[i]
-            R ^= self._feistel(L)
-            L, R = R, L # Swap L and R
-        R ^= self.P[1]
-        L ^= self.P[0]
-        return L, R # Don't swap after last round
+        return self._crypt_block(L, R, self._P_reversed, self.S)
+
+    def _crypt_blocks(self, L: np.ndarray, R: np.ndarray, P: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Runs the rounds on arrays of half-blocks (uint32) at once; every block is independent."""
+        if self._tables is None:
+            S = [np.array(box, dtype=np.uint32) for box in self.S]
+            # S0[a] + S1[b] only depends on the high 16 bits: one 64K-entry lookup instead of two
+            self._tables = ((S[0][:, None] + S[1][None, :]).ravel(), S[2], S[3])
+        S01, S2, S3 = self._tables
+        L = L.copy()
+        R = R.copy()
+        for i in range(0, 16, 2):
+            L ^= np.uint32(P[i])
+            R ^= (S01[L >> 16] ^ S2[(L >> 8) & 0xFF]) + S3[L & 0xFF]
+            R ^= np.uint32(P[i+1])
+            L ^= (S01[R >> 16] ^ S2[(R >> 8) & 0xFF]) + S3[R & 0xFF]
+        return R ^ np.uint32(P[17]), L ^ np.uint32(P[16])
+
+    def _crypt_ecb(self, data: bytes, P: List[int]) -> np.ndarray:
+        halves = np.frombuffer(data, dtype='>u4').astype(np.uint32).reshape(-1, 2)
+        out = np.empty_like(halves)
+        out[:, 0], out[:, 1] = self._crypt_blocks(halves[:, 0], halves[:, 1], P)
+        return out
+
+    def encrypt_blocks(self, data: bytes) -> bytes:
+        """Encrypts whole 8-byte blocks independently (ECB, no padding)."""
+        return self._crypt_ecb(data, self.P).astype('>u4').tobytes()
+
+    def decrypt_blocks(self, data: bytes) -> bytes:
+        """Decrypts whole 8-byte blocks independently (ECB, no padding)."""
+        return self._crypt_ecb(data, self._P_reversed).astype('>u4').tobytes()
+
+    def crypt_ctr(self, data: bytes, counter: bytes, block_offset: int = 0) -> bytes:
+        """
+        CTR mode (encryption and decryption are the same operation): XORs data with the
+        encryption of counter + block_offset, counter + block_offset + 1, ... (mod 2^64).
+        block_offset lets a stream be processed in chunks that are multiples of 8 bytes.
+        """
+        blocks = -(-len(data) // 8)
+        counters = np.arange(blocks, dtype=np.uint64) + np.uint64((int.from_bytes(counter, 'big') + block_offset) & (2**64 - 1))
+        L, R = self._crypt_blocks((counters >> np.uint64(32)).astype(np.uint32), counters.astype(np.uint32), self.P)
+        keystream = np.empty((blocks, 2), dtype='>u4')
+        keystream[:, 0] = L
+        keystream[:, 1] = R
+        return (np.frombuffer(data, dtype=np.uint8) ^ keystream.view(np.uint8).ravel()[:len(data)]).tobytes()
+
+    def encrypt_cbc(self, data: bytes, iv: bytes) -> bytes:
+        """
+        CBC encryption of whole blocks (no padding). Each block depends on the previous one,
+        so this runs block by block; the last ciphertext block is the IV of the next call.
+        """
+        out = bytearray(len(data))
+        pack_into = struct.pack_into
+        crypt_block = self._crypt_block
+        P = self.P
+        S = self.S
+        L, R = struct.unpack('>II', iv)
+        position = 0
+        for x, y in struct.iter_unpack('>II', data):
+            L, R = crypt_block(x ^ L, y ^ R, P, S)
+            pack_into('>II', out, position, L, R)
+            position += 8
+        return bytes(out)
+
+    def decrypt_cbc(self, data: bytes, iv: bytes) -> bytes:
+        """CBC decryption of whole blocks (no padding); the last ciphertext block is the IV of the next call."""
+        plain = self._crypt_ecb(data, self._P_reversed)
+        previous = np.frombuffer(iv + data[:-8], dtype='>u4').astype(np.uint32).reshape(-1, 2)
+        return (plain ^ previous).astype('>u4').tobytes()
+
+    @staticmethod
+    def for_key(key: bytes) -> 'Blowfish':
+        """Blowfish instance for key, with its expanded schedule reused from BLOWFISH_SCHEDULES."""
+        return BLOWFISH_SCHEDULES.get_or_create(KeyCache.fingerprint(key), lambda: Blowfish(key))
+
+    @staticmethod
+    def _chunk_tag(mac_key: bytes, header: bytes, index: int, last: bool, ciphertext: bytes) -> bytes:
+        # The tag covers the file header, the chunk position and the final-chunk flag, so chunks
+        # cannot be moved between files, reordered, dropped or truncated
+        tag = hmac.new(mac_key, header, hashlib.sha256)
+        tag.update(Blowfish.CHUNK_INFO.pack(index, last))
+        tag.update(ciphertext)
+        return tag.digest()
+
+    @staticmethod
+    def _encrypt_chunk(key: bytes, mac_key: bytes, header: bytes, iv: bytes, chunk_size: int,
+                       index: int, last: bool, chunk: bytes) -> bytes:
+        """Encrypts chunk number index of a CTR+HMAC file; returns the ciphertext followed by its tag."""
+        ciphertext = Blowfish.for_key(key).crypt_ctr(chunk, iv, index * (chunk_size // Blowfish.BLOCK_SIZE))
+        return ciphertext + Blowfish._chunk_tag(mac_key, header, index, last, ciphertext)
+
+    @staticmethod
+    def _decrypt_chunk(key: bytes, mac_key: bytes, header: bytes, iv: bytes, chunk_size: int,
+                       index: int, last: bool, frame: bytes) -> bytes:
+        """Checks the tag of chunk number index of a CTR+HMAC file and decrypts it."""
+        ciphertext, tag = frame[:-Blowfish.MAC_SIZE], frame[-Blowfish.MAC_SIZE:]
+        if len(frame) < Blowfish.MAC_SIZE or not hmac.compare_digest(tag, Blowfish._chunk_tag(mac_key, header, index, last, ciphertext)):
+            raise ValueError(f"Autenticação do bloco {index} falhou. Senha incorreta ou arquivo corrompido.")
+        return Blowfish.for_key(key).crypt_ctr(ciphertext, iv, index * (chunk_size // Blowfish.BLOCK_SIZE))
 
     def encrypt(self, data):
         # Pad data to be a multiple of 8 bytes (Blowfish block size)
         padding_len = 8 - (len(data) % 8)
-        data += bytes([padding_len]) * padding_len
-
-        encrypted_data = b''
-        for i in range(0, len(data), 8):
-            block = data[i:i+8]
-            L = struct.unpack('>I', block[:4])[0]
-            R = struct.unpack('>I', block[4:8])[0]
-            L, R = self._encrypt_block(L, R)
-            encrypted_data += struct.pack('>II', L, R)
-        return encrypted_data
+        return self.encrypt_blocks(bytes(data) + bytes([padding_len]) * padding_len)
 
     def decrypt(self, data):
-        decrypted_data = b''
-        for i in range(0, len(data), 8):
-            block = data[i:i+8]
-            L = struct.unpack('>I', block[:4])[0]
-            R = struct.unpack('>I', block[4:8])[0]
-            L, R = self._decrypt_block(L, R)
-            decrypted_data += struct.pack('>II', L, R)
+        if len(data) % 8:
+            raise ValueError("Tamanho dos dados criptografados não é múltiplo de 8. Arquivo corrompido?")
+        decrypted_data = self.decrypt_blocks(data)
         
         # Remove padding
         if not decrypted_data: # Handle empty decrypted data
             raise ValueError("Dados descriptografados vazios. Senha incorreta ou arquivo corrompido?")
+        return self.unpad(decrypted_data)
 
+    @staticmethod
+    def unpad(decrypted_data: bytes) -> bytes:
         padding_len = decrypted_data[-1]
         if padding_len > 8 or padding_len == 0: # Invalid padding, possibly corrupted data or no padding
-            # Attempt to return raw data if padding is clearly invalid but data exists
-            # This is a heuristic to handle cases where padding byte might be part of data
-            # For strict correctness, a better padding scheme (like PKCS7) would be needed
-            # For simplicity, if padding is > 8 or 0, we assume it's corrupt.
             raise ValueError("Padding incorreto ou dados corrompidos. Senha incorreta ou arquivo não Blowfish?")
         
         # Verify padding integrity: all padding bytes should match padding_len
@@ -3101,49 +6215,232 @@ class Blowfish:
 
         return decrypted_data[:-padding_len]
 
+class KeyCache:
+    """
+    Bounded LRU cache of key material, shared between threads. Entries are keyed by
+    fingerprints (HMAC under a random per-process secret), never by passwords or keys.
+    """
+    _SECRET = os.urandom(32)
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Any, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(secret: bytes) -> bytes:
+        return hmac.new(KeyCache._SECRET, secret, hashlib.sha256).digest()
+
+    def get_or_create(self, key: Any, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = factory() # Outside the lock: PBKDF2 and key schedules are slow
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+DERIVED_KEYS = KeyCache(KEY_CACHE_SIZE)
+BLOWFISH_SCHEDULES = KeyCache(BLOWFISH_SCHEDULE_CACHE_SIZE)
+RSA_KEYS = KeyCache(RSA_KEY_CACHE_SIZE)
+SESSION_KEYS = KeyCache(SESSION_KEY_CACHE_SIZE)
+
 def derive_key_pbkdf2(password: bytes, salt: bytes, dk_len: int = 16, iterations: int = 10000) -> bytes:
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=dk_len,
-        salt=salt,
-        iterations=iterations,
-        backend=default_backend()
-    )
-    return kdf.derive(password)
+    def derive() -> bytes:
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=dk_len,
+            salt=salt,
+            iterations=iterations,
+            backend=default_backend()
+        )
+        return kdf.derive(password)
+    # Repeated operations with the same password and salt (e.g. files of one batch) skip the KDF
+    return DERIVED_KEYS.get_or_create((KeyCache.fingerprint(password), bytes(salt), dk_len, iterations), derive)
+
+def derive_file_key(master_key: bytes, file_salt: bytes, dk_len: int = 32, info: bytes = b'blowfish file key') -> bytes:
+    """Per-file subkey of a batch master key (HKDF-SHA256); cheap, unlike PBKDF2 or RSA."""
+    return HKDF(algorithm=hashes.SHA256(), length=dk_len, salt=file_salt, info=info,
+                backend=default_backend()).derive(master_key)
+
+def read_ahead_chunks(source: BinaryIO, chunk_size: int) -> Iterator[Tuple[int, bool, bytes]]:
+    """Yields (index, last, chunk) for the chunks of source; the last one may be short or empty."""
+    chunk = source.read(chunk_size)
+    index = 0
+    while True:
+        next_chunk = source.read(chunk_size) if len(chunk) == chunk_size else b''
+        yield index, not next_chunk, chunk
+        if not next_chunk:
+            return
+        chunk = next_chunk
+        index += 1
+
+def _blowfish_key_size(mode: int) -> int:
+    # Blowfish key can be up to 56 bytes, using 32 for common practice; CTR+HMAC takes 32 more for the MAC key
+    return 64 if mode == Blowfish.MODE_CTR_HMAC else 32
+
+def _blowfish_workers(workers: int, file_path: str) -> int:
+    """Processes actually used for file_path: a single one below CRYPTO_PARALLEL_MIN_SIZE."""
+    return workers if workers > 1 and os.path.getsize(file_path) >= CRYPTO_PARALLEL_MIN_SIZE else 1
+
+def _blowfish_encrypt_stream(input_file: str, output_file: str, mode: int, salt: bytes, derived: bytes,
+                             workers: int, file_salt: bytes = b''):
+    """Writes the encrypted file; file_salt is given for keys derived from a batch master key."""
+    iv = os.urandom(Blowfish.BLOCK_SIZE) # CBC IV, or initial counter in CTR mode
+    key = derived[:32]
+    cipher = Blowfish.for_key(key)
+    with open(input_file, 'rb') as source, open(output_file, 'wb') as f:
+        header = Blowfish.STREAM_HEADER.pack(Blowfish.STREAM_MAGIC, mode | (Blowfish.SUBKEY_FLAG if file_salt else 0), salt, iv)
+        header += file_salt
+        if mode == Blowfish.MODE_CTR_HMAC:
+            header += Blowfish.CHUNKED_HEADER.pack(BLOWFISH_CHUNK_SIZE)
+        f.write(header)
+        if mode == Blowfish.MODE_CTR_HMAC:
+            # Independent chunks, fanned out to the worker processes and written back in order
+            arguments = ((key, derived[32:], header, iv, BLOWFISH_CHUNK_SIZE, index, last, chunk)
+                         for index, last, chunk in read_ahead_chunks(source, BLOWFISH_CHUNK_SIZE))
+            for frame in run_ordered(Blowfish._encrypt_chunk, arguments, _blowfish_workers(workers, input_file)):
+                f.write(frame)
+        elif mode == Blowfish.MODE_CTR:
+            block_offset = 0
+            while chunk := source.read(BLOWFISH_CHUNK_SIZE):
+                f.write(cipher.crypt_ctr(chunk, iv, block_offset))
+                block_offset += len(chunk) // Blowfish.BLOCK_SIZE
+        else:
+            while True:
+                chunk = source.read(BLOWFISH_CHUNK_SIZE)
+                if len(chunk) < BLOWFISH_CHUNK_SIZE:
+                    # Last chunk: pad to a multiple of 8 bytes (a whole block if already aligned)
+                    padding_len = 8 - (len(chunk) % 8)
+                    f.write(cipher.encrypt_cbc(chunk + bytes([padding_len]) * padding_len, iv))
+                    break
+                ciphertext = cipher.encrypt_cbc(chunk, iv)
+                f.write(ciphertext)
+                iv = ciphertext[-8:]
+
+# One worker by default; a pool is started only when workers > 1 and the file has at least
+# CRYPTO_PARALLEL_MIN_SIZE bytes
+def blowfish_encrypt_file(input_file: str, output_file: str, password: str, mode: str = 'CTR+HMAC',
+                          workers: int = 1):
+    if mode not in Blowfish.MODES:
+        raise ValueError(f"Modo Blowfish desconhecido: {mode}. Disponíveis: {', '.join(Blowfish.MODES)}")
+    salt = os.urandom(16)
+    derived = derive_key_pbkdf2(password.encode(), salt, dk_len=_blowfish_key_size(Blowfish.MODES[mode]))
+    _blowfish_encrypt_stream(input_file, output_file, Blowfish.MODES[mode], salt, derived, workers)
 
-def blowfish_encrypt_file(input_file: str, output_file: str, password: str):
+def blowfish_encrypt_files(files: Iterable[Tuple[str, str]], password: str, mode: str = 'CTR+HMAC',
+                           workers: int = 1) -> int:
+    """
+    Encrypts each (input, output) pair of files under one password. PBKDF2 runs once for the
+    whole batch (master key); every file gets its own subkey from a random file salt, so no
+    two files share a key. Each output is read back with blowfish_decrypt_file, and files of
+    the same batch share the PBKDF2 salt, so decrypting them also derives the master key once.
+    Returns the number of files encrypted.
+    """
+    if mode not in Blowfish.MODES:
+        raise ValueError(f"Modo Blowfish desconhecido: {mode}. Disponíveis: {', '.join(Blowfish.MODES)}")
     salt = os.urandom(16)
-    key = derive_key_pbkdf2(password.encode(), salt, dk_len=32) # Blowfish key can be up to 56 bytes, using 32 for common practice.
-    
-    cipher = Blowfish(key)
+    master_key = derive_key_pbkdf2(password.encode(), salt, dk_len=32)
+    count = 0
+    for input_file, output_file in files:
+        file_salt = os.urandom(16)
+        derived = derive_file_key(master_key, file_salt, _blowfish_key_size(Blowfish.MODES[mode]))
+        _blowfish_encrypt_stream(input_file, output_file, Blowfish.MODES[mode], salt, derived, workers, file_salt)
+        count += 1
+    return count
+
+def blowfish_decrypt_file(input_file: str, output_file: str, password: str, workers: int = 1):
     with open(input_file, 'rb') as f:
-        plaintext = f.read()
-    
-    ciphertext = cipher.encrypt(plaintext)
-    
-    with open(output_file, 'wb') as f:
-        f.write(salt)
-        f.write(ciphertext)
+        header = f.read(Blowfish.STREAM_HEADER.size)
+        if len(header) < Blowfish.STREAM_HEADER.size or header[:4] != Blowfish.STREAM_MAGIC:
+            # No other layout was ever written: before BFS1 the S-box tables were incomplete and encryption failed
+            raise ValueError(f"Erro ao descriptografar: formato desconhecido (esperado cabeçalho {Blowfish.STREAM_MAGIC.decode()})")
+
+        _, mode, salt, iv = Blowfish.STREAM_HEADER.unpack(header)
+        subkey = bool(mode & Blowfish.SUBKEY_FLAG)
+        mode &= ~Blowfish.SUBKEY_FLAG
+        if mode not in Blowfish.MODES.values():
+            raise ValueError(f"Erro ao descriptografar: modo Blowfish desconhecido ({mode})")
+        if subkey:
+            file_salt = f.read(16)
+            if len(file_salt) < 16:
+                raise ValueError("Erro ao descriptografar: cabeçalho truncado")
+            header += file_salt
+        if mode == Blowfish.MODE_CTR_HMAC:
+            chunk_header = f.read(Blowfish.CHUNKED_HEADER.size)
+            if len(chunk_header) < Blowfish.CHUNKED_HEADER.size:
+                raise ValueError("Erro ao descriptografar: cabeçalho truncado")
+            chunk_size = Blowfish.CHUNKED_HEADER.unpack(chunk_header)[0]
+            if not 0 < chunk_size <= AES_STREAM_MAX_CHUNK_SIZE or chunk_size % Blowfish.BLOCK_SIZE:
+                raise ValueError(f"Erro ao descriptografar: tamanho de bloco inválido ({chunk_size})")
+            header += chunk_header
+        if subkey:
+            derived = derive_file_key(derive_key_pbkdf2(password.encode(), salt, dk_len=32), file_salt, _blowfish_key_size(mode))
+        else:
+            derived = derive_key_pbkdf2(password.encode(), salt, dk_len=_blowfish_key_size(mode))
+        key = derived[:32]
+        cipher = Blowfish.for_key(key)
 
-def blowfish_decrypt_file(input_file: str, output_file: str, password: str):
-    with open(input_file, 'rb') as f:
-        salt = f.read(16)
-        ciphertext = f.read()
-    
-    key = derive_key_pbkdf2(password.encode(), salt, dk_len=32)
-    cipher = Blowfish(key)
-    
-    try:
-        plaintext = cipher.decrypt(ciphertext)
-    except ValueError as e:
-        raise ValueError(f"Erro ao descriptografar: {e}")
-    
-    with open(output_file, 'wb') as f:
-        f.write(plaintext)
+        try:
+            with open(output_file, 'wb') as output:
+                if mode == Blowfish.MODE_CTR_HMAC:
+                    # Each chunk is written only after its tag is verified
+                    arguments = ((key, derived[32:], header, iv, chunk_size, index, last, frame)
+                                 for index, last, frame in read_ahead_chunks(f, chunk_size + Blowfish.MAC_SIZE))
+                    for plaintext in run_ordered(Blowfish._decrypt_chunk, arguments, _blowfish_workers(workers, input_file)):
+                        output.write(plaintext)
+                elif mode == Blowfish.MODE_CTR:
+                    block_offset = 0
+                    while chunk := f.read(BLOWFISH_CHUNK_SIZE):
+                        output.write(cipher.crypt_ctr(chunk, iv, block_offset))
+                        block_offset += len(chunk) // Blowfish.BLOCK_SIZE
+                else:
+                    chunk = f.read(BLOWFISH_CHUNK_SIZE)
+                    while True:
+                        # Read ahead one chunk: the padding is only removed from the last one
+                        next_chunk = f.read(BLOWFISH_CHUNK_SIZE) if len(chunk) == BLOWFISH_CHUNK_SIZE else b''
+                        if not chunk or len(chunk) % 8:
+                            raise ValueError("Tamanho do texto cifrado não é múltiplo de 8. Arquivo corrompido?")
+                        plaintext = cipher.decrypt_cbc(chunk, iv)
+                        iv = chunk[-8:]
+                        if not next_chunk:
+                            output.write(Blowfish.unpad(plaintext))
+                            break
+                        output.write(plaintext)
+                        chunk = next_chunk
+        except ValueError as e:
+            os.remove(output_file)
+            raise ValueError(f"Erro ao descriptografar: {e}")
 # ====================================================================
 # RSA and AES Hybrid Implementation
 # ====================================================================
 class CryptographyHandler:
+    # Streamed hybrid format: STREAM_HEADER, RSA-encrypted session key and base nonce, then one
+    # frame per chunk (ciphertext + GCM tag). Every chunk except the last holds exactly chunk_size
+    # bytes; the nonce of chunk i is the base nonce XOR (i << 8 | last), so reordered, dropped or
+    # truncated chunks fail authentication. The whole header is authenticated with every chunk.
+    # Batch files (BATCH_MAGIC) wrap one master key per batch and add a file salt after the base
+    # nonce; the file's session key is derive_file_key(master key, file salt).
+    STREAM_MAGIC = b'AGS1'
+    BATCH_MAGIC = b'AGB1'
+    STREAM_HEADER = struct.Struct('<4sIH') # Magic, chunk size, encrypted session key size
+    FILE_SALT_SIZE = 16
+    FILE_KEY_INFO = b'hybrid file key'
+    GCM_NONCE_SIZE = 12
+    GCM_TAG_SIZE = 16
+
     @staticmethod
     def generate_rsa_keys(key_name: str = "rsa_key", key_size: int = 2048) -> Tuple[Path, Path]:
         private_key = rsa.generate_private_key(
@@ -3182,70 +6479,172 @@ class CryptographyHandler:
             f.write("This is a test document for encryption and decryption. " * 100) # Make it reasonably large
     
     @staticmethod
-    def hybrid_encrypt_file(input_file: str, public_key_file: str, output_file: str):
-        with open(input_file, 'rb') as f:
-            plaintext = f.read()
+    def _chunk_nonce(base_nonce: bytes, index: int, last: bool) -> bytes:
+        counter = (index << 8) | int(last)
+        return (int.from_bytes(base_nonce, 'big') ^ counter).to_bytes(CryptographyHandler.GCM_NONCE_SIZE, 'big')
 
-        with open(public_key_file, 'rb') as f:
-            public_key = serialization.load_pem_public_key(f.read(), backend=default_backend())
-        
-        # Generate a random AES key (session key)
-        session_key = os.urandom(32) # AES-256 key
-        
-        # Encrypt the session key with RSA
-        encrypted_session_key = public_key.encrypt(
-            session_key,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
+    @staticmethod
+    def _encrypt_chunk(session_key: bytes, base_nonce: bytes, header: bytes, index: int, last: bool, chunk: bytes) -> bytes:
+        encryptor = Cipher(algorithms.AES(session_key),
+                           modes.GCM(CryptographyHandler._chunk_nonce(base_nonce, index, last)),
+                           backend=default_backend()).encryptor()
+        encryptor.authenticate_additional_data(header)
+        return encryptor.update(chunk) + encryptor.finalize() + encryptor.tag
+
+    @staticmethod
+    def _decrypt_chunk(session_key: bytes, base_nonce: bytes, header: bytes, index: int, last: bool, frame: bytes) -> bytes:
+        if len(frame) < CryptographyHandler.GCM_TAG_SIZE:
+            raise ValueError("Arquivo truncado ou corrompido.")
+        decryptor = Cipher(algorithms.AES(session_key),
+                           modes.GCM(CryptographyHandler._chunk_nonce(base_nonce, index, last)),
+                           backend=default_backend()).decryptor()
+        decryptor.authenticate_additional_data(header)
+        plaintext = decryptor.update(frame[:-CryptographyHandler.GCM_TAG_SIZE])
+        try:
+            decryptor.finalize_with_tag(frame[-CryptographyHandler.GCM_TAG_SIZE:])
+        except CryptoInvalidTag:
+            raise ValueError("Tag de autenticação inválida. Arquivo corrompido, truncado ou chave incorreta.")
+        return plaintext
+
+    @staticmethod
+    def load_key(key_file: str, private: bool = False):
+        """Parsed PEM key, reused from RSA_KEYS while the file keeps the same path, mtime and size."""
+        stat = os.stat(key_file)
+        def load():
+            with open(key_file, 'rb') as f:
+                pem = f.read()
+            if private:
+                return serialization.load_pem_private_key(pem, password=None, backend=default_backend()) # Assuming no password for private key
+            return serialization.load_pem_public_key(pem, backend=default_backend())
+        return RSA_KEYS.get_or_create((os.path.abspath(key_file), stat.st_mtime_ns, stat.st_size, private), load)
+
+    @staticmethod
+    def _oaep() -> padding.OAEP:
+        return padding.OAEP(
+            mgf=padding.MGF1(algorithm=hashes.SHA256()),
+            algorithm=hashes.SHA256(),
+            label=None
         )
-        
-        # Encrypt the data with AES using the session key (AES-256 GCM recommended)
-        iv = os.urandom(16) # Initialization vector for AES
-        cipher = Cipher(algorithms.AES(session_key), modes.GCM(iv), backend=default_backend())
-        encryptor = cipher.encryptor()
-        
-        ciphertext = encryptor.update(plaintext) + encryptor.finalize()
-        tag = encryptor.tag # Authentication tag for GCM
 
-        # Write everything to the output file: encrypted_session_key, iv, tag, ciphertext
-        with open(output_file, 'wb') as f:
-            f.write(encrypted_session_key)
-            f.write(iv)
-            f.write(tag)
-            f.write(ciphertext)
-
-    @staticmethod
-    def hybrid_decrypt_file(input_file: str, private_key_file: str, output_file: str):
-        with open(private_key_file, 'rb') as f:
-            private_key = serialization.load_pem_private_key(
-                f.read(),
-                password=None, # Assuming no password for private key
-                backend=default_backend()
-            )
-        
-        with open(input_file, 'rb') as f:
-            rsa_key_size_bytes = private_key.key_size // 8 # Get key size after loading private key
-            encrypted_session_key = f.read(rsa_key_size_bytes)
-            iv = f.read(16) # AES IV size
-            tag = f.read(16) # AES GCM tag size
-            ciphertext = f.read()
+    @staticmethod
+    def _encrypt_stream(input_file: str, output_file: str, session_key: bytes, encrypted_session_key: bytes,
+                        chunk_size: int, workers: int, file_salt: bytes = b''):
+        if not 0 < chunk_size <= AES_STREAM_MAX_CHUNK_SIZE:
+            raise ValueError(f"chunk_size deve estar entre 1 e {AES_STREAM_MAX_CHUNK_SIZE}")
+        magic = CryptographyHandler.BATCH_MAGIC if file_salt else CryptographyHandler.STREAM_MAGIC
+        base_nonce = os.urandom(CryptographyHandler.GCM_NONCE_SIZE)
+        header = (CryptographyHandler.STREAM_HEADER.pack(magic, chunk_size, len(encrypted_session_key))
+                  + encrypted_session_key + base_nonce + file_salt)
+
+        # Chunks are read ahead so the last one (possibly empty) gets the final-chunk marker;
+        # at most 2 * workers of them are in memory at once
+        with open(input_file, 'rb') as source, open(output_file, 'wb') as f:
+            f.write(header)
+            arguments = ((session_key, base_nonce, header, index, last, chunk)
+                         for index, last, chunk in read_ahead_chunks(source, chunk_size))
+            for frame in run_ordered(CryptographyHandler._encrypt_chunk, arguments, workers):
+                f.write(frame)
+
+    # OpenSSL's AES-GCM outruns the transfer of chunks between processes, so the hybrid
+    # functions default to a single worker; more only pay off for slow storage or CPUs without AES-NI
+    @staticmethod
+    def hybrid_encrypt_file(input_file: str, public_key_file: str, output_file: str, chunk_size: int = AES_STREAM_CHUNK_SIZE,
+                            workers: int = 1):
+        public_key = CryptographyHandler.load_key(public_key_file)
         
-        # Decrypt the session key with RSA
+        # Generate a random AES key (session key) and encrypt it with RSA
+        session_key = os.urandom(32) # AES-256 key
+        encrypted_session_key = public_key.encrypt(session_key, CryptographyHandler._oaep())
+        CryptographyHandler._encrypt_stream(input_file, output_file, session_key, encrypted_session_key, chunk_size, workers)
+
+    @staticmethod
+    def hybrid_encrypt_files(files: Iterable[Tuple[str, str]], public_key_file: str, chunk_size: int = AES_STREAM_CHUNK_SIZE,
+                             workers: int = 1) -> int:
+        """
+        Encrypts each (input, output) pair of files with one RSA operation for the whole batch:
+        a random master key is wrapped once and every file gets its own session key from a
+        random file salt. Each output is read back with hybrid_decrypt_file, which unwraps the
+        master key of a batch only once. Returns the number of files encrypted.
+        """
+        public_key = CryptographyHandler.load_key(public_key_file)
+        master_key = os.urandom(32)
+        encrypted_master_key = public_key.encrypt(master_key, CryptographyHandler._oaep())
+        count = 0
+        for input_file, output_file in files:
+            file_salt = os.urandom(CryptographyHandler.FILE_SALT_SIZE)
+            session_key = derive_file_key(master_key, file_salt, info=CryptographyHandler.FILE_KEY_INFO)
+            CryptographyHandler._encrypt_stream(input_file, output_file, session_key, encrypted_master_key,
+                                                chunk_size, workers, file_salt)
+            count += 1
+        return count
+
+    @staticmethod
+    def _decrypt_session_key(private_key, encrypted_session_key: bytes) -> bytes:
         try:
-            session_key = private_key.decrypt(
-                encrypted_session_key,
-                padding.OAEP(
-                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                    algorithm=hashes.SHA256(),
-                    label=None
-                )
-            )
+            return private_key.decrypt(encrypted_session_key, CryptographyHandler._oaep())
         except Exception as e:
             raise ValueError(f"Erro ao descriptografar a chave de sessão RSA: {e}. Chave privada incorreta ou arquivo corrompido.")
 
+    @staticmethod
+    def hybrid_decrypt_file(input_file: str, private_key_file: str, output_file: str, workers: int = 1):
+        private_key = CryptographyHandler.load_key(private_key_file, private=True)
+
+        with open(input_file, 'rb') as f:
+            magic = f.read(4)
+            if magic not in (CryptographyHandler.STREAM_MAGIC, CryptographyHandler.BATCH_MAGIC):
+                # Original format: encrypted session key, IV, tag and a single ciphertext
+                f.seek(0)
+                CryptographyHandler._hybrid_decrypt_single(f, private_key, output_file)
+                return
+
+            fixed = magic + f.read(CryptographyHandler.STREAM_HEADER.size - 4)
+            if len(fixed) < CryptographyHandler.STREAM_HEADER.size:
+                raise ValueError("Cabeçalho truncado. Arquivo corrompido.")
+            _, chunk_size, key_size = CryptographyHandler.STREAM_HEADER.unpack(fixed)
+            if not 0 < chunk_size <= AES_STREAM_MAX_CHUNK_SIZE or key_size != private_key.key_size // 8:
+                raise ValueError("Cabeçalho inválido. Chave privada incorreta ou arquivo corrompido.")
+            encrypted_session_key = f.read(key_size)
+            base_nonce = f.read(CryptographyHandler.GCM_NONCE_SIZE)
+            if len(base_nonce) < CryptographyHandler.GCM_NONCE_SIZE:
+                raise ValueError("Cabeçalho truncado. Arquivo corrompido.")
+            header = fixed + encrypted_session_key + base_nonce
+            if magic == CryptographyHandler.BATCH_MAGIC:
+                file_salt = f.read(CryptographyHandler.FILE_SALT_SIZE)
+                if len(file_salt) < CryptographyHandler.FILE_SALT_SIZE:
+                    raise ValueError("Cabeçalho truncado. Arquivo corrompido.")
+                header += file_salt
+                # Files of one batch share the wrapped master key: one RSA operation per batch. The entry
+                # is bound to the private key (its modulus), so only the same key can reuse it
+                modulus = private_key.public_key().public_numbers().n
+                master_key = SESSION_KEYS.get_or_create(
+                    (KeyCache.fingerprint(encrypted_session_key), KeyCache.fingerprint(modulus.to_bytes(key_size, 'big'))),
+                    lambda: CryptographyHandler._decrypt_session_key(private_key, encrypted_session_key))
+                session_key = derive_file_key(master_key, file_salt, info=CryptographyHandler.FILE_KEY_INFO)
+            else:
+                session_key = CryptographyHandler._decrypt_session_key(private_key, encrypted_session_key)
+
+            # A frame is the last one when nothing follows it; only authenticated chunks reach the output
+            try:
+                with open(output_file, 'wb') as output:
+                    arguments = ((session_key, base_nonce, header, index, last, frame)
+                                 for index, last, frame in read_ahead_chunks(f, chunk_size + CryptographyHandler.GCM_TAG_SIZE))
+                    for plaintext in run_ordered(CryptographyHandler._decrypt_chunk, arguments, workers):
+                        output.write(plaintext)
+            except Exception:
+                os.remove(output_file)
+                raise
+
+    @staticmethod
+    def _hybrid_decrypt_single(f: BinaryIO, private_key, output_file: str):
+        rsa_key_size_bytes = private_key.key_size // 8 # Get key size after loading private key
+        encrypted_session_key = f.read(rsa_key_size_bytes)
+        iv = f.read(16) # AES IV size
+        tag = f.read(16) # AES GCM tag size
+        ciphertext = f.read()
+        
+        # Decrypt the session key with RSA
+        session_key = CryptographyHandler._decrypt_session_key(private_key, encrypted_session_key)
+
         # Decrypt the data with AES using the session key
         cipher = Cipher(algorithms.AES(session_key), modes.GCM(iv, tag), backend=default_backend())
         decryptor = cipher.decryptor()
@@ -3259,6 +6658,15 @@ class CryptographyHandler:
 
         with open(output_file, 'wb') as f:
             f.write(plaintext)
+def crypto_workers_input(key: str, blowfish: bool) -> int:
+    """Campo com o número de processos para os formatos em blocos autenticados (CTR+HMAC e AGS1)."""
+    if blowfish:
+        help_text = f"Usados apenas no modo CTR+HMAC, em arquivos a partir de {CRYPTO_PARALLEL_MIN_SIZE // (1024 * 1024)} MB."
+    else:
+        help_text = "O AES-GCM costuma ser mais rápido em um só processo; mais processos ajudam em CPUs sem AES-NI."
+    return int(st.number_input("Processos paralelos", min_value=1, max_value=os.cpu_count() or 1, value=1, step=1,
+                               key=key, help=help_text))
+
 def show_encryption_ui():
     st.title("Ferramenta de Criptografia de Arquivos")
 
@@ -3342,15 +6750,18 @@ def show_encryption_ui():
     if selected_operation == "Blowfish Criptografar":
         st.header("Criptografia Blowfish")
         output_filename = st.text_input("Nome do arquivo de saída (será salvo em 'Documents/Data/Encrypt')", 
-                                        value=f"{os.path.basename(Path(input_file_path).name)}_version{count_file(input_file_path,".enc.bf",ENCRYPT_FOLDER)}.enc.bf" if input_file_path else "", 
+                                        value=f"{os.path.basename(Path(input_file_path).name)}_version{count_file(input_file_path,'.enc.bf',ENCRYPT_FOLDER)}.enc.bf" if input_file_path else "", 
                                         key="blowfish_output_enc")
         password = st.text_input("Senha para Blowfish", type="password", key="blowfish_password_enc")
+        blowfish_mode = st.radio("Modo de operação", tuple(Blowfish.MODES), key="blowfish_mode_enc",
+                                 help="CTR processa os blocos de forma independente (mais rápido); CBC encadeia os blocos.")
+        workers = crypto_workers_input("blowfish_workers_enc", blowfish=True) if blowfish_mode == 'CTR+HMAC' else 1
 
         if st.button("Criptografar com Blowfish", key="btn_blowfish_enc"):
             if input_file_path and output_filename and password:
                 output_path = ENCRYPT_FOLDER / output_filename
                 try:
-                    blowfish_encrypt_file(str(input_file_path), str(output_path), password)
+                    blowfish_encrypt_file(str(input_file_path), str(output_path), password, blowfish_mode, workers)
                     st.success(f"Arquivo criptografado com sucesso em '{output_path}'!")
                     with open(output_path, "rb") as f:
                         st.download_button(
@@ -3380,13 +6791,14 @@ def show_encryption_ui():
                                         value=get_original(input_file_path,'.enc') if input_file_path else "", 
                                         key="blowfish_output_dec")
         password = st.text_input("Senha para Blowfish", type="password", key="blowfish_password_dec")
+        workers = crypto_workers_input("blowfish_workers_dec", blowfish=True)
 
         if st.button("Descriptografar com Blowfish", key="btn_blowfish_dec"):
             if input_file_path and output_filename and password:
                 with tempfile.TemporaryDirectory() as temp_dir_output: # Use a new temp dir for output
                     output_path = os.path.join(temp_dir_output, output_filename)
                     try:
-                        blowfish_decrypt_file(str(input_file_path), output_path, password)
+                        blowfish_decrypt_file(str(input_file_path), output_path, password, workers)
                         st.success(f"Arquivo descriptografado com sucesso em '{output_filename}'!")
                         with open(output_path, "rb") as f:
                             st.download_button(
@@ -3462,16 +6874,18 @@ def show_encryption_ui():
         default_output_name = ""
         if input_file_path:
             base_name = os.path.basename(Path(input_file_path).name)
-            default_output_name = f"{base_name}_version{count_file(input_file_path,".enc.aes_rsa",ENCRYPT_FOLDER)}.enc.aes_rsa"
+            default_output_name = f"{base_name}_version{count_file(input_file_path,'.enc.aes_rsa',ENCRYPT_FOLDER)}.enc.aes_rsa"
         output_filename = st.text_input("Nome do arquivo de saída (será salvo em 'Documents/Data/Encrypt')", 
                                         value=default_output_name, 
                                         key="hybrid_output_enc")
+        workers = crypto_workers_input("hybrid_workers_enc", blowfish=False)
 
         if st.button("Criptografar Híbrido", key="btn_hybrid_enc"):
             if input_file_path and public_key_file_path and output_filename:
                 output_path = ENCRYPT_FOLDER / output_filename
                 try:
-                    CryptographyHandler.hybrid_encrypt_file(str(input_file_path), str(public_key_file_path), str(output_path))
+                    CryptographyHandler.hybrid_encrypt_file(str(input_file_path), str(public_key_file_path), str(output_path),
+                                                            workers=workers)
                     st.success(f"Arquivo criptografado hibridamente com sucesso em '{output_path}'!")
                     with open(output_path, "rb") as f:
                         st.download_button(
@@ -3533,13 +6947,14 @@ def show_encryption_ui():
         output_filename = st.text_input("Nome do arquivo de saída (ex: arquivo.dec.aes_rsa)", 
                                         value=default_output_name, 
                                         key="hybrid_output_dec")
+        workers = crypto_workers_input("hybrid_workers_dec", blowfish=False)
 
         if st.button("Descriptografar Híbrido", key="btn_hybrid_dec"):
             if input_file_path and private_key_file_path and output_filename:
                 with tempfile.TemporaryDirectory() as temp_dir_output: # Use a new temp dir for output
                     output_path = os.path.join(temp_dir_output, output_filename)
                     try:
-                        CryptographyHandler.hybrid_decrypt_file(str(input_file_path), str(private_key_file_path), output_path)
+                        CryptographyHandler.hybrid_decrypt_file(str(input_file_path), str(private_key_file_path), output_path, workers)
                         st.success(f"Arquivo descriptografado hibridamente com sucesso em '{output_filename}'!")
                         with open(output_path, "rb") as f:
                             st.download_button(
@@ -3603,15 +7018,11 @@ def show_admin_ui(db: TrafficAccidentsDB):
 
     st.markdown("---")
     st.subheader("Backup Manual do Banco de Dados")
+    st.info(f"As alterações são protegidas pelo journal (`.wal`); o snapshot completo é feito aqui ou automaticamente a cada {SNAPSHOT_INTERVAL_HOURS} horas (mantidos os últimos {MAX_BACKUPS}).")
     if st.button("Realizar Backup Agora", key="backup_db_button"):
         try:
-            os.makedirs(BACKUP_DIR, exist_ok=True)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_file = os.path.join(BACKUP_DIR, f"traffic_accidents_backup_{timestamp}.db")
-            
-            if os.path.exists(DB_FILE):
-                # Usar shutil.copy2 para copiar metadados também
-                shutil.copy2(DB_FILE, backup_file)
+            backup_file = db.create_snapshot()
+            if backup_file:
                 st.success(f"Backup realizado com sucesso para: `{backup_file}`")
                 logger.info(f"Backup manual do DB para {backup_file}")
             else:
@@ -3621,41 +7032,85 @@ def show_admin_ui(db: TrafficAccidentsDB):
             st.error(f"Erro ao realizar backup: {e}")
             logger.error(f"Erro ao realizar backup: {e}\n{traceback.format_exc()}")
 
+    st.markdown("---")
+    st.subheader("Journal de Escrita (WAL)")
+    st.write(f"Tamanho atual do journal: {db.wal.size()} bytes (checkpoint automático acima de {WAL_CHECKPOINT_SIZE} bytes).")
+    if st.button("Executar Checkpoint", key="wal_checkpoint_button"):
+        try:
+            db.checkpoint()
+            st.success("Checkpoint concluído: journal truncado.")
+        except (DatabaseError, FileLockError) as e:
+            st.error(f"Erro ao executar checkpoint: {e}")
+            logger.error(f"Erro ao executar checkpoint: {e}\n{traceback.format_exc()}")
+
+    st.markdown("---")
+    st.subheader("Reconstruir Índice por ID")
+    st.info("Recria o arquivo de índice (`.idx`), a tabela de páginas (`.pgx`) e os índices secundários em árvore B+ (`.btr`) a partir do arquivo de dados. Use em caso de índice corrompido ou após substituir o banco manualmente.")
+    if st.button("Reconstruir Índice", key="rebuild_index_button"):
+        try:
+            with st.spinner("Reconstruindo índice..."):
+                indexed_count = db.rebuild_index()
+            st.success(f"Índice reconstruído com sucesso: {indexed_count} registro(s) indexado(s).")
+        except (DatabaseError, FileLockError) as e:
+            st.error(f"Erro ao reconstruir índice: {e}")
+            logger.error(f"Erro ao reconstruir índice: {e}\n{traceback.format_exc()}")
+
+    st.markdown("---")
+    st.subheader("Formato de Armazenamento dos Registros")
+    codec_labels = {CODEC_JSON: "JSON (original)", CODEC_BINARY: "Binário compacto"}
+    current_codec = db.record_codec
+    st.write(f"Formato atual para novos registros: **{codec_labels[current_codec]}**")
+    target_codec = st.selectbox("Migrar todos os registros para", RECORD_CODECS, index=RECORD_CODECS.index(current_codec),
+                                format_func=lambda codec: codec_labels[codec], key="record_codec_select")
+    if st.button("Migrar Registros", key="migrate_codec_button"):
+        progress_bar = st.progress(0)
+        def update_migration_progress(current: int, total: int):
+            progress_bar.progress(min(current / max(total, 1), 1.0))
+        try:
+            with st.spinner("Migrando registros..."):
+                migrated_count = db.migrate_codec(target_codec, update_migration_progress)
+            st.success(f"{migrated_count} registro(s) migrado(s) para o formato {codec_labels[target_codec]}.")
+        except (DatabaseError, FileLockError) as e:
+            st.error(f"Erro ao migrar registros: {e}")
+            logger.error(f"Erro ao migrar registros: {e}\n{traceback.format_exc()}")
+
+    st.markdown("---")
+    st.subheader("Snapshot Colunar para Análise")
+    st.info("Gera um snapshot em colunas (`.npy` por campo, textos codificados por dicionário e bitmap de validade) que é mapeado em memória pelo pandas sem reprocessar o arquivo de dados.")
+    if st.button("Gerar/Carregar Snapshot Colunar", key="columnar_snapshot_button"):
+        try:
+            start_time = time.time()
+            with st.spinner("Carregando snapshot colunar..."):
+                columnar_df = db.load_columnar(only_valid=True)
+            st.success(f"{len(columnar_df)} registro(s) válido(s) carregado(s) em {time.time() - start_time:.3f} s (`{db.columns_dir}`).")
+            if not columnar_df.empty:
+                st.bar_chart(columnar_df['crash_type'].value_counts())
+                st.dataframe(columnar_df[['injuries_total', 'injuries_fatal', 'num_units']].describe())
+        except (DatabaseError, FileLockError) as e:
+            st.error(f"Erro ao gerar snapshot colunar: {e}")
+            logger.error(f"Erro ao gerar snapshot colunar: {e}\n{traceback.format_exc()}")
+
     st.markdown("---")
     st.subheader("Exportar Dados para CSV")
     if st.button("Exportar para CSV", key="export_csv_button"):
         try:
-            # Ler todos os registros (válidos e inválidos para exportação)
-            # Para grandes bases de dados, considere exportar em chunks.
-            all_records_raw = db.read_all_records_raw() # Esta função retorna registros com 'data':DataObject
-            
-            if not all_records_raw:
-                st.info("Nenhum registro para exportar para CSV.")
-                return
-
             # Garantir que todos os FIELDS estejam presentes como cabeçalho CSV
             csv_headers = ['id', 'validation'] + FIELDS
 
-            # Criar um arquivo CSV temporário em memória para download
+            # Os registros (válidos e inválidos) são lidos em fluxo e escritos direto no CSV em memória
             csv_output = io.StringIO()
             writer = csv.DictWriter(csv_output, fieldnames=csv_headers, delimiter=CSV_DELIMITER)
             writer.writeheader()
 
-            for record in all_records_raw:
-                # Converter DataObject para dicionário antes de escrever no CSV
-                row_data = record['data'].to_dict()
-                row_data['id'] = record['id']
-                row_data['validation'] = record['validation']
-                
-                # Certifique-se de que todos os campos existem na row_data para evitar KeyError no writer
-                # e converter valores de data/datetime para string
-                for key in csv_headers:
-                    if key not in row_data:
-                        row_data[key] = '' # Adiciona campos ausentes com valor vazio
-                    elif isinstance(row_data[key], (date, datetime)):
-                        row_data[key] = row_data[key].isoformat() # Converte data para string ISO 8601
+            exported_count = 0
+            with closing(db.iter_records(columns=FIELDS)) as records:
+                for record in records:
+                    writer.writerow({'id': record['id'], 'validation': record['validation'], **record['data']})
+                    exported_count += 1
 
-                writer.writerow(row_data)
+            if not exported_count:
+                st.info("Nenhum registro para exportar para CSV.")
+                return
 
             csv_string = csv_output.getvalue()
             st.download_button(
@@ -3673,24 +7128,29 @@ def show_admin_ui(db: TrafficAccidentsDB):
 
     st.markdown("---")
     st.subheader("Importar Banco de Dados (.db)")
-    uploaded_file = st.file_uploader("Selecione um arquivo .db para importar", type="db", key="import_db_uploader")
-    if uploaded_file is not None:
-        if st.button("Confirmar Importação de DB", key="confirm_import_db_button"):
+    st.caption("Envie o `.db` junto com o arquivo de símbolos (`.sym`) e o de configurações (`.meta`) do banco de origem. "
+               "Registros no formato binário são verificados contra o `.sym` enviado, e a importação é recusada se ele não corresponder.")
+    uploaded_files = st.file_uploader("Selecione o arquivo .db (e os arquivos .sym/.meta) para importar", type=["db", "sym", "meta"],
+                                      accept_multiple_files=True, key="import_db_uploader")
+    if uploaded_files:
+        uploads = {os.path.splitext(uploaded.name)[1].lower(): uploaded for uploaded in uploaded_files}
+        if ".db" not in uploads or len(uploads) != len(uploaded_files):
+            st.warning("Selecione exatamente um arquivo .db e no máximo um arquivo .sym e um .meta.")
+        elif st.button("Confirmar Importação de DB", key="confirm_import_db_button"):
             try:
-                # Crie um backup automático antes da importação
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                auto_backup_file = os.path.join(BACKUP_DIR, f"traffic_accidents_auto_backup_pre_import_{timestamp}.db")
-                if os.path.exists(DB_FILE):
-                    shutil.copy2(DB_FILE, auto_backup_file)
-                    st.info(f"Backup automático criado em: `{auto_backup_file}`")
+                backup_file = db.import_database(
+                    uploads[".db"].getvalue(),
+                    uploads[".sym"].getvalue() if ".sym" in uploads else None,
+                    uploads[".meta"].getvalue() if ".meta" in uploads else None)
+                if backup_file:
+                    st.info(f"Backup automático (`.db`, `.sym` e `.meta`) criado em: `{backup_file}`")
 
-                # Escrever o arquivo carregado no local do DB principal
-                with open(DB_FILE, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                
                 st.success("Banco de dados importado com sucesso! Reinicie o aplicativo para ver as mudanças.")
-                logger.info(f"Banco de dados importado de {uploaded_file.name}.")
+                logger.info(f"Banco de dados importado de {', '.join(uploaded.name for uploaded in uploaded_files)}.")
                 st.experimental_rerun() # Reinicia o app para carregar o novo DB
+            except DatabaseError as e:
+                st.error(f"Importação recusada: {e}")
+                logger.error(f"Importação de DB recusada: {e}")
             except Exception as e:
                 st.error(f"Erro ao importar banco de dados: {e}")
                 logger.error(f"Erro ao importar DB: {e}\n{traceback.format_exc()}")
@@ -3702,6 +7162,7 @@ def show_admin_ui(db: TrafficAccidentsDB):
         if st.checkbox("Confirmo que desejo excluir o banco de dados principal e entendo que é irreversível.", key="confirm_delete_db_checkbox"):
             try:
                 if os.path.exists(DB_FILE):
+                    db.checkpoint() # O journal descreve o arquivo excluído
                     os.remove(DB_FILE)
                     st.success("Banco de dados principal excluído com sucesso!")
                     logger.info("Banco de dados principal excluído.")